@@ -1,27 +1,97 @@
-# pylint: disable=no-member
+# pylint: disable=no-member, wrong-import-position
 # -*- coding: utf-8 -*-
 
+import datetime
+import sys
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin.filters import RelatedFieldListFilter
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from .models import Task, Execution
+if sys.version_info[0] > 2:
+    from django.urls import re_path as url # pylint: disable=no-name-in-module
+else:
+    from django.conf.urls import url
+
+from . import clock, rollups, scheduler, search, views
+from .models import Task, Execution, AlertState, QueueState, ConcurrencyGroup, ConcurrencySlot, \
+    ExecutionRollup
+from .schedules import ScheduleError
 
 class DropdownFilter(RelatedFieldListFilter):
     template = 'admin/quicksilver_dropdown_filter.html'
 
+class TaskQueueFilter(admin.SimpleListFilter):
+    title = _("task queue")
+
+    parameter_name = "task_queue"
+
+    template = 'admin/quicksilver_dropdown_filter.html'
+
+    def lookups(self, request, model_admin):
+        # Read from the task table - distinct values of the execution table
+        # would need a full scan.
+
+        queues = Task.objects.order_by('queue').values_list('queue', flat=True).distinct()
+
+        return [(queue, queue,) for queue in queues]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+
+        return queryset.filter(task__queue=self.value())
+
+class TaskFilter(DropdownFilter):
+    '''
+    Lists at most QUICKSILVER_ADMIN_TASK_FILTER_LIMIT tasks - those of the
+    selected task queue when one is selected.
+    '''
+
+    def field_choices(self, field, request, model_admin):
+        limit = getattr(settings, 'QUICKSILVER_ADMIN_TASK_FILTER_LIMIT', 100)
+
+        tasks = Task.objects.order_by('command', 'pk').only('pk', 'command', 'arguments', 'queue')
+
+        if request.GET.get(TaskQueueFilter.parameter_name):
+            tasks = tasks.filter(queue=request.GET.get(TaskQueueFilter.parameter_name))
+
+        choices = [(task.pk, str(task),) for task in tasks[:limit]]
+
+        selected = request.GET.get(self.lookup_kwarg, '')
+
+        if selected.isdigit() and selected not in [str(choice[0]) for choice in choices]:
+            for task in Task.objects.filter(pk=selected):
+                choices.append((task.pk, str(task),))
+
+        return choices
+
 class RuntimeFilter(admin.SimpleListFilter):
     title = _("total runtime")
 
     parameter_name = "runtime"
 
-    def lookups(self, request, model_admin):
-        for empty_item in Execution.objects.filter(ended=None):
-            empty_item.runtime()
+    # (minimum, maximum) runtime in seconds
 
-        for empty_item in Execution.objects.filter(total_runtime=None):
-            empty_item.runtime()
+    ranges = {
+        '0_1': (None, 60),
+        '1_5': (60, 300),
+        '5_15': (300, 900),
+        '15_30': (900, 1800),
+        '30_60': (1800, 3600),
+        '60_': (3600, None),
+    }
 
+    def lookups(self, request, model_admin):
         return [
             ('0_1', _('less than a minute')),
             ('1_5', _('one to five minutes')),
@@ -31,35 +101,398 @@ class RuntimeFilter(admin.SimpleListFilter):
             ('60_', _('more than a full hour')),
         ]
 
-    def queryset(self, request, queryset): # pylint: disable=too-many-return-statements
-        if self.value() == '0_1':
-            return queryset.filter(total_runtime__lt=60)
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+
+        minimum, maximum = self.ranges[self.value()]
+
+        # Open executions are matched by their start time, so nothing needs to
+        # be written to the database to filter them.
+
+        now = timezone.now()
+
+        finished = Q(ended__isnull=False)
+        ongoing = Q(ended=None)
+
+        if minimum is not None:
+            finished &= Q(total_runtime__gte=minimum)
+            ongoing &= Q(started__lte=now - datetime.timedelta(seconds=minimum))
+
+        if maximum is not None:
+            finished &= Q(total_runtime__lt=maximum)
+            ongoing &= Q(started__gt=now - datetime.timedelta(seconds=maximum))
+
+        return queryset.filter(finished | ongoing)
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Uses the database's row estimate for unfiltered lists of large tables
+    instead of an exact (full scan) COUNT(*).
+    '''
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model)
 
-        if self.value() == '1_5':
-            return queryset.filter(total_runtime__gte=60, total_runtime__lt=300)
+            minimum = getattr(settings, 'QUICKSILVER_ADMIN_ESTIMATED_COUNT_MINIMUM', 100000)
 
-        if self.value() == '5_15':
-            return queryset.filter(total_runtime__gte=300, total_runtime__lt=900)
+            if estimate is not None and estimate >= minimum:
+                return estimate
 
-        if self.value() == '15_30':
-            return queryset.filter(total_runtime__gte=900, total_runtime__lt=1800)
+        return super(EstimatedCountPaginator, self).count # pylint: disable=super-with-arguments
 
-        if self.value() == '30_60':
-            return queryset.filter(total_runtime__gte=1800, total_runtime__lt=3600)
+def estimated_row_count(model):
+    table = model._meta.db_table # pylint: disable=protected-access
 
-        if self.value() == '60_':
-            return queryset.filter(total_runtime__gte=3600)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        elif connection.vendor == 'sqlite':
+            # No statistics - the largest primary key is close enough and cheap to read.
+
+            pk_column = model._meta.pk.column # pylint: disable=protected-access
+
+            cursor.execute('SELECT MAX(%s) FROM %s' % (connection.ops.quote_name(pk_column),
+                                                       connection.ops.quote_name(table)))
+        else:
+            return None
+
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+
+    return int(row[0])
+
+class CircuitBreakerFilter(admin.SimpleListFilter):
+    title = _("circuit breaker")
+
+    parameter_name = "circuit_breaker"
+
+    def lookups(self, request, model_admin):
+        return [
+            ('open', _('open (parked)')),
+            ('backing_off', _('backing off')),
+            ('closed', _('closed')),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.exclude(circuit_opened=None)
+
+        if self.value() == 'backing_off':
+            return queryset.filter(circuit_opened=None, consecutive_failures__gt=0)
+
+        if self.value() == 'closed':
+            return queryset.filter(circuit_opened=None, consecutive_failures=0)
 
         return queryset
 
+def reset_circuit_breakers(modeladmin, request, queryset): # pylint: disable=unused-argument
+    for task in queryset:
+        task.reset_circuit_breaker()
+
+reset_circuit_breakers.short_description = _('Reset circuit breakers')
+
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
-    list_display = ('command', 'queue', 'repeat_interval', 'next_run',)
-    list_filter = ('next_run', 'queue',)
-    search_fields = ('command', 'arguments', 'queue',)
+    list_display = ('command', 'queue', 'priority', 'repeat_interval', 'cron_schedule', 'next_run',
+                    'phase', 'jitter', 'concurrency_group', 'circuit_breaker',)
+    list_filter = ('next_run', 'queue', 'priority', 'misfire_policy', 'recording_mode',
+                   'concurrency_group', CircuitBreakerFilter,)
+    actions = [reset_circuit_breakers]
+    change_list_template = 'admin/quicksilver_task_change_list.html'
+    search_fields = ('command', 'arguments', 'queue', 'cron_schedule',)
+    readonly_fields = ('upcoming_runs',)
+
+    def upcoming_runs(self, obj): # pylint: disable=no-self-use
+        try:
+            schedule = obj.schedule() if obj.pk is not None else None
+        except ScheduleError as exc:
+            return str(exc)
+
+        if schedule is None:
+            return '-'
+
+        return ', '.join([fire_time.isoformat() for fire_time in schedule.upcoming(clock.now())])
+
+    upcoming_runs.short_description = _('upcoming runs')
+
+    def circuit_breaker(self, obj): # pylint: disable=no-self-use
+        if obj.consecutive_failures > 0:
+            return '%s (%d failures)' % (obj.circuit_breaker_state(), obj.consecutive_failures)
+
+        return obj.circuit_breaker_state()
+
+    circuit_breaker.short_description = _('circuit breaker')
+
+    def save_model(self, request, obj, form, change):
+        schedule_fields = ('cron_schedule', 'schedule_timezone',)
+
+        if change and [field for field in schedule_fields if field in form.changed_data]:
+            obj.next_run = None
+
+            if obj.schedule() is None:
+                obj.next_run = clock.now()
+
+        super(TaskAdmin, self).save_model(request, obj, form, change) # pylint: disable=super-with-arguments
+
+    def get_urls(self):
+        urls = super(TaskAdmin, self).get_urls() # pylint: disable=super-with-arguments
+
+        custom_urls = [
+            url(r'^dispatch-order/$', self.admin_site.admin_view(self.dispatch_order_view),
+                name='quicksilver_task_dispatch_order'),
+            url(r'^statistics/$', self.admin_site.admin_view(self.statistics_view),
+                name='quicksilver_task_statistics'),
+        ]
+
+        return custom_urls + urls
+
+    def dispatch_order_view(self, request):
+        now = clock.now()
+
+        queues = []
+
+        for queue in Task.objects.order_by('queue').values_list('queue', flat=True).distinct():
+            ready = scheduler.order_for_dispatch(scheduler.ready_tasks(queue, now), now)
+
+            scheduled = {}
+
+            for task in ready:
+                scheduled[task.pk] = task.next_run
+
+            run, shed = scheduler.shed_overload(ready, now, save=False)
+
+            entries = []
+
+            for task in run + shed:
+                entries.append({
+                    'task': task,
+                    'scheduled': scheduled[task.pk],
+                    'score': scheduler.dispatch_score(task, now) if task in run else None,
+                    'shed': task in shed,
+                })
+
+            queues.append({
+                'queue': queue,
+                'entries': entries,
+            })
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Dispatch order'),
+            opts=self.model._meta, # pylint: disable=protected-access
+            now=now,
+            queues=queues,
+        )
+
+        return render(request, 'admin/quicksilver_dispatch_order.html', context)
+
+    statistics_columns = (
+        ('command', _('Task')),
+        ('queue', _('Queue')),
+        ('runs', _('Runs')),
+        ('failure_rate', _('Failure rate')),
+        ('runtime_mean', _('Mean runtime')),
+        ('runtime_p50', _('Median runtime')),
+        ('runtime_p95', _('95th percentile')),
+        ('runtime_max', _('Longest runtime')),
+        ('last_success', _('Last success')),
+        ('last_run', _('Last run')),
+    )
+
+    def statistics_view(self, request):
+        summaries = rollups.task_summaries()
+
+        rows = []
+
+        for task in Task.objects.order_by('pk').only('pk', 'command', 'queue'):
+            row = {
+                'task': task,
+                'command': task.command,
+                'queue': task.queue,
+            }
+
+            row.update(summaries.get(task.pk, {}))
+
+            rows.append(row)
+
+        order = request.GET.get('o', '-failure_rate')
+
+        descending = order.startswith('-')
+        key = order.lstrip('-')
+
+        if key not in [column[0] for column in self.statistics_columns]:
+            key = 'failure_rate'
+
+        # Tasks without recent runs sort last in either direction.
+
+        present = [row for row in rows if row.get(key, None) is not None]
+        missing = [row for row in rows if row.get(key, None) is None]
+
+        present.sort(key=lambda row: row[key], reverse=descending)
+
+        columns = []
+
+        for name, label in self.statistics_columns:
+            columns.append({
+                'label': label,
+                'order': ('%s' if (name == key and descending) else '-%s') % name,
+                'sorted': name == key,
+                'descending': descending,
+            })
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Task statistics'),
+            opts=self.model._meta, # pylint: disable=protected-access
+            hours=getattr(settings, 'QUICKSILVER_TASK_SUMMARY_HOURS', 24),
+            columns=columns,
+            rows=present + missing,
+        )
+
+        return render(request, 'admin/quicksilver_task_statistics.html', context)
 
 @admin.register(Execution)
 class ExecutionAdmin(admin.ModelAdmin):
-    list_display = ('task', 'total_runtime', 'started', 'ended', 'status',)
-    list_filter = ('status', 'started', 'ended', ('task', DropdownFilter), RuntimeFilter)
+    list_display = ('task', 'total_runtime', 'started', 'ended', 'status', 'dispatch_lag',)
+    list_filter = ('status', 'started', 'ended', TaskQueueFilter, ('task', TaskFilter),
+                   RuntimeFilter,)
     search_fields = ('task__command', 'output',)
+    list_select_related = ('task',)
+    ordering = ('-started', '-pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    exclude = ('output',)
+    readonly_fields = ('execution_output', 'output_encoding',)
+
+    def execution_output(self, obj): # pylint: disable=no-self-use
+        if obj.ended is None:
+            tail_url = reverse('admin:quicksilver_execution_tail', args=[obj.pk])
+
+            return format_html('<a href="{}">{}</a>', tail_url, _('Follow live output'))
+
+        return format_html('<pre>{}</pre>', obj.get_output() or '')
+
+    execution_output.short_description = _('output')
+
+    def get_urls(self):
+        urls = super(ExecutionAdmin, self).get_urls() # pylint: disable=super-with-arguments
+
+        custom_urls = [
+            url(r'^(?P<execution_id>\d+)/tail/$', self.admin_site.admin_view(self.tail_view),
+                name='quicksilver_execution_tail'),
+            url(r'^(?P<execution_id>\d+)/tail/output/$',
+                self.admin_site.admin_view(self.tail_output_view),
+                name='quicksilver_execution_tail_output'),
+        ]
+
+        return custom_urls + urls
+
+    def tail_view(self, request, execution_id):
+        execution = get_object_or_404(Execution.objects.defer('output', 'output_compressed'),
+                                      pk=execution_id)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Output of %s') % execution,
+            opts=self.model._meta, # pylint: disable=protected-access
+            execution=execution,
+            poll_seconds=getattr(settings, 'QUICKSILVER_OUTPUT_TAIL_POLL_SECONDS', 2),
+        )
+
+        return render(request, 'admin/quicksilver_execution_tail.html', context)
+
+    def tail_output_view(self, request, execution_id): # pylint: disable=no-self-use
+        return views.quicksilver_execution_output(request, execution_id)
+
+    def get_search_results(self, request, queryset, search_term):
+        matches = search.matching_executions(search_term)
+
+        if matches is None:
+            parent = super(ExecutionAdmin, self) # pylint: disable=super-with-arguments
+
+            return parent.get_search_results(request, queryset, search_term)
+
+        # Output matches come from the search index instead of scanning the output column.
+
+        return queryset.filter(Q(task__command__icontains=search_term) | Q(pk__in=matches)), False
+
+    def get_queryset(self, request):
+        queryset = super(ExecutionAdmin, self).get_queryset(request) # pylint: disable=super-with-arguments
+
+        # Output is only shown on the change form.
+
+        match = request.resolver_match
+
+        if match is None or match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('output', 'output_compressed')
+
+        return queryset
+
+@admin.register(AlertState)
+class AlertStateAdmin(admin.ModelAdmin):
+    list_display = ('task', 'evaluated', 'overdue', 'outlier', 'max_runtime_exceeded',
+                    'should_alert', 'issue',)
+    list_filter = ('overdue', 'outlier', 'max_runtime_exceeded', 'should_alert', 'evaluated',)
+    search_fields = ('task__command', 'task__queue', 'issue',)
+    list_select_related = ('task',)
+
+@admin.register(QueueState)
+class QueueStateAdmin(admin.ModelAdmin):
+    list_display = ('queue', 'lag_p50', 'lag_p90', 'lag_p99', 'lag_max', 'lag_count',
+                    'cycle_duration', 'queue_depth', 'updated', 'evaluated',)
+    search_fields = ('queue',)
+    readonly_fields = ('queue', 'updated', 'cycle_duration', 'queue_depth', 'evaluated',
+                       'lag_count', 'lag_p50', 'lag_p90', 'lag_p99', 'lag_max',)
+
+class ConcurrencySlotInline(admin.TabularInline):
+    model = ConcurrencySlot
+    fields = ('slot', 'task', 'acquired', 'expires',)
+    readonly_fields = ('slot', 'task', 'acquired', 'expires',)
+    extra = 0
+    can_delete = False
+
+@admin.register(ConcurrencyGroup)
+class ConcurrencyGroupAdmin(admin.ModelAdmin):
+    list_display = ('name', 'max_concurrent', 'running',)
+    search_fields = ('name',)
+    inlines = [ConcurrencySlotInline]
+
+    def running(self, obj): # pylint: disable=no-self-use
+        slots = obj.slots.filter(slot__lt=obj.max_concurrent).exclude(holder=None)
+
+        return slots.filter(expires__gte=clock.now()).count()
+
+    running.short_description = _('running')
+
+@admin.register(ExecutionRollup)
+class ExecutionRollupAdmin(admin.ModelAdmin):
+    list_display = ('task', 'period_start', 'period', 'count', 'success_count', 'error_count',
+                    'killed_count', 'runtime_mean', 'runtime_median', 'runtime_p95',
+                    'runtime_max',)
+    list_filter = ('period', 'period_start',)
+    search_fields = ('task__command', 'task__queue',)
+    list_select_related = ('task',)
+    date_hierarchy = 'period_start'
+    readonly_fields = ('task', 'period', 'period_start', 'count', 'success_count', 'error_count',
+                       'killed_count', 'runtime_sum', 'runtime_sum_squares', 'runtime_min',
+                       'runtime_max', 'runtime_histogram', 'last_ended',)
+
+    def runtime_median(self, obj): # pylint: disable=no-self-use
+        return obj.runtime_quantile(0.5)
+
+    runtime_median.short_description = _('runtime (median)')
+
+    def runtime_p95(self, obj): # pylint: disable=no-self-use
+        return obj.runtime_quantile(0.95)
+
+    runtime_p95.short_description = _('runtime (95th percentile)')
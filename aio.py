@@ -0,0 +1,269 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import logging
+import sys
+import threading
+import traceback
+
+from django.core.management import get_commands, load_command_class
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from . import concurrency, results, scheduler, workers
+from .decorators import configure_logging, report_schedule, schedule_options
+from .models import ExecutionTimeoutError
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Support for commands with async handle methods (Python 3 only - imported only
+# when such a command is run). run_task_queue --async-tasks hosts them on one
+# event loop, each in its own asyncio task with its own output capture, result
+# and timeout. The ORM may not be called from the event loop, so bookkeeping -
+# claiming slots, recording executions and streamed output - runs in order on a
+# single database thread. Output and results follow each asyncio task through
+# contextvars, so the event loop runner needs Python 3.7 - earlier versions
+# fall back to per-thread state, which the tasks on the loop would share.
+
+ASYNC_TASKS_UNSUPPORTED = 'Running async commands on an event loop (--async-tasks) requires Python 3.7 or later.'
+
+ASYNC_COMMANDS = {}
+
+def load_command(name):
+    app_name = get_commands()[name]
+
+    if isinstance(app_name, BaseCommand):
+        return app_name
+
+    return load_command_class(app_name, name)
+
+def is_async_command(name):
+    if name not in ASYNC_COMMANDS:
+        try:
+            ASYNC_COMMANDS[name] = inspect.iscoroutinefunction(load_command(name).handle)
+        except KeyError: # Unknown - left for call_command to report.
+            ASYNC_COMMANDS[name] = False
+
+    return ASYNC_COMMANDS[name]
+
+async def call_command(name, *args, **options):
+    '''
+    Awaits the handle method of an async command, parsing arguments as
+    django.core.management.call_command does.
+    '''
+
+    command = load_command(name)
+
+    parser = command.create_parser('', name)
+
+    dests = dict((min(action.option_strings).lstrip('-').replace('-', '_'), action.dest) for action in parser._actions if action.option_strings) # pylint: disable=protected-access
+
+    arg_options = dict((dests.get(key, key), value) for key, value in options.items())
+
+    valid_options = set(action.dest for action in parser._actions) | set(command.stealth_options) # pylint: disable=protected-access
+
+    unknown_options = set(arg_options) - valid_options
+
+    if unknown_options:
+        raise TypeError('Unknown option(s) for %s command: %s.' % (name, ', '.join(sorted(unknown_options))))
+
+    defaults = vars(parser.parse_args(args=[str(arg) for arg in args]))
+    defaults.update(arg_options)
+
+    args = defaults.pop('args', ())
+
+    return await command.handle(*args, **defaults)
+
+def call_command_sync(name, *args, **options):
+    # Not asyncio.run, which needs Python 3.7.
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(call_command(name, *args, **options))
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+def async_handle_logging(handle):
+    async def wrapper(self, *args, **options):
+        configure_logging(options)
+
+        await handle(self, *args, **options)
+
+    return wrapper
+
+def async_handle_schedule(handle):
+    async def wrapper(self, *args, **options):
+        invoked_by_qs, next_interval = schedule_options(options)
+
+        exception = None
+
+        try:
+            await handle(self, *args, **options)
+        except Exception as exc: # pylint: disable=broad-exception-caught, broad-except
+            exception = exc
+
+        report_schedule(invoked_by_qs, next_interval)
+
+        if exception is not None:
+            raise exception
+
+    return wrapper
+
+class AsyncTaskRunner(object): # pylint: disable=useless-object-inheritance, too-many-instance-attributes
+    '''
+    Runs tasks with async commands on an event loop in its own thread, at most
+    limit at once. Offers the same methods as workers.TaskThreadPool.
+    '''
+
+    def __init__(self, limit, name='quicksilver-async'):
+        if sys.version_info < (3, 7):
+            raise RuntimeError(ASYNC_TASKS_UNSUPPORTED)
+
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.outcomes = []
+        self.futures = []
+
+        self.database = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='%s-database' % name)
+
+        self.loop = asyncio.new_event_loop()
+
+        self.thread = threading.Thread(target=self.run_loop, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+
+        self.loop.run_forever()
+
+    def available(self):
+        with self.lock:
+            return self.limit - len(self.in_flight)
+
+    def submit(self, task, queue_depth=None, cycle_duration=None):
+        with self.lock:
+            if task.pk in self.in_flight:
+                return False
+
+            self.in_flight.add(task.pk)
+
+            self.futures = [future for future in self.futures if future.done() is False]
+
+            self.futures.append(asyncio.run_coroutine_threadsafe(self.dispatch(task, queue_depth, cycle_duration), self.loop))
+
+        return True
+
+    def take_outcomes(self):
+        '''
+        Returns (task, outcome) for the tasks dispatched since the last call.
+        '''
+
+        with self.lock:
+            outcomes = self.outcomes
+
+            self.outcomes = []
+
+        return outcomes
+
+    def in_database(self, function, *args):
+        return self.loop.run_in_executor(self.database, functools.partial(function, *args))
+
+    def defer(self, function, *args):
+        # Runs on the database thread without waiting, before any later calls.
+
+        self.database.submit(function, *args)
+
+    async def dispatch(self, task, queue_depth, cycle_duration):
+        outcome = None
+
+        try:
+            outcome, token = await self.in_database(scheduler.claim, task)
+
+            if outcome is None:
+                try:
+                    execution = await self.in_database(task.start_execution, queue_depth, cycle_duration)
+
+                    await self.run_execution(execution)
+                finally:
+                    await self.in_database(concurrency.release, token)
+
+                outcome = 'ran'
+        except Exception: # pylint: disable=broad-exception-caught, broad-except
+            logger.exception('Unable to dispatch %s.', task)
+        finally:
+            with self.lock:
+                self.in_flight.discard(task.pk)
+                self.outcomes.append((task, outcome,))
+
+    async def run_execution(self, execution):
+        '''
+        Async counterpart of Execution.run. Output and results are routed
+        through this asyncio task's own context.
+        '''
+
+        qs_out = None
+        orig_stdout = None
+        failure = None
+
+        try:
+            qs_out = await self.in_database(execution.begin)
+
+            if qs_out.on_chunk is not None:
+                qs_out.on_chunk = functools.partial(self.defer, execution.write_output_chunk)
+
+            orig_stdout = workers.redirect_stdout(qs_out)
+
+            qs_out.start_streaming()
+
+            results.begin(functools.partial(self.defer, execution.save_progress) if execution.pk is not None else None)
+
+            args, options = execution.command_arguments()
+
+            try:
+                await asyncio.wait_for(call_command(execution.task.command, *args, **options), execution.task.get_max_duration())
+            except asyncio.TimeoutError:
+                raise ExecutionTimeoutError('Timeout') # pylint: disable=raise-missing-from
+        except Exception: # pylint: disable=broad-exception-caught, broad-except
+            failure = traceback.format_exc()
+        finally:
+            if orig_stdout is not None:
+                workers.restore_stdout(orig_stdout)
+
+            if qs_out is not None:
+                await self.in_database(qs_out.stop_streaming)
+
+        try:
+            if failure is None:
+                await self.in_database(execution.finish, qs_out.getvalue().decode('utf-8').strip(), results.end())
+        except Exception: # pylint: disable=broad-exception-caught, broad-except
+            failure = traceback.format_exc()
+
+        if failure is not None:
+            await self.in_database(execution.fail, failure, results.end())
+
+    def shutdown(self):
+        '''
+        Waits for running tasks to finish and stops the event loop.
+        '''
+
+        with self.lock:
+            futures = list(self.futures)
+
+        concurrent.futures.wait(futures)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+        self.thread.join()
+
+        self.loop.close()
+
+        self.database.submit(connections.close_all).result()
+        self.database.shutdown()
@@ -0,0 +1,185 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import sys
+import unittest
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import aio, results, workers
+from .decorators import add_qs_arguments, handle_lock, handle_logging, handle_schedule, report_items_processed
+from .models import Execution, Task
+
+# Tests of async command support - Python 3 only, so imported by tests.py
+# only when it can run them.
+
+class AsyncTestCommand(BaseCommand):
+    @add_qs_arguments
+    def add_arguments(self, parser):
+        parser.add_argument('word')
+        parser.add_argument('--wait-seconds', dest='wait', type=float, default=0)
+        parser.add_argument('--fail', action='store_true', default=False)
+
+    @handle_schedule
+    async def handle(self, *args, **options): # pylint: disable=invalid-overridden-method
+        print('%s started' % options['word'])
+
+        await asyncio.sleep(options['wait'])
+
+        print('%s finished' % options['word'])
+
+        report_items_processed(len(options['word']))
+
+        if options['fail']:
+            raise ValueError('%s failed' % options['word'])
+
+def run_coroutine(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+def async_commands():
+    return mock.patch.object(aio, 'get_commands', return_value={'async_test_task': AsyncTestCommand()})
+
+class AsyncCommandTests(TestCase):
+    def setUp(self):
+        aio.ASYNC_COMMANDS.clear()
+
+        patcher = async_commands()
+        patcher.start()
+
+        self.addCleanup(patcher.stop)
+        self.addCleanup(aio.ASYNC_COMMANDS.clear)
+
+    def test_option_mapping(self):
+        stdout = io.StringIO()
+
+        with mock.patch('sys.stdout', stdout):
+            aio.call_command_sync('async_test_task', 'first', wait_seconds=0.01)
+            aio.call_command_sync('async_test_task', 'second', '--wait-seconds', '0.01', wait=0)
+
+        self.assertEqual('first started\nfirst finished\nsecond started\nsecond finished\n', stdout.getvalue())
+
+        with self.assertRaises(TypeError):
+            aio.call_command_sync('async_test_task', 'third', sleep=1)
+
+    def test_is_async_command(self):
+        self.assertTrue(aio.is_async_command('async_test_task'))
+        self.assertFalse(aio.is_async_command('no_such_command'))
+
+    def test_schedule_reported(self):
+        result = results.begin()
+
+        with mock.patch('sys.stdout', io.StringIO()):
+            with self.assertRaises(ValueError):
+                aio.call_command_sync('async_test_task', 'failing', fail=True, qs_context=True, qs_next_interval=30)
+
+        self.assertIs(result, results.end())
+        self.assertIsNotNone(result.next_run)
+        self.assertEqual(7, result.items_processed)
+
+    def test_trailer_outside_run(self):
+        stdout = io.StringIO()
+
+        with mock.patch('sys.stdout', stdout):
+            aio.call_command_sync('async_test_task', 'plain', _qs_context=True, _qs_next_interval=30)
+
+        self.assertTrue(stdout.getvalue().splitlines()[-1].startswith('_qs_next_run: '))
+
+    def test_logging_configured(self):
+        handled = []
+
+        async def handle(self, *args, **options): # pylint: disable=unused-argument
+            handled.append(options)
+
+        with mock.patch.object(aio, 'configure_logging') as configure_logging:
+            run_coroutine(handle_logging(handle)(None, verbosity=2))
+
+        configure_logging.assert_called_once_with({'verbosity': 2})
+
+        self.assertEqual([{'verbosity': 2}], handled)
+
+    def test_python_36_refused(self):
+        with mock.patch.object(sys, 'version_info', (3, 6, 15, 'final', 0)):
+            with self.assertRaises(RuntimeError):
+                aio.AsyncTaskRunner(1)
+
+            with self.assertRaises(CommandError):
+                call_command('run_task_queue', '--async-tasks', '2', '--task-queue', 'async-test')
+
+    def test_lock_refused(self):
+        async def handle(self, *args, **options): # pylint: disable=unused-argument
+            pass
+
+        with self.assertRaises(TypeError):
+            handle_lock(handle)
+
+@unittest.skipIf(sys.version_info < (3, 7), 'Requires contextvars.')
+class AsyncTaskRunnerTests(TransactionTestCase):
+    def setUp(self):
+        aio.ASYNC_COMMANDS.clear()
+
+        patcher = async_commands()
+        patcher.start()
+
+        self.addCleanup(patcher.stop)
+        self.addCleanup(aio.ASYNC_COMMANDS.clear)
+
+        workers.install_stdout_router()
+
+        self.addCleanup(workers.uninstall_stdout_router)
+
+    def run_tasks(self, *tasks):
+        runner = aio.AsyncTaskRunner(len(tasks), name='quicksilver-test-async')
+
+        for task in tasks:
+            self.assertTrue(runner.submit(task))
+
+        self.assertEqual(0, runner.available())
+
+        runner.shutdown()
+
+        return dict((task.pk, outcome) for task, outcome in runner.take_outcomes())
+
+    def test_outputs_separate(self):
+        slow = Task.objects.create(command='async_test_task', arguments='slow\n--wait-seconds\n0.2', repeat_interval=60, next_run=timezone.now())
+        quick = Task.objects.create(command='async_test_task', arguments='quick\n--wait-seconds\n0.1', repeat_interval=60, next_run=timezone.now())
+
+        self.assertEqual({slow.pk: 'ran', quick.pk: 'ran'}, self.run_tasks(slow, quick))
+
+        for task in (slow, quick):
+            execution = Execution.objects.get(task=task)
+
+            self.assertEqual('success', execution.status)
+            self.assertEqual(len(task.arguments.split()[0]), execution.items_processed)
+            self.assertTrue(execution.get_output().startswith('%s started\n%s finished' % ((task.arguments.split()[0],) * 2)))
+
+    def test_failure_and_timeout(self):
+        failing = Task.objects.create(command='async_test_task', arguments='failing\n--fail', repeat_interval=60, next_run=timezone.now())
+        slow = Task.objects.create(command='async_test_task', arguments='slow\n--wait-seconds\n10', repeat_interval=60, max_duration=1, next_run=timezone.now())
+
+        self.assertEqual({failing.pk: 'ran', slow.pk: 'ran'}, self.run_tasks(failing, slow))
+
+        execution = Execution.objects.get(task=failing)
+
+        self.assertEqual('error', execution.status)
+        self.assertIn('ValueError: failing failed', execution.get_output())
+
+        execution = Execution.objects.get(task=slow)
+
+        self.assertEqual('error', execution.status)
+        self.assertIn('ExecutionTimeoutError', execution.get_output())
+
+        # Standard output is routed back once the runs end.
+
+        self.assertIs(sys.stdout.stream, sys.stdout.target())
@@ -0,0 +1,56 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+
+from django.utils import timezone
+
+# Time source used by the task runners and scheduling decorators. The system
+# clock is used by default - simulations swap in a VirtualClock so that days of
+# scheduling can be replayed without waiting in real time.
+
+class SystemClock(object): # pylint: disable=useless-object-inheritance
+    def now(self): # pylint: disable=no-self-use
+        return timezone.now()
+
+    def sleep(self, seconds): # pylint: disable=no-self-use
+        if seconds > 0:
+            time.sleep(seconds)
+
+class VirtualClock(object): # pylint: disable=useless-object-inheritance
+    def __init__(self, start=None):
+        if start is None:
+            start = timezone.now()
+
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.current = self.current + datetime.timedelta(seconds=seconds)
+
+ACTIVE_CLOCK = {
+    'clock': SystemClock(),
+}
+
+def get_clock():
+    return ACTIVE_CLOCK['clock']
+
+def set_clock(clock):
+    previous = ACTIVE_CLOCK['clock']
+
+    ACTIVE_CLOCK['clock'] = clock
+
+    return previous
+
+def now():
+    return ACTIVE_CLOCK['clock'].now()
+
+def sleep(seconds):
+    ACTIVE_CLOCK['clock'].sleep(seconds)
@@ -0,0 +1,100 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from . import clock, metrics
+from .models import ConcurrencySlot
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Concurrency groups are enforced across task runner processes with a table of
+# slots - one row per permitted concurrent run. A slot is claimed with a
+# conditional UPDATE on its current holder, so only one process can win it on
+# any database backend. Leases expire so that crashed runners release slots.
+
+def ensure_slots(group):
+    existing = set(ConcurrencySlot.objects.filter(group=group).values_list('slot', flat=True))
+
+    for slot in range(group.max_concurrent):
+        if slot not in existing:
+            try:
+                with transaction.atomic():
+                    ConcurrencySlot.objects.create(group=group, slot=slot)
+            except IntegrityError: # Created concurrently by another process.
+                pass
+
+def lease_seconds(task):
+    max_duration = task.get_max_duration()
+
+    if max_duration is not None:
+        return max_duration + 60
+
+    return getattr(settings, 'QUICKSILVER_CONCURRENCY_LEASE_SECONDS', 3600)
+
+def acquire(task, now=None):
+    '''
+    Claims a slot in the task's concurrency group. Returns a holder token to
+    pass to release, an empty string if the task is not in a group, or None if
+    the group is at capacity.
+    '''
+
+    group = task.concurrency_group
+
+    if group is None:
+        return ''
+
+    if now is None:
+        now = clock.now()
+
+    ensure_slots(group)
+
+    token = uuid.uuid4().hex
+
+    expires = now + datetime.timedelta(seconds=lease_seconds(task))
+
+    available = ConcurrencySlot.objects.filter(group=group, slot__lt=group.max_concurrent).filter(Q(holder=None) | Q(expires__lt=now)).order_by('slot')
+
+    for slot in available.values_list('pk', 'holder'):
+        if ConcurrencySlot.objects.filter(pk=slot[0], holder=slot[1]).update(holder=token, task=task, acquired=now, expires=expires) == 1:
+            if slot[1] is not None:
+                logger.warning('Reclaimed expired %s slot from a previous holder.', group)
+
+            return token
+
+    metrics.increment('quicksilver_concurrency_waits_total', {'group': group.name, 'queue': task.queue})
+
+    return None
+
+def release(token):
+    if token:
+        ConcurrencySlot.objects.filter(holder=token).update(holder=None, task=None, acquired=None, expires=None)
+
+def rate_limit_available(task, now=None):
+    '''
+    Returns None if the task may run now, or the time at which its rate limit
+    next permits a run.
+    '''
+
+    if not task.rate_limit_runs or not task.rate_limit_period:
+        return None
+
+    if now is None:
+        now = clock.now()
+
+    window_start = now - datetime.timedelta(seconds=task.rate_limit_period)
+
+    recent = list(task.executions.filter(started__gt=window_start).order_by('-started').values_list('started', flat=True)[:task.rate_limit_runs])
+
+    if len(recent) < task.rate_limit_runs:
+        return None
+
+    metrics.increment('quicksilver_rate_limited_total', {'queue': task.queue})
+
+    return recent[-1] + datetime.timedelta(seconds=task.rate_limit_period)
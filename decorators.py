@@ -1,5 +1,7 @@
 # pylint: disable=line-too-long, no-member
 
+import importlib
+import inspect
 import logging
 import os
 import platform
@@ -17,7 +19,9 @@ from django.conf import settings
 from django.utils import timezone
 from django.utils.text import slugify
 
-from .models import Execution
+from . import clock, results
+from .results import report_next_run, report_work_remaining, report_idle, report_items_processed, report_progress, increment_counter # pylint: disable=unused-import
+from .models import Execution, Task
 
 # Decorators for wrapping existing Django management commands for use within the
 # Quicksilver task execution system.
@@ -31,50 +35,88 @@ def add_qs_arguments(handle):
 
     return wrapper
 
-def handle_logging(handle):
-    def wrapper(self, *args, **options):
-        verbosity = options.get('verbosity', -1)
+def is_async(handle):
+    iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None) # Python 3.5+
+
+    return iscoroutinefunction is not None and iscoroutinefunction(handle)
+
+def async_decorators():
+    return importlib.import_module('.aio', package=__package__)
+
+def configure_logging(options):
+    verbosity = options.get('verbosity', -1)
+
+    if verbosity != -1:
+        level = logging.DEBUG
+
+        if verbosity == 0:
+            level = logging.ERROR
+        elif verbosity == 1:
+            level = logging.WARN
+        elif verbosity == 2:
+            level = logging.INFO
 
-        if verbosity != -1:
-            level = logging.DEBUG
+        if platform.python_version_tuple() >= ('3', '8', '0'):
+            logging.basicConfig(format='%(asctime)s - %(message)s', level=level, force=True)
+        else:
+            logging.basicConfig(format='%(asctime)s - %(message)s', level=level)
 
-            if verbosity == 0:
-                level = logging.ERROR
-            elif verbosity == 1:
-                level = logging.WARN
-            elif verbosity == 2:
-                level = logging.INFO
+        logging.debug('Logger configured. Level = %s', level)
 
-            if platform.python_version_tuple() >= ('3', '8', '0'):
-                logging.basicConfig(format='%(asctime)s - %(message)s', level=level, force=True)
-            else:
-                logging.basicConfig(format='%(asctime)s - %(message)s', level=level)
+    logging.debug('verbosity = %s', verbosity)
 
-            logging.debug('Logger configured. Level = %s', level)
+def handle_logging(handle):
+    if is_async(handle):
+        return async_decorators().async_handle_logging(handle)
 
-        logging.debug('verbosity = %s', verbosity)
+    def wrapper(self, *args, **options):
+        configure_logging(options)
 
         handle(self, *args, **options)
 
     return wrapper
 
-def handle_schedule(handle):
-    def wrapper(self, *args, **options):
-        invoked_by_qs = False
+def schedule_options(options):
+    '''
+    Removes the options added by add_qs_arguments. Returns (invoked by
+    Quicksilver, next interval).
+    '''
+
+    invoked_by_qs = False
 
-        if '_qs_context' in options:
-            invoked_by_qs = options.get('_qs_context', False)
+    if '_qs_context' in options:
+        invoked_by_qs = options.get('_qs_context', False)
 
-            del options['_qs_context']
+        del options['_qs_context']
 
-        logging.debug('_qs_context = %s', invoked_by_qs)
+    logging.debug('_qs_context = %s', invoked_by_qs)
 
-        next_interval = None
+    next_interval = None
 
-        if '_qs_next_interval' in options:
-            next_interval = options['_qs_next_interval']
+    if '_qs_next_interval' in options:
+        next_interval = options['_qs_next_interval']
 
-            del options['_qs_next_interval']
+        del options['_qs_next_interval']
+
+    return invoked_by_qs, next_interval
+
+def report_schedule(invoked_by_qs, next_interval):
+    if invoked_by_qs and next_interval is not None:
+        result = results.current()
+
+        if result is None:
+            # Not run by Execution.run - fall back to the output trailer.
+
+            six.print_('_qs_next_run: ' + arrow.get(clock.now()).shift(seconds=next_interval).isoformat(), file=sys.stdout, flush=True)
+        elif result.next_run is None:
+            result.next_run = arrow.get(clock.now()).shift(seconds=next_interval).datetime
+
+def handle_schedule(handle):
+    if is_async(handle):
+        return async_decorators().async_handle_schedule(handle)
+
+    def wrapper(self, *args, **options):
+        invoked_by_qs, next_interval = schedule_options(options)
 
         exception = None
 
@@ -83,9 +125,7 @@ def handle_schedule(handle):
         except Exception as exc: # pylint: disable=broad-exception-caught, broad-except
             exception = exc
 
-        if invoked_by_qs:
-            if next_interval is not None:
-                six.print_('_qs_next_run: ' + arrow.get().shift(seconds=next_interval).isoformat(), file=sys.stdout, flush=True)
+        report_schedule(invoked_by_qs, next_interval)
 
         if exception is not None:
             raise exception # pylint: disable=raising-bad-type
@@ -97,112 +137,149 @@ def handle_schedule(handle):
 
 LOCK_WAIT_TIMEOUT = getattr(settings, 'DEFAULT_LOCK_WAIT_TIMEOUT', -1)
 
-def handle_lock(handle): # pylint: disable=too-many-statements
+def acquire_lock(lock_name, lock_suffix='', task_queues=('default',)): # pylint: disable=too-many-locals, too-many-statements
     '''
-    Decorate the handle method with a file lock to ensure there is only ever
-    one process running at any one time.
+    Acquires the file lock for a command (and suffix). A stale lock left over
+    from before the latest system boot is replaced, and ongoing executions in
+    task_queues from before the boot are deleted. Returns the lock, or None if
+    another process holds it.
     '''
-    def wrapper(self, *args, **options): # pylint: disable=too-many-statements, too-many-branches, too-many-locals
-        wrapper_time = time.time()
 
-        lock_prefix = ''
+    lock_prefix = ''
 
+    try:
+        lock_prefix = settings.SITE_URL.split('//')[1].replace('/', '').replace('.', '-')
+    except AttributeError:
         try:
-            lock_prefix = settings.SITE_URL.split('//')[1].replace('/', '').replace('.', '-')
-        except AttributeError:
-            try:
-                lock_prefix = settings.ALLOWED_HOSTS[0].replace('.', '-')
-            except IndexError:
-                lock_prefix = 'qs_lock'
+            lock_prefix = settings.ALLOWED_HOSTS[0].replace('.', '-')
+        except IndexError:
+            lock_prefix = 'qs_lock'
+
+    # Create a local temp file on first run to use as a proxy for system bootup. Needed
+    # in container contexts...
 
-        # Create a local temp file on first run to use as a proxy for system bootup. Needed
-        # in container contexts...
+    lockdir = tempfile.gettempdir()
 
-        lockdir = tempfile.gettempdir()
+    if hasattr(settings, 'QUICKSILVER_LOCK_DIR'):
+        lockdir = settings.QUICKSILVER_LOCK_DIR
 
-        if hasattr(settings, 'QUICKSILVER_LOCK_DIR'):
-            lockdir = settings.QUICKSILVER_LOCK_DIR
+    startup_filename = '%s/%s__startup__.lock' % (lockdir, lock_prefix) # pylint: disable=consider-using-f-string
 
-        startup_filename = '%s/%s__startup__.lock' % (lockdir, lock_prefix) # pylint: disable=consider-using-f-string
+    if os.path.exists(startup_filename):
+        # Check to see if startup file is older than the system runtime (not a container).
 
-        if os.path.exists(startup_filename):
-            # Check to see if startup file is older than the system runtime (not a container).
+        boot_time = arrow.get(psutil.boot_time()).datetime
 
-            boot_time = arrow.get(psutil.boot_time()).datetime
+        start_time = arrow.get(os.path.getctime(startup_filename)).datetime
+
+        if boot_time > start_time:
+            os.remove(startup_filename)
+
+    if os.path.exists(startup_filename) is False:
+        startup_file = os.open(startup_filename, os.O_CREAT | os.O_RDWR)
+        os.write(startup_file, timezone.now().isoformat().encode('utf8'))
+        os.close(startup_file)
+
+    lock_prefix = slugify(lock_prefix)
 
-            start_time = arrow.get(os.path.getctime(startup_filename)).datetime
+    lock_suffix = slugify(lock_suffix)
 
-            if boot_time > start_time:
-                os.remove(startup_filename)
+    lock_filename = '%s/%s__%s__%s' % (tempfile.gettempdir(), lock_prefix, lock_name, lock_suffix) # pylint: disable=consider-using-f-string
 
-        if os.path.exists(startup_filename) is False:
-            startup_file = os.open(startup_filename, os.O_CREAT | os.O_RDWR)
-            os.write(startup_file, timezone.now().isoformat().encode('utf8'))
-            os.close(startup_file)
+    while lock_filename.endswith('_'):
+        lock_filename = lock_filename[:-1]
 
+    lock = FileLock(lock_filename)
+
+    logging.debug('%s - acquiring lock...', lock_name)
+
+    try:
+        lock.acquire(LOCK_WAIT_TIMEOUT)
+    except AlreadyLocked:
         start_time = arrow.get(os.path.getctime(startup_filename)).datetime
 
-        lock_suffix = ''
+        lock_created = arrow.get(os.path.getctime('%s.lock' % lock_filename)).datetime
 
-        if 'task_queue' in options:
-            lock_suffix = '_' + options.get('task_queue')
+        logging.debug('Checking lock age: %s <? %s.', lock_created.isoformat(), start_time.isoformat())
 
-        lock_prefix = slugify(lock_prefix)
+        if lock_created < start_time: # Stale lock left over from reboot.
+            logging.debug('Removing stale lock and jobs from before latest system boot.')
 
-        lock_suffix = slugify(lock_suffix)
+            deleted = Execution.objects.filter(task__queue__in=task_queues, status='ongoing', started__lte=start_time).delete()
 
-        start_time = time.time()
+            Task.objects.filter(queue__in=task_queues, running_since__lte=start_time).update(running_since=None)
 
-        lock_name = self.__module__.split('.').pop()
+            logging.debug('Deleted %s stale ongoing executions in the "%s" task queue(s).', deleted, ', '.join(task_queues))
 
-        lock_filename = '%s/%s__%s__%s' % (tempfile.gettempdir(), lock_prefix, lock_name, lock_suffix) # pylint: disable=consider-using-f-string
+            os.remove('%s.lock' % lock_filename)
 
-        while lock_filename.endswith('_'):
-            lock_filename = lock_filename[:-1]
+            logging.debug('Removed lock file %s.', ('%s.lock' % lock_filename))
 
-        lock = FileLock(lock_filename)
+            try:
+                logging.debug('Attempting to acquire new lock...')
 
-        logging.debug('%s - acquiring lock...', lock_name)
+                lock.acquire(LOCK_WAIT_TIMEOUT)
+            except AlreadyLocked:
+                logging.debug('Lock already in place. Quitting.')
+                return None
+        else:
+            logging.debug('Lock already in place. Quitting.')
+            return None
+    except LockTimeout:
+        logging.debug('Waiting for the lock timed out. Quitting.')
+        return None
 
-        try:
-            lock.acquire(LOCK_WAIT_TIMEOUT)
-        except AlreadyLocked:
-            start_time = arrow.get(os.path.getctime(startup_filename)).datetime
+    logging.debug('Acquired.')
 
-            lock_created = arrow.get(os.path.getctime('%s.lock' % lock_filename)).datetime
+    return lock
 
-            logging.debug('Checking lock age: %s <? %s.', lock_created.isoformat(), start_time.isoformat())
+def lock_task_queues(options):
+    '''
+    Returns the task queues named by a command's --task-queue option(s) -
+    ['default'] if there are none.
+    '''
 
-            if lock_created < start_time: # Stale lock left over from reboot.
-                logging.debug('Removing stale lock and jobs from before latest system boot.')
+    task_queues = options.get('task_queues', None)
 
-                task_queue = options.get('task_queue', 'default')
+    if 'task_queue' in options:
+        task_queues = options.get('task_queue')
 
-                deleted = Execution.objects.filter(task__queue=task_queue, status='ongoing', started__lte=start_time).delete()
+    if isinstance(task_queues, six.string_types):
+        task_queues = [task_queues]
 
-                logging.debug('Deleted %s stale ongoing executions in the "%s" task queue.', deleted, task_queue)
+    if not task_queues:
+        task_queues = ['default']
 
-                os.remove('%s.lock' % lock_filename)
+    return task_queues
 
-                logging.debug('Removed lock file %s.', ('%s.lock' % lock_filename))
+def handle_lock(handle):
+    '''
+    Decorate the handle method with a file lock to ensure there is only ever
+    one process running at any one time.
+    '''
 
-                try:
-                    logging.debug('Attempting to acquire new lock...')
+    if is_async(handle):
+        # The lock's stale execution cleanup uses the ORM, which may not be
+        # called from an event loop. Runners never run a task twice at once.
 
-                    lock.acquire(LOCK_WAIT_TIMEOUT)
-                except AlreadyLocked:
-                    logging.debug('Lock already in place. Quitting.')
-                    return
-            else:
-                logging.debug('Lock already in place. Quitting.')
-                return
-        except LockTimeout:
-            logging.debug('Waiting for the lock timed out. Quitting.')
-            return
+        raise TypeError('handle_lock does not support async handle methods.')
+
+    def wrapper(self, *args, **options):
+        wrapper_time = time.time()
 
-        logging.debug('Acquired.')
+        lock_suffix = ''
+
+        task_queues = lock_task_queues(options)
+
+        if 'task_queue' in options or 'task_queues' in options:
+            lock_suffix = '_' + '-'.join(sorted(task_queues))
+
+        lock = acquire_lock(self.__module__.split('.').pop(), lock_suffix, task_queues)
+
+        if lock is None:
+            return
 
-        options['__qs_lock_filename'] = lock_filename
+        options['__qs_lock_filename'] = lock.path
 
         exception = None
 
@@ -0,0 +1,92 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+import numpy
+
+from django.core.management.base import BaseCommand
+
+from ...models import Execution, Task
+from ...outliers import batched_runtime_statistics, outlier_settings, runtime_statistics
+
+def legacy_thresholds(runtimes_by_task, stddevs=2):
+    thresholds = {}
+
+    for task_id, runtimes in runtimes_by_task.items():
+        if len(runtimes) > 5:
+            thresholds[task_id] = numpy.mean(runtimes) + (stddevs * numpy.std(runtimes))
+        else:
+            thresholds[task_id] = None
+
+    return thresholds
+
+class Command(BaseCommand):
+    help = 'Compares the batched runtime outlier detector against the original per-task threshold loops.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=10000)
+        parser.add_argument('--executions', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument('--database', action='store_true', default=False, help='Benchmark against the executions stored in the database instead of synthetic data.')
+
+    def handle(self, *args, **options): # pylint: disable=too-many-locals
+        report = {
+            'source': 'database' if options['database'] else 'synthetic',
+        }
+
+        if options['database']:
+            start = time.time()
+
+            runtimes_by_task = {}
+
+            for task in Task.objects.all():
+                runtimes_by_task[task.pk] = list(Execution.objects.filter(task=task).exclude(ended=None).exclude(total_runtime=None).values_list('total_runtime', flat=True))
+
+            legacy_thresholds(runtimes_by_task)
+
+            report['legacy_seconds'] = time.time() - start
+            report['tasks'] = len(runtimes_by_task)
+            report['executions'] = sum(len(runtimes) for runtimes in runtimes_by_task.values())
+
+            start = time.time()
+
+            runtime_statistics(options=dict(outlier_settings(), cache_seconds=0, use_rollups=False))
+
+            report['batched_seconds'] = time.time() - start
+        else:
+            generator = numpy.random.RandomState(options['seed']) # pylint: disable=no-member
+
+            task_ids = numpy.sort(generator.zipf(1.3, options['executions']) % options['tasks'])
+            runtimes = generator.lognormal(mean=0.5, sigma=1.0, size=options['executions'])
+
+            # Both detectors are timed on prepared inputs - building the
+            # per-task lists is not part of the legacy computation.
+
+            runtimes_by_task = {}
+
+            for task_id, runtime in zip(task_ids.tolist(), runtimes.tolist()):
+                if task_id not in runtimes_by_task:
+                    runtimes_by_task[task_id] = []
+
+                runtimes_by_task[task_id].append(runtime)
+
+            start = time.time()
+
+            legacy_thresholds(runtimes_by_task)
+
+            report['legacy_seconds'] = time.time() - start
+            report['tasks'] = len(runtimes_by_task)
+            report['executions'] = options['executions']
+
+            start = time.time()
+
+            batched_runtime_statistics(task_ids, runtimes)
+
+            report['batched_seconds'] = time.time() - start
+
+        if report['batched_seconds'] > 0:
+            report['speedup'] = report['legacy_seconds'] / report['batched_seconds']
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -8,7 +8,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from ...decorators import handle_lock
-from ...models import Execution
+from ...models import Execution, Task
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -24,6 +24,8 @@ class Command(BaseCommand):
 
         deleted = Execution.objects.filter(started__lte=before, status='ongoing').delete()[0]
 
+        deleted += Task.objects.filter(running_since__lte=before).update(running_since=None)
+
         root_logger = logging.getLogger('')
 
         if options['verbosity'] > 0:
@@ -9,6 +9,7 @@ from django.utils import timezone
 
 from ...decorators import handle_lock, handle_schedule, add_qs_arguments
 from ...models import Execution
+from ...rollups import prune_rollups, rollup_executions
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -22,8 +23,16 @@ class Command(BaseCommand):
     @handle_schedule
     @handle_lock
     def handle(self, *args, **options):
-        before = timezone.now() - datetime.timedelta(seconds=(60 * options['before_minutes'])) # pylint: disable=superfluous-parens
+        now = timezone.now()
 
-        deleted = Execution.objects.filter(ended__lte=before, status='success').delete()[0]
+        before = now - datetime.timedelta(seconds=(60 * options['before_minutes'])) # pylint: disable=superfluous-parens
 
-        logger.debug('Cleared %s task execution record(s).', deleted)
+        # Keep the long-term history of executions before removing them.
+
+        rolled_up = rollup_executions()
+
+        deleted = Execution.objects.filter(ended__lte=before, status='success', rolled_up=True).delete()[0]
+
+        pruned = prune_rollups(now)
+
+        logger.debug('Rolled up %s and cleared %s task execution record(s), pruned %s rollup(s).', rolled_up, deleted, pruned)
@@ -0,0 +1,68 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length
+
+from ... import outputs
+from ...decorators import handle_lock
+from ...models import Execution
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Command(BaseCommand):
+    help = 'Compresses the stored output of existing Quicksilver task executions and reports the space saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', required=False, type=int, default=1000, help='Executions compressed per batch.')
+
+    @handle_lock
+    def handle(self, *args, **options): # pylint: disable=too-many-locals
+        if outputs.compression_encoding() is None:
+            raise CommandError('Output compression is disabled. Set QUICKSILVER_OUTPUT_COMPRESSION to "zlib" or "zstd" first.')
+
+        root_logger = logging.getLogger('')
+
+        if options['verbosity'] > 0:
+            root_logger.setLevel(logging.DEBUG)
+
+        last_pk = 0
+
+        compressed_count = 0
+        original_bytes = 0
+        compressed_bytes = 0
+
+        # Lengths are in characters - a lower bound for the UTF-8 size.
+
+        candidates = Execution.objects.filter(output_compressed=None).exclude(output=None).annotate(output_length=Length('output')).filter(output_length__gte=outputs.compression_threshold())
+
+        while True:
+            rows = list(candidates.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'output')[:options['batch_size']])
+
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+
+            to_update = []
+
+            for execution_id, output in rows:
+                encoding, compressed = outputs.compress(output)
+
+                if compressed is not None:
+                    to_update.append(Execution(pk=execution_id, output=None, output_compressed=compressed, output_encoding=encoding))
+
+                    original_bytes += len(output.encode('utf-8'))
+                    compressed_bytes += len(compressed)
+
+            Execution.objects.bulk_update(to_update, ['output', 'output_compressed', 'output_encoding'])
+
+            compressed_count += len(to_update)
+
+            logger.debug('Compressed output of %s task execution record(s)...', compressed_count)
+
+        saved = original_bytes - compressed_bytes
+
+        self.stdout.write('Compressed output of %d task execution record(s): %d bytes to %d bytes (%d bytes or %.1f%% saved).' % (compressed_count, original_bytes, compressed_bytes, saved, (100.0 * saved / original_bytes) if original_bytes else 0.0))
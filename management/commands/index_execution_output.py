@@ -0,0 +1,48 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from ... import search
+from ...decorators import handle_lock
+from ...models import Execution
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Command(BaseCommand):
+    help = 'Adds the output of existing Quicksilver task executions to the search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', required=False, type=int, default=1000, help='Executions indexed per batch.')
+
+    @handle_lock
+    def handle(self, *args, **options):
+        if search.backend() is None:
+            raise CommandError('No search index is available for this database (PostgreSQL or SQLite with FTS5 required).')
+
+        root_logger = logging.getLogger('')
+
+        if options['verbosity'] > 0:
+            root_logger.setLevel(logging.DEBUG)
+
+        last_pk = 0
+        indexed = 0
+
+        while True:
+            # Compressed output is stored in output_compressed, with output left empty.
+
+            executions = list(Execution.objects.filter(pk__gt=last_pk).filter(Q(output__isnull=False) | Q(output_compressed__isnull=False)).order_by('pk').only('pk', 'output', 'output_compressed', 'output_encoding')[:options['batch_size']])
+
+            if not executions:
+                break
+
+            indexed += search.index_outputs([(execution.pk, execution.get_output(),) for execution in executions])
+
+            last_pk = executions[-1].pk
+
+            logger.debug('Indexed output of %s task execution record(s)...', indexed)
+
+        logger.debug('Indexed output of %s task execution record(s).', indexed)
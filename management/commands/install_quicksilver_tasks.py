@@ -1,7 +1,11 @@
 # pylint: disable=no-member, line-too-long
 
+import datetime
 import importlib
 import logging
+import random
+
+import six
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
@@ -36,7 +40,19 @@ class Command(BaseCommand):
 
         for task in tasks:
             if Task.objects.filter(command=task[0]).count() == 0:
-                task_obj = Task.objects.create(command=task[0], arguments=task[1], repeat_interval=task[2], next_run=timezone.now())
+                if isinstance(task[2], six.string_types):
+                    # Cron expression - next_run is computed from the schedule on save.
+
+                    task_obj = Task.objects.create(command=task[0], arguments=task[1], repeat_interval=0, cron_schedule=task[2])
+                else:
+                    next_run = timezone.now()
+
+                    if getattr(settings, 'QUICKSILVER_SPREAD_NEW_TASKS', True) and task[2] > 0:
+                        # Stagger first runs so tasks sharing an interval do not fire together.
+
+                        next_run = next_run + datetime.timedelta(seconds=random.uniform(0, task[2])) # nosec
+
+                    task_obj = Task.objects.create(command=task[0], arguments=task[1], repeat_interval=task[2], next_run=next_run)
 
                 if len(task) > 3:
                     task_obj.queue = task[3]
@@ -0,0 +1,51 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ... import metrics, rollups
+from ...decorators import handle_lock
+from ...monitor import evaluate_alert_states, evaluate_queue_states
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Command(BaseCommand):
+    help = 'Starts Quicksilver monitor process, evaluating alert conditions for all task queues.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep-duration', type=int, default=30)
+        parser.add_argument('--restart-after', type=int, default=15)
+        parser.add_argument('--once', action='store_true', default=False, help='Evaluate alert conditions once and exit.')
+
+    @handle_lock
+    def handle(self, *args, **options):
+        try:
+            when_stop = timezone.now() + datetime.timedelta(seconds=(options.get('restart_after') * 60)) # pylint: disable=superfluous-parens
+
+            while True:
+                loop_start = time.time()
+
+                rolled_up = rollups.rollup_executions()
+
+                states = evaluate_alert_states()
+                queue_states = evaluate_queue_states()
+
+                metrics.flush()
+
+                logger.debug('Rolled up %d execution(s), evaluated %d task(s) and %d queue(s) in %.3f seconds.', rolled_up, len(states), len(queue_states), (time.time() - loop_start))
+
+                if options.get('once') or timezone.now() >= when_stop:
+                    break
+
+                wake_next = options.get('sleep_duration') - (time.time() - loop_start)
+
+                if wake_next > 0:
+                    time.sleep(wake_next)
+
+        except KeyboardInterrupt:
+            logger.info('Exiting monitor due to keyboard interruption...')
@@ -0,0 +1,75 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ... import clock
+from ...decorators import handle_logging
+from ...models import Task
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Command(BaseCommand):
+    help = 'Spreads the phases of Quicksilver tasks sharing a repeat interval evenly across that interval to flatten load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-queue', action='append', dest='task_queues', help='Re-phase only tasks in the named queue(s).')
+        parser.add_argument('--per-queue', action='store_true', default=False, help='Spread tasks within each queue separately instead of across all queues.')
+        parser.add_argument('--clear', action='store_true', default=False, help='Remove phase alignment from the selected tasks.')
+        parser.add_argument('--dry-run', action='store_true', default=False, help='Report the new phases without saving them.')
+
+    @handle_logging
+    def handle(self, *args, **options):
+        # Phases only apply to interval schedules.
+
+        tasks = Task.objects.filter(Q(cron_schedule=None) | Q(cron_schedule='')).order_by('pk')
+
+        if options['task_queues']:
+            tasks = tasks.filter(queue__in=options['task_queues'])
+
+        now = clock.now()
+
+        groups = {}
+
+        for task in tasks:
+            key = (task.effective_interval(),)
+
+            if options['per_queue']:
+                key = (task.effective_interval(), task.queue,)
+
+            if key not in groups:
+                groups[key] = []
+
+            groups[key].append(task)
+
+        updated = 0
+
+        for key in sorted(groups.keys()):
+            interval = key[0]
+            group = groups[key]
+
+            for index, task in enumerate(group):
+                if options['clear']:
+                    task.phase = None
+                else:
+                    task.phase = int((index * interval) // len(group))
+
+                    proposed = task.next_run
+
+                    if proposed is None or proposed < now:
+                        proposed = now + datetime.timedelta(seconds=interval)
+
+                    task.next_run = task.adjust_next_run(proposed)
+
+                logger.info('%s: phase = %s, next run = %s', task, task.phase, task.next_run)
+
+                if options['dry_run'] is False:
+                    task.save(update_fields=['phase', 'next_run'])
+
+                updated += 1
+
+        logger.info('Re-phased %d task(s) in %d group(s).', updated, len(groups))
@@ -0,0 +1,304 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import io
+import json
+import logging
+import math
+import os
+import platform
+import time
+
+import numpy
+
+import django
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from ... import backup_api, scheduler, search
+from ...models import Execution, Task
+from ...monitor import evaluate_alert_states
+from ...views import build_status_payload, quicksilver_status
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+BENCHMARK_QUEUE_PREFIX = 'qs-benchmark-'
+
+REPORT_VERSION = 1
+
+BENCHMARKS = (
+    'scheduler_cycle',
+    'monitor',
+    'status',
+    'changelist',
+    'backup',
+    'clear_successful',
+)
+
+def summarize(timings):
+    return {
+        'iterations': len(timings),
+        'min_seconds': float(numpy.min(timings)),
+        'median_seconds': float(numpy.median(timings)),
+        'max_seconds': float(numpy.max(timings)),
+    }
+
+def timed(function, iterations):
+    timings = []
+
+    for _ in range(iterations):
+        start = time.time()
+
+        function()
+
+        timings.append(time.time() - start)
+
+    return summarize(timings)
+
+class Command(BaseCommand):
+    help = 'Generates synthetic Quicksilver tasks and executions and measures scheduler, status, admin, cleanup and backup performance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000)
+        parser.add_argument('--queues', type=int, default=20)
+        parser.add_argument('--executions', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=7, help='Spread generated executions over this many days.')
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument('--only', action='append', choices=BENCHMARKS, help='Run only the named benchmark(s).')
+        parser.add_argument('--skip', action='append', choices=BENCHMARKS, default=[], help='Skip the named benchmark(s).')
+        parser.add_argument('--report', default=None, help='Write the JSON report to this file instead of standard output.')
+        parser.add_argument('--reuse', action='store_true', default=False, help='Reuse previously generated (--keep) benchmark data.')
+        parser.add_argument('--keep', action='store_true', default=False, help='Keep the generated benchmark data when finished.')
+
+    def handle(self, *args, **options): # pylint: disable=too-many-locals
+        if Task.objects.exclude(queue__startswith=BENCHMARK_QUEUE_PREFIX).count() > 0:
+            raise CommandError('Benchmarks delete and back up Quicksilver data. Only run them against an empty database.')
+
+        selected = [name for name in (options['only'] or BENCHMARKS) if name not in options['skip']]
+
+        report = {
+            'report_version': REPORT_VERSION,
+            'generated': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'numpy': numpy.__version__,
+                'database_vendor': connection.vendor,
+                'platform': platform.platform(),
+            },
+            'parameters': {
+                'tasks': options['tasks'],
+                'queues': options['queues'],
+                'executions': options['executions'],
+                'days': options['days'],
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+            },
+            'results': {},
+        }
+
+        try:
+            if options['reuse'] is False or Task.objects.filter(queue__startswith=BENCHMARK_QUEUE_PREFIX).count() == 0:
+                Task.objects.filter(queue__startswith=BENCHMARK_QUEUE_PREFIX).delete()
+
+                start = time.time()
+
+                self.generate(options)
+
+                report['results']['generate'] = {
+                    'seconds': time.time() - start,
+                    'executions_per_second': options['executions'] / max(time.time() - start, 0.000001),
+                }
+
+            report['parameters']['stored_tasks'] = Task.objects.all().count()
+            report['parameters']['stored_executions'] = Execution.objects.all().count()
+
+            for name in selected:
+                logger.info('Running benchmark "%s"...', name)
+
+                report['results'][name] = getattr(self, 'benchmark_%s' % name)(options)
+        finally:
+            if options['keep'] is False:
+                Task.objects.filter(queue__startswith=BENCHMARK_QUEUE_PREFIX).delete()
+
+        content = json.dumps(report, indent=2)
+
+        if options['report'] is not None:
+            with io.open(options['report'], 'w', encoding='utf-8') as report_file:
+                report_file.write(content)
+        else:
+            self.stdout.write(content)
+
+    def generate(self, options): # pylint: disable=too-many-locals
+        generator = numpy.random.RandomState(options['seed']) # pylint: disable=no-member
+
+        now = timezone.now()
+
+        intervals = numpy.array([5, 10, 30, 60, 300, 900, 3600])
+        interval_weights = numpy.array([0.3, 0.2, 0.15, 0.15, 0.1, 0.05, 0.05])
+
+        tasks = []
+
+        for index in range(options['tasks']):
+            interval = int(generator.choice(intervals, p=interval_weights))
+            queue = '%s%02d' % (BENCHMARK_QUEUE_PREFIX, min(int(generator.zipf(1.5)) - 1, options['queues'] - 1))
+
+            tasks.append(Task(command='run_test_task', arguments='--no-color\n--benchmark-%d' % index, queue=queue, repeat_interval=interval, next_run=now + datetime.timedelta(seconds=float(generator.uniform(-2 * interval, interval)))))
+
+        Task.objects.bulk_create(tasks, batch_size=options['batch_size'])
+
+        task_ids = numpy.array(list(Task.objects.filter(queue__startswith=BENCHMARK_QUEUE_PREFIX).order_by('pk').values_list('pk', flat=True)))
+
+        # Skewed activity - a few tasks account for most executions.
+
+        task_weights = 1.0 / numpy.arange(1, len(task_ids) + 1) ** 1.1
+        task_weights = task_weights / task_weights.sum()
+
+        statuses = numpy.array(['success', 'error', 'killed', 'ongoing'])
+        status_weights = numpy.array([0.92, 0.05, 0.02, 0.01])
+
+        window = options['days'] * 24 * 60 * 60
+
+        remaining = options['executions']
+
+        while remaining > 0:
+            count = min(remaining, options['batch_size'])
+
+            execution_tasks = generator.choice(task_ids, size=count, p=task_weights)
+            execution_statuses = generator.choice(statuses, size=count, p=status_weights)
+            offsets = generator.uniform(0, window, size=count)
+            runtimes = generator.lognormal(mean=0.0, sigma=1.5, size=count)
+            lags = generator.exponential(2.0, size=count)
+
+            executions = []
+
+            for index in range(count):
+                started = now - datetime.timedelta(seconds=float(offsets[index]))
+                status = str(execution_statuses[index])
+
+                ended = None
+                runtime = None
+                output = 'Current time: %s\n_qs_next_run: %s' % (started.isoformat(), started.isoformat())
+
+                if status != 'ongoing':
+                    runtime = float(runtimes[index])
+                    ended = started + datetime.timedelta(seconds=runtime)
+
+                if status == 'error':
+                    output = 'Task exception:\n\n' + ('Traceback (most recent call last):\n  File "benchmark.py", line 1, in <module>\n' * 50)
+
+                executions.append(Execution(task_id=int(execution_tasks[index]), started=started, ended=ended, status=status, total_runtime=runtime, output=output, scheduled=started - datetime.timedelta(seconds=float(lags[index])), dispatch_lag=float(lags[index])))
+
+            Execution.objects.bulk_create(executions, batch_size=options['batch_size'])
+
+            search.index_outputs([(execution.pk, execution.output,) for execution in executions])
+
+            remaining -= count
+
+    def benchmark_scheduler_cycle(self, options): # pylint: disable=unused-argument
+        queues = list(Task.objects.filter(queue__startswith=BENCHMARK_QUEUE_PREFIX).order_by('queue').values_list('queue', flat=True).distinct())
+
+        def cycle():
+            for queue in queues:
+                scheduler.overdue_tasks(queue)
+
+        results = timed(cycle, options['iterations'])
+        results['queues'] = len(queues)
+        results['median_seconds_per_queue'] = results['median_seconds'] / max(len(queues), 1)
+
+        return results
+
+    def benchmark_monitor(self, options): # pylint: disable=no-self-use
+        return timed(lambda: evaluate_alert_states(send_alerts=False), options['iterations'])
+
+    def benchmark_status(self, options): # pylint: disable=no-self-use
+        factory = RequestFactory()
+
+        return {
+            'uncached': timed(lambda: json.dumps(build_status_payload()), options['iterations']),
+            'cached': timed(lambda: quicksilver_status(factory.get('/quicksilver/status')), options['iterations']),
+        }
+
+    def benchmark_changelist(self, options): # pylint: disable=no-self-use
+        factory = RequestFactory()
+
+        user = get_user_model()(username='quicksilver-benchmark', is_active=True, is_staff=True, is_superuser=True)
+
+        model_admin = admin.site._registry[Execution] # pylint: disable=protected-access
+
+        def render(path):
+            request = factory.get(path)
+            request.user = user
+
+            response = model_admin.changelist_view(request)
+
+            if response.status_code != 200:
+                raise CommandError('Unexpected %d response rendering %s.' % (response.status_code, path))
+
+            response.render()
+
+        # The admin redirects past the last page - use the deepest page the data set has, up to page 100.
+
+        pages = int(math.ceil(Execution.objects.all().count() / float(model_admin.list_per_page)))
+
+        deep_page = min(max(pages, 1), 100)
+
+        busiest_task = Execution.objects.filter(task__queue__startswith=BENCHMARK_QUEUE_PREFIX).order_by('task_id').values_list('task_id', flat=True).first()
+
+        return {
+            'unfiltered': timed(lambda: render('/admin/quicksilver/execution/'), options['iterations']),
+            'deep_page': timed(lambda: render('/admin/quicksilver/execution/?p=%d' % deep_page), options['iterations']),
+            'deep_page_number': deep_page,
+            'status_filter': timed(lambda: render('/admin/quicksilver/execution/?status__exact=error'), options['iterations']),
+            'task_filter': timed(lambda: render('/admin/quicksilver/execution/?task__id__exact=%s' % busiest_task), options['iterations']),
+            'runtime_filter': timed(lambda: render('/admin/quicksilver/execution/?runtime=60_'), options['iterations']),
+            'search': timed(lambda: render('/admin/quicksilver/execution/?q=Traceback'), options['iterations']),
+        }
+
+    def benchmark_backup(self, options): # pylint: disable=no-self-use, unused-argument
+        start = time.time()
+
+        paths = backup_api.incremental_backup({})
+
+        elapsed = time.time() - start
+
+        total_bytes = 0
+
+        for path in paths:
+            total_bytes += os.path.getsize(path)
+
+            os.remove(path)
+
+        return {
+            'seconds': elapsed,
+            'compressed_bytes': total_bytes,
+            'executions_per_second': Execution.objects.all().count() / max(elapsed, 0.000001),
+        }
+
+    def benchmark_clear_successful(self, options): # pylint: disable=no-self-use, unused-argument
+        stored = Execution.objects.all().count()
+
+        start = time.time()
+
+        call_command('clear_successful_executions', before_minutes=120)
+
+        elapsed = time.time() - start
+
+        # Only rolled up executions are removed - count the rows actually gone.
+
+        deleted = stored - Execution.objects.all().count()
+
+        return {
+            'seconds': elapsed,
+            'deleted': deleted,
+            'deleted_per_second': deleted / max(elapsed, 0.000001),
+        }
@@ -3,14 +3,13 @@
 
 import datetime
 import logging
-import time
+import sys
 
-from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
 
-from ...decorators import handle_lock
-from ...models import Task
+from ... import clock
+from ...decorators import handle_lock, lock_task_queues
+from ...runners import QueueRunner, Supervisor
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -18,50 +17,39 @@ class Command(BaseCommand):
     help = 'Starts Quicksilver execution process.'
 
     def add_arguments(self, parser):
-        parser.add_argument('--task-queue', default='default')
+        parser.add_argument('--task-queue', action='append', dest='task_queues', help='Queue to run (default: "default"). Repeat to run several queues from one process, or use "all" for every queue.')
         parser.add_argument('--sleep-duration', type=int, default=5)
         parser.add_argument('--restart-after', type=int, default=15)
+        parser.add_argument('--threads', type=int, default=0, help='Run tasks on this many worker threads (per queue) instead of one at a time.')
+        parser.add_argument('--async-tasks', type=int, default=0, help='Run tasks with async commands on an event loop (per queue), up to this many at once.')
 
     @handle_lock
     def handle(self, *args, **options):
-        queue_started = timezone.now()
+        if options.get('async_tasks') and sys.version_info < (3, 7):
+            # Output and results only follow asyncio tasks through contextvars.
 
-        try:
-            for task in Task.objects.filter(queue=options.get('task_queue')):
-                for execution in task.executions.filter(status='ongoing'):
-                    execution.kill_if_stuck(queue_started)
-
-            when_stop = timezone.now() + datetime.timedelta(seconds=(options.get('restart_after') * 60)) # pylint: disable=superfluous-parens
-
-            cycle_sleep = 5
-
-            try:
-                cycle_sleep = settings.QUICKSILVER_MIN_CYCLE_SLEEP_SECONDS
-            except AttributeError:
-                pass
-
-            while timezone.now() < when_stop:
-                loop_start = timezone.now()
+            raise CommandError('--async-tasks requires Python 3.7 or later.')
 
-                overdue_tasks = []
+        task_queues = lock_task_queues(options)
 
-                for overdue in Task.objects.exclude(next_run=None).filter(next_run__lte=timezone.now(), queue=options.get('task_queue')).order_by('next_run'):
-                    if overdue.is_running() is False:
-                        overdue_tasks.append(overdue)
-                    elif overdue.should_alert():
-                        overdue.alert()
+        when_stop = clock.now() + datetime.timedelta(seconds=(options.get('restart_after') * 60)) # pylint: disable=superfluous-parens
 
-                for task in overdue_tasks:
-                    task.run()
+        if len(task_queues) > 1 or 'all' in task_queues:
+            supervisor = Supervisor(task_queues, self.__module__.split('.').pop(), sleep_duration=options.get('sleep_duration'), threads=options.get('threads'), async_tasks=options.get('async_tasks'))
 
-                elapsed = (timezone.now() - loop_start).total_seconds()
+            try:
+                supervisor.run(when_stop)
+            except KeyboardInterrupt:
+                logger.info('Exiting queues "%s" due to keyboard interruption...', '", "'.join(task_queues))
 
-                wake_next = options.get('sleep_duration') - elapsed
+            return
 
-                if wake_next > cycle_sleep:
-                    time.sleep(wake_next)
-                else:
-                    time.sleep(cycle_sleep)
+        runner = QueueRunner(task_queues[0], sleep_duration=options.get('sleep_duration'), threads=options.get('threads'), async_tasks=options.get('async_tasks'))
 
+        try:
+            runner.start()
+            runner.run(when_stop)
         except KeyboardInterrupt:
-            logger.info('Exiting queue "%s" due to keyboard interruption...', options.get('task_queue'))
+            logger.info('Exiting queue "%s" due to keyboard interruption...', task_queues[0])
+        finally:
+            runner.shutdown()
@@ -6,16 +6,23 @@ import six
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from ...decorators import handle_lock, handle_schedule, add_qs_arguments
+from ...decorators import handle_lock, handle_schedule, add_qs_arguments, report_work_remaining, report_items_processed
 
 class Command(BaseCommand):
     help = 'Test Quicksilver task command.'
 
     @add_qs_arguments
     def add_arguments(self, parser):
-        pass
+        parser.add_argument('--work-remaining', type=int, default=None, help='Report this much remaining work to adaptive schedules.')
+        parser.add_argument('--items-processed', type=int, default=None, help='Report this many items processed.')
 
     @handle_schedule
     @handle_lock
     def handle(self, *args, **options):
         six.print_('Current time: ' + timezone.now().isoformat())
+
+        if options.get('work_remaining', None) is not None:
+            report_work_remaining(options['work_remaining'])
+
+        if options.get('items_processed', None) is not None:
+            report_items_processed(options['items_processed'])
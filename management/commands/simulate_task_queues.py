@@ -0,0 +1,62 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import time
+
+import arrow
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import clock
+from ...models import Task
+from ...simulation import DISTRIBUTIONS, simulate
+
+class Command(BaseCommand):
+    help = 'Replays Quicksilver scheduling on a virtual clock and reports utilisation, dispatch lag and missed runs per queue. Every simulated run succeeds and keeps its task\'s current interval - circuit breakers, concurrency groups, adaptive intervals and rate limits are not modelled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-queue', action='append', dest='task_queues', help='Simulate only the named queue(s). Defaults to all queues.')
+        parser.add_argument('--days', type=float, default=1.0, help='Length of the simulated period.')
+        parser.add_argument('--start', default=None, help='Simulated start time (ISO-8601). Defaults to now.')
+        parser.add_argument('--workers', type=int, default=1, help='Concurrent executions per queue.')
+        parser.add_argument('--sleep-duration', type=int, default=5)
+        parser.add_argument('--min-cycle-sleep', type=int, default=getattr(settings, 'QUICKSILVER_MIN_CYCLE_SLEEP_SECONDS', 5))
+        parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='history', help='Task duration distribution. "history" fits each task\'s recent runtimes.')
+        parser.add_argument('--median-duration', type=float, default=1.0, help='Median task duration (seconds) for synthetic distributions and tasks without history.')
+        parser.add_argument('--sigma', type=float, default=0.5, help='Log-normal shape parameter for synthetic durations.')
+        parser.add_argument('--seed', type=int, default=1234)
+
+    def handle(self, *args, **options):
+        start = clock.now()
+
+        if options['start'] is not None:
+            start = arrow.get(options['start']).datetime
+
+        until = start + datetime.timedelta(days=options['days'])
+
+        tasks = Task.objects.all().order_by('pk')
+
+        if options['task_queues']:
+            tasks = tasks.filter(queue__in=options['task_queues'])
+
+        wall_start = time.time()
+
+        reports = simulate(list(tasks), start, until, {
+            'distribution': options['distribution'],
+            'seed': options['seed'],
+            'workers': options['workers'],
+            'sleep_duration': options['sleep_duration'],
+            'cycle_sleep': options['min_cycle_sleep'],
+            'median': options['median_duration'],
+            'sigma': options['sigma'],
+        })
+
+        self.stdout.write(json.dumps({
+            'start': start.isoformat(),
+            'end': until.isoformat(),
+            'wall_seconds': time.time() - wall_start,
+            'queues': reports,
+        }, indent=2))
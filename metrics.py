@@ -0,0 +1,238 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import re
+import threading
+
+from django.apps import apps
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# In-process counters, gauges and histograms. Values accumulate locally and are
+# periodically flushed to the MetricValue table by the task runners and monitor,
+# so the metrics endpoint only reads a small table of precomputed values.
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+RUNTIME_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600,)
+LAG_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 300, 900,)
+CYCLE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60,)
+
+METRICS = {
+    'quicksilver_executions_total': (COUNTER, 'Finished executions by task, queue and status.',),
+    'quicksilver_execution_runtime_seconds': (HISTOGRAM, 'Execution runtimes by queue.',),
+    'quicksilver_dispatch_lag_seconds': (HISTOGRAM, 'Seconds between the scheduled and actual start of executions by queue.',),
+    'quicksilver_scheduler_cycle_seconds': (HISTOGRAM, 'Duration of task runner scheduling cycles by queue.',),
+    'quicksilver_alert_emails_total': (COUNTER, 'Alert e-mails sent by kind.',),
+    'quicksilver_skipped_runs_total': (COUNTER, 'Misfired runs skipped under the "skip" misfire policy by queue.',),
+    'quicksilver_shed_runs_total': (COUNTER, 'Low-priority runs shed under overload by queue.',),
+    'quicksilver_circuit_breaker_trips_total': (COUNTER, 'Tasks parked by their circuit breaker after repeated failures by queue.',),
+    'quicksilver_concurrency_waits_total': (COUNTER, 'Dispatches deferred because a concurrency group was at capacity by group and queue.',),
+    'quicksilver_concurrency_waiting_tasks': (GAUGE, 'Ready tasks waiting on a concurrency group in the last scheduling cycle by group and queue.',),
+    'quicksilver_rate_limited_total': (COUNTER, 'Dispatches deferred by per-task rate limits by queue.',),
+    'quicksilver_uninterrupted_timeouts_total': (COUNTER, 'Task threads that kept running after the watchdog tried to stop them at their maximum duration.',),
+    'quicksilver_items_processed_total': (COUNTER, 'Items processed as reported by task commands by task and queue.',),
+    'quicksilver_overdue_tasks': (GAUGE, 'Overdue tasks by queue, as last evaluated by the monitor.',),
+    'quicksilver_alerting_tasks': (GAUGE, 'Tasks currently meeting an alert condition by queue, as last evaluated by the monitor.',),
+}
+
+PENDING_LOCK = threading.Lock()
+
+PENDING_INCREMENTS = {}
+PENDING_GAUGES = {}
+
+LABEL_ESCAPES = re.compile(r'(["\\\n])')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    rendered = []
+
+    for key in sorted(labels.keys()):
+        value = LABEL_ESCAPES.sub(lambda match: '\\n' if match.group(1) == '\n' else '\\' + match.group(1), str(labels[key]))
+
+        rendered.append('%s="%s"' % (key, value))
+
+    return ','.join(rendered)
+
+def format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+
+    return repr(float(bound))
+
+def metric_key(name, labels):
+    return hashlib.sha256(('%s{%s}' % (name, labels)).encode('utf-8')).hexdigest()
+
+def increment(name, labels=None, value=1):
+    key = (name, format_labels(labels))
+
+    with PENDING_LOCK:
+        PENDING_INCREMENTS[key] = PENDING_INCREMENTS.get(key, 0) + value
+
+def set_gauge(name, value, labels=None):
+    with PENDING_LOCK:
+        PENDING_GAUGES[(name, format_labels(labels))] = value
+
+def observe(name, value, buckets, labels=None):
+    if value is None:
+        return
+
+    if labels is None:
+        labels = {}
+
+    with PENDING_LOCK:
+        for bound in list(buckets) + [float('inf')]:
+            bucket_labels = dict(labels)
+            bucket_labels['le'] = format_bound(bound)
+
+            key = (name + '_bucket', format_labels(bucket_labels))
+
+            PENDING_INCREMENTS[key] = PENDING_INCREMENTS.get(key, 0) + (1 if value <= bound else 0)
+
+        rendered = format_labels(labels)
+
+        PENDING_INCREMENTS[(name + '_sum', rendered)] = PENDING_INCREMENTS.get((name + '_sum', rendered), 0) + value
+        PENDING_INCREMENTS[(name + '_count', rendered)] = PENDING_INCREMENTS.get((name + '_count', rendered), 0) + 1
+
+def flush_increment(name, labels, value, now):
+    MetricValue = apps.get_model('quicksilver', 'MetricValue') # pylint: disable=invalid-name
+
+    key = metric_key(name, labels)
+
+    with transaction.atomic():
+        if MetricValue.objects.filter(key=key).update(value=F('value') + value, updated=now) > 0:
+            return
+
+    try:
+        with transaction.atomic():
+            MetricValue.objects.create(key=key, name=name, labels=labels, value=value, updated=now)
+    except IntegrityError: # Created concurrently by another process.
+        with transaction.atomic():
+            MetricValue.objects.filter(key=key).update(value=F('value') + value, updated=now)
+
+def flush_gauge(name, labels, value, now):
+    MetricValue = apps.get_model('quicksilver', 'MetricValue') # pylint: disable=invalid-name
+
+    with transaction.atomic():
+        MetricValue.objects.update_or_create(key=metric_key(name, labels), defaults={'name': name, 'labels': labels, 'value': value, 'updated': now})
+
+def flush():
+    '''
+    Writes pending in-process values to the MetricValue table. Safe to call
+    from several processes at once - counters are incremented in the database.
+    Values that cannot be written are kept for the next flush.
+    '''
+
+    with PENDING_LOCK:
+        increments = dict(PENDING_INCREMENTS)
+        gauges = dict(PENDING_GAUGES)
+
+        PENDING_INCREMENTS.clear()
+        PENDING_GAUGES.clear()
+
+    now = timezone.now()
+
+    failed = 0
+
+    for key, value in increments.items():
+        try:
+            flush_increment(key[0], key[1], value, now)
+        except DatabaseError:
+            logger.exception('Unable to flush Quicksilver metric %s{%s}.', key[0], key[1])
+
+            failed += 1
+
+            with PENDING_LOCK:
+                PENDING_INCREMENTS[key] = PENDING_INCREMENTS.get(key, 0) + value
+
+    for key, value in gauges.items():
+        try:
+            flush_gauge(key[0], key[1], value, now)
+        except DatabaseError:
+            logger.exception('Unable to flush Quicksilver metric %s{%s}.', key[0], key[1])
+
+            failed += 1
+
+            with PENDING_LOCK:
+                PENDING_GAUGES.setdefault(key, value)
+
+    return failed
+
+def metric_family(sample_name):
+    if sample_name in METRICS:
+        return sample_name
+
+    for suffix in ('_bucket', '_sum', '_count',):
+        if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in METRICS:
+            return sample_name[:-len(suffix)]
+
+    return sample_name
+
+BUCKET_BOUND = re.compile(r'(^|,)le="([^"]*)"')
+
+def sample_sort_key(sample):
+    name, labels = sample[0], sample[1]
+
+    bound = 0.0
+
+    match = BUCKET_BOUND.search(labels)
+
+    if match is not None:
+        bound = float(match.group(2).replace('+Inf', 'inf'))
+        labels = BUCKET_BOUND.sub('', labels).strip(',')
+
+    suffix_order = 0
+
+    if name.endswith('_sum'):
+        suffix_order = 1
+    elif name.endswith('_count'):
+        suffix_order = 2
+
+    return (metric_family(name), labels, suffix_order, bound)
+
+def render_metrics():
+    '''
+    Renders the recorded values in the Prometheus text exposition format.
+    '''
+
+    MetricValue = apps.get_model('quicksilver', 'MetricValue') # pylint: disable=invalid-name
+    AlertState = apps.get_model('quicksilver', 'AlertState') # pylint: disable=invalid-name
+
+    samples = list(MetricValue.objects.all().values_list('name', 'labels', 'value'))
+
+    for row in AlertState.objects.values('task__queue').annotate(overdue_count=Count('pk', filter=Q(overdue=True)), alerting_count=Count('pk', filter=Q(should_alert=True))):
+        labels = format_labels({'queue': row['task__queue']})
+
+        samples.append(('quicksilver_overdue_tasks', labels, row['overdue_count'],))
+        samples.append(('quicksilver_alerting_tasks', labels, row['alerting_count'],))
+
+    samples.sort(key=sample_sort_key)
+
+    lines = []
+
+    described = set()
+
+    for name, labels, value in samples:
+        family = metric_family(name)
+
+        if family not in described and family in METRICS:
+            lines.append('# HELP %s %s' % (family, METRICS[family][1]))
+            lines.append('# TYPE %s %s' % (family, METRICS[family][0]))
+
+            described.add(family)
+
+        if labels:
+            lines.append('%s{%s} %s' % (name, labels, repr(float(value))))
+        else:
+            lines.append('%s %s' % (name, repr(float(value))))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,35 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0019_merge_20250402_1429'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evaluated', models.DateTimeField()),
+                ('runtime_count', models.IntegerField(default=0)),
+                ('runtime_mean', models.FloatField(blank=True, null=True)),
+                ('runtime_std', models.FloatField(blank=True, null=True)),
+                ('outlier_threshold', models.FloatField(blank=True, null=True)),
+                ('open_runtime', models.FloatField(blank=True, null=True)),
+                ('since_last_run', models.FloatField(blank=True, null=True)),
+                ('overdue', models.BooleanField(default=False)),
+                ('outlier', models.BooleanField(default=False)),
+                ('max_runtime_exceeded', models.BooleanField(default=False)),
+                ('should_alert', models.BooleanField(default=False)),
+                ('issue', models.CharField(blank=True, max_length=1024, null=True)),
+                ('issue_threshold', models.FloatField(blank=True, null=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alert_state', to='quicksilver.task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0020_alertstate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='execution',
+            index=models.Index(fields=['task', 'started'], name='quicksilver_task_id_646d90_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0021_execution_task_started_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue', models.CharField(max_length=128, unique=True)),
+                ('updated', models.DateTimeField(blank=True, null=True)),
+                ('cycle_duration', models.FloatField(blank=True, null=True)),
+                ('queue_depth', models.IntegerField(blank=True, null=True)),
+                ('evaluated', models.DateTimeField(blank=True, null=True)),
+                ('lag_count', models.IntegerField(default=0)),
+                ('lag_p50', models.FloatField(blank=True, null=True, verbose_name='lag (50th percentile)')),
+                ('lag_p90', models.FloatField(blank=True, null=True, verbose_name='lag (90th percentile)')),
+                ('lag_p99', models.FloatField(blank=True, null=True, verbose_name='lag (99th percentile)')),
+                ('lag_max', models.FloatField(blank=True, null=True, verbose_name='lag (maximum)')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='cycle_duration',
+            field=models.FloatField(blank=True, help_text='Duration of the previous scheduler cycle (seconds)', null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='dispatch_lag',
+            field=models.FloatField(blank=True, help_text='Seconds between the scheduled and actual start', null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='queue_depth',
+            field=models.IntegerField(blank=True, help_text='Overdue tasks waiting in the queue at dispatch', null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='scheduled',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0022_dispatch_lag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256)),
+                ('labels', models.CharField(blank=True, default='', max_length=512)),
+                ('value', models.FloatField(default=0)),
+                ('updated', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('name', 'labels')},
+            },
+        ),
+    ]
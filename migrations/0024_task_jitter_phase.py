@@ -0,0 +1,24 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0023_metricvalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='jitter',
+            field=models.IntegerField(default=0, help_text='Maximum random delay (seconds) added to each scheduled run'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='phase',
+            field=models.IntegerField(blank=True, help_text='Offset (seconds) within the repeat interval to align scheduled runs to', null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0024_task_jitter_phase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='cron_schedule',
+            field=models.CharField(blank=True, help_text='Cron expression (with optional leading seconds field) used instead of the repeat interval', max_length=256, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='schedule_timezone',
+            field=models.CharField(blank=True, help_text='Time zone for the cron schedule (defaults to TIME_ZONE)', max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='next_run',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['queue', 'next_run'], name='quicksilver_queue_50e16d_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0025_task_cron_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='circuit_breaker_threshold',
+            field=models.IntegerField(blank=True, help_text='Consecutive failures before the task is parked (defaults to QUICKSILVER_CIRCUIT_BREAKER_THRESHOLD)', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='circuit_opened',
+            field=models.DateTimeField(blank=True, help_text='When the circuit breaker parked this task after repeated failures', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='consecutive_failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='max_backoff',
+            field=models.IntegerField(blank=True, help_text='Maximum delay (seconds) before retrying a failing task (defaults to QUICKSILVER_MAX_BACKOFF_SECONDS)', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0026_task_circuit_breaker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='max_catch_up_runs',
+            field=models.IntegerField(default=3, help_text='Most missed runs to execute when catching up'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='misfire_grace',
+            field=models.IntegerField(blank=True, help_text='Seconds a run may start late before it is treated as a misfire (defaults to QUICKSILVER_MISFIRE_GRACE_SECONDS)', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='misfire_policy',
+            field=models.CharField(choices=[('run_once', 'Run once and realign'), ('skip', 'Skip to next slot'), ('catch_up', 'Catch up missed runs (up to limit)')], default='run_once', help_text='How to handle runs that start later than the misfire grace period', max_length=16),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0027_task_misfire_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Overdue tasks with higher priorities are dispatched first'),
+        ),
+    ]
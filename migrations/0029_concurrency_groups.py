@@ -0,0 +1,53 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0028_task_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConcurrencyGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('max_concurrent', models.IntegerField(default=1, help_text='Most tasks in this group that may run at once')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='rate_limit_period',
+            field=models.IntegerField(blank=True, help_text='Rate limit period (seconds)', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='rate_limit_runs',
+            field=models.IntegerField(blank=True, help_text='Most runs allowed within the rate limit period', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='concurrency_group',
+            field=models.ForeignKey(blank=True, help_text='Limits how many tasks in this group run at once across all queues', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='quicksilver.concurrencygroup'),
+        ),
+        migrations.CreateModel(
+            name='ConcurrencySlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('holder', models.CharField(blank=True, max_length=64, null=True)),
+                ('acquired', models.DateTimeField(blank=True, null=True)),
+                ('expires', models.DateTimeField(blank=True, null=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='quicksilver.concurrencygroup')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='concurrency_slots', to='quicksilver.task')),
+            ],
+            options={
+                'unique_together': {('group', 'slot')},
+            },
+        ),
+    ]
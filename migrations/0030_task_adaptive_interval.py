@@ -0,0 +1,29 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0029_concurrency_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='current_interval',
+            field=models.FloatField(blank=True, help_text='Current adaptive interval (seconds)', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='max_interval',
+            field=models.IntegerField(blank=True, help_text='Longest adaptive interval (seconds) while the command reports it is idle', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='min_interval',
+            field=models.IntegerField(blank=True, help_text='Shortest adaptive interval (seconds) while the command reports remaining work', null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0030_task_adaptive_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='execution',
+            name='rolled_up',
+            field=models.BooleanField(default=False, help_text='Already counted in the execution rollups'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='recording_mode',
+            field=models.CharField(choices=[('full', 'Full (store every execution)'), ('lightweight', 'Lightweight (aggregate successes, store failures and samples)')], default='full', help_text='Lightweight mode aggregates successful runs instead of storing each one', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='success_sample_rate',
+            field=models.FloatField(default=0.01, help_text='Fraction of successful runs stored in full in lightweight mode'),
+        ),
+        migrations.CreateModel(
+            name='ExecutionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.IntegerField(help_text='Bucket length (seconds)')),
+                ('period_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('runtime_sum', models.FloatField(default=0)),
+                ('runtime_sum_squares', models.FloatField(default=0)),
+                ('runtime_min', models.FloatField(blank=True, null=True)),
+                ('runtime_max', models.FloatField(blank=True, null=True)),
+                ('last_ended', models.DateTimeField(blank=True, null=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='quicksilver.task')),
+            ],
+            options={
+                'unique_together': {('task', 'period', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0031_execution_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionrollup',
+            name='error_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='executionrollup',
+            name='killed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='executionrollup',
+            name='runtime_histogram',
+            field=models.TextField(default='{}', help_text='Log-scaled histogram of successful runtimes (JSON)'),
+        ),
+        migrations.AddField(
+            model_name='executionrollup',
+            name='success_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='execution',
+            name='rolled_up',
+            field=models.BooleanField(db_index=True, default=False, help_text='Already counted in the execution rollups'),
+        ),
+        migrations.AlterField(
+            model_name='executionrollup',
+            name='runtime_sum',
+            field=models.FloatField(default=0, help_text='Total runtime of successful runs (seconds)'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0032_rollup_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionrollup',
+            name='last_success',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
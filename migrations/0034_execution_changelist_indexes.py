@@ -0,0 +1,22 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0033_rollup_last_success'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='execution',
+            index=models.Index(fields=['started'], name='quicksilver_started_2f8903_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='execution',
+            index=models.Index(fields=['status', 'started'], name='quicksilver_status_b10a1c_idx'),
+        ),
+    ]
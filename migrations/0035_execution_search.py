@@ -0,0 +1,24 @@
+# pylint: skip-file
+
+from django.db import migrations
+
+from ..search import create_index, drop_index
+
+
+def create_search_index(apps, schema_editor):
+    create_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0034_execution_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
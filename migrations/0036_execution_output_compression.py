@@ -0,0 +1,24 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0035_execution_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='execution',
+            name='output_compressed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='output_encoding',
+            field=models.CharField(blank=True, editable=False, help_text='Compression of the stored output', max_length=16, null=True),
+        ),
+    ]
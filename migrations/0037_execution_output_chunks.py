@@ -0,0 +1,28 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 23:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0036_execution_output_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionOutputChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.IntegerField(help_text='Position of the chunk in the output (characters)')),
+                ('content', models.TextField()),
+                ('written', models.DateTimeField()),
+                ('execution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='output_chunks', to='quicksilver.execution')),
+            ],
+            options={
+                'unique_together': {('execution', 'offset')},
+            },
+        ),
+    ]
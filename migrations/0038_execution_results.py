@@ -0,0 +1,39 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0037_execution_output_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='execution',
+            name='counters',
+            field=models.TextField(blank=True, help_text='Counters reported by the command (JSON)', null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='items_processed',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='progress',
+            field=models.FloatField(blank=True, help_text='Reported progress (percent)', null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='reported_next_run',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='execution',
+            name='work_remaining',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
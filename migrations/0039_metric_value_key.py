@@ -0,0 +1,44 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-19 10:12
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_keys(apps, schema_editor):
+    MetricValue = apps.get_model('quicksilver', 'MetricValue')
+
+    for metric in MetricValue.objects.all():
+        metric.key = hashlib.sha256(('%s{%s}' % (metric.name, metric.labels)).encode('utf-8')).hexdigest()
+        metric.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0038_execution_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metricvalue',
+            name='key',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='metricvalue',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='metricvalue',
+            name='labels',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='metricvalue',
+            name='key',
+            field=models.CharField(help_text='SHA-256 of the name and labels', max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# pylint: skip-file
+# Generated by Django 5.2.18 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quicksilver', '0039_metric_value_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='running_since',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Start of the current run, if it is not stored as an execution', null=True),
+        ),
+    ]
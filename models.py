@@ -1,28 +1,40 @@
-# pylint: disable=no-member, line-too-long
+# pylint: disable=no-member, line-too-long, too-many-lines
 # -*- coding: utf-8 -*-
 
+import calendar
+import collections
 import datetime
 import importlib
 import io
+import json
 import logging
+import math
+import random
 import signal
-import sys
+import threading
 import traceback
 
 import arrow
 import numpy
 
-from six import python_2_unicode_compatible
+from six import PY2, python_2_unicode_compatible
 
 from django.conf import settings
 from django.core.checks import Warning, register # pylint: disable=redefined-builtin
+from django.core.exceptions import ValidationError
 from django.core.mail import EmailMessage
 from django.core.management import call_command
-from django.db import models
+from django.db import DatabaseError, connections, models
 from django.db.utils import ProgrammingError, OperationalError
 from django.template.loader import render_to_string
 from django.utils import timezone
 
+from . import clock, metrics, outputs, results, workers
+from .outliers import cached_runtime_threshold
+from .rollups import histogram_quantile, record_rollup
+from .schedules import ScheduleError, parse_schedule
+from .search import index_output
+
 RUN_STATUSES = (
     ('success', 'Successful',),
     ('error', 'Error',),
@@ -49,6 +61,32 @@ class ExecutionTimeout: # pylint: disable=old-style-class
     def __exit__(self, type, value, traceback): # pylint: disable=redefined-builtin, redefined-outer-name
         signal.alarm(0)
 
+def execution_timeout(seconds):
+    if workers.in_main_thread():
+        return ExecutionTimeout(seconds=seconds)
+
+    # Task runner threads - signal.alarm is only available to the main thread.
+
+    return workers.ThreadTimeout(seconds, ExecutionTimeoutError)
+
+def is_async_command(name):
+    '''
+    Returns True if the named command has an async handle method (see aio.py).
+    '''
+
+    if PY2:
+        return False
+
+    return importlib.import_module('.aio', package=__package__).is_async_command(name)
+
+def run_command(name, *args, **options):
+    if is_async_command(name):
+        # Not run by an event loop runner - give the command a loop of its own.
+
+        return importlib.import_module('.aio', package=__package__).call_command_sync(name, *args, **options)
+
+    return call_command(name, *args, **options)
+
 @register()
 def check_all_quicksilver_tasks_installed(app_configs, **kwargs): # pylint: disable=unused-argument, invalid-name
     errors = []
@@ -95,30 +133,212 @@ def check_quicksilver_lock_dir_defined(app_configs, **kwargs): # pylint: disable
     return errors
 
 class QuicksilverIO(io.BytesIO, object): # pylint: disable=too-few-public-methods, useless-object-inheritance
-    def __init__(self): # pylint: disable=useless-super-delegation
+    def __init__(self, on_chunk=None):
         super(QuicksilverIO, self).__init__() # pylint: disable=super-with-arguments
 
-    def write(self, value): # pylint: disable=useless-super-delegation, arguments-differ
+        # Output not yet passed to on_chunk(offset, content), in characters.
+        # Chunks are passed on by a streaming thread with its own database
+        # connection, so they are neither part of the command's transactions
+        # nor delayed until the command next prints.
+
+        self.on_chunk = on_chunk
+        self.pending = []
+        self.pending_length = 0
+        self.offset = 0
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.streaming = None
+
+    def write(self, value): # pylint: disable=arguments-differ
         super(QuicksilverIO, self).write(value.encode()) # pylint: disable=super-with-arguments
 
+        if self.on_chunk is not None:
+            with self.lock:
+                self.pending.append(value)
+                self.pending_length += len(value)
+
+                full = self.pending_length >= output_chunk_size()
+
+            if full:
+                self.wake.set()
+
+    def start_streaming(self):
+        if self.on_chunk is None or self.streaming is not None:
+            return
+
+        self.streaming = threading.Thread(target=self.stream, name='quicksilver-output')
+        self.streaming.daemon = True
+        self.streaming.start()
+
+    def stop_streaming(self):
+        '''
+        Stops the streaming thread, dropping output not yet passed on - the
+        complete output is stored when the run ends.
+        '''
+
+        streaming = self.streaming
+
+        if streaming is not None:
+            self.streaming = None
+
+            self.wake.set()
+
+            streaming.join()
+
+    def stream(self):
+        try:
+            while self.streaming is not None:
+                self.wake.wait(getattr(settings, 'QUICKSILVER_OUTPUT_CHUNK_SECONDS', 5))
+                self.wake.clear()
+
+                if self.streaming is not None and self.on_chunk is not None:
+                    self.flush_chunks()
+        finally:
+            connections.close_all()
+
+    def flush_chunks(self):
+        with self.lock:
+            content = ''.join(self.pending)
+
+            self.pending = []
+            self.pending_length = 0
+
+        chunk_size = output_chunk_size()
+
+        for start in range(0, len(content), chunk_size):
+            if self.offset >= OUTPUT_CHUNK_LIMIT:
+                self.on_chunk = None
+
+                break
+
+            try:
+                self.on_chunk(self.offset, content[start:start + chunk_size])
+            except Exception: # pylint: disable=broad-exception-caught, broad-except
+                logging.exception('Unable to stream task output.')
+
+            self.offset += len(content[start:start + chunk_size])
+
+def output_chunk_size():
+    return getattr(settings, 'QUICKSILVER_OUTPUT_CHUNK_SIZE', 65536)
+
+def parse_output_trailer(output):
+    '''
+    Returns the (next run, work remaining) printed in the last lines of the
+    output by commands that do not report them through quicksilver.results.
+    '''
+
+    trailer = None
+    work_remaining = None
+
+    for line in output[-4096:].splitlines()[-2:]:
+        if line.startswith('_qs_next_run:'):
+            trailer = arrow.get(line.replace('_qs_next_run:', '').strip()).datetime
+        elif line.startswith('_qs_work_remaining:'):
+            try:
+                work_remaining = float(line.replace('_qs_work_remaining:', '').strip())
+            except ValueError:
+                logging.error('Invalid work remaining reported: %s', line)
+
+    return trailer, work_remaining
+
+# Stop writing chunks once the output outgrows the stored output.
+
+OUTPUT_CHUNK_LIMIT = 1048576
+
+MISFIRE_POLICIES = (
+    ('run_once', 'Run once and realign',),
+    ('skip', 'Skip to next slot',),
+    ('catch_up', 'Catch up missed runs (up to limit)',),
+)
+
+OUTPUT_FIELDS = ['output', 'output_compressed', 'output_encoding']
+
+RESULT_FIELDS = ['reported_next_run', 'work_remaining', 'items_processed', 'progress', 'counters']
+
+RECORDING_MODES = (
+    ('full', 'Full (store every execution)',),
+    ('lightweight', 'Lightweight (aggregate successes, store failures and samples)',),
+)
+
+# Upper bound on calendar slots examined when catching up a cron schedule.
+
+MAX_CATCH_UP_SLOTS = 10000
+
 @python_2_unicode_compatible
-class Task(models.Model):
+class Task(models.Model): # pylint: disable=too-many-public-methods
     class Meta: # pylint: disable=too-few-public-methods, old-style-class, no-init
         permissions = (
             ('access_module', 'Access Quicksilver components'),
         )
 
+        indexes = [
+            models.Index(fields=['queue', 'next_run']),
+        ]
+
     command = models.CharField(max_length=4096, db_index=True)
     arguments = models.TextField(max_length=1048576, help_text='One argument per line', null=True, blank=True)
     queue = models.CharField(max_length=128, default='default')
+    priority = models.IntegerField(default=0, help_text='Overdue tasks with higher priorities are dispatched first')
 
     repeat_interval = models.IntegerField(default=0)
+    min_interval = models.IntegerField(null=True, blank=True, help_text='Shortest adaptive interval (seconds) while the command reports remaining work')
+    max_interval = models.IntegerField(null=True, blank=True, help_text='Longest adaptive interval (seconds) while the command reports it is idle')
+    current_interval = models.FloatField(null=True, blank=True, help_text='Current adaptive interval (seconds)')
     max_duration = models.IntegerField(null=True, blank=True)
 
-    next_run = models.DateTimeField(null=True, blank=True)
+    cron_schedule = models.CharField(max_length=256, null=True, blank=True, help_text='Cron expression (with optional leading seconds field) used instead of the repeat interval')
+    schedule_timezone = models.CharField(max_length=64, null=True, blank=True, help_text='Time zone for the cron schedule (defaults to TIME_ZONE)')
+
+    next_run = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    jitter = models.IntegerField(default=0, help_text='Maximum random delay (seconds) added to each scheduled run')
+    phase = models.IntegerField(null=True, blank=True, help_text='Offset (seconds) within the repeat interval to align scheduled runs to')
 
     postpone_alert_until = models.DateTimeField(null=True, blank=True)
 
+    misfire_policy = models.CharField(max_length=16, choices=MISFIRE_POLICIES, default='run_once', help_text='How to handle runs that start later than the misfire grace period')
+    misfire_grace = models.IntegerField(null=True, blank=True, help_text='Seconds a run may start late before it is treated as a misfire (defaults to QUICKSILVER_MISFIRE_GRACE_SECONDS)')
+    max_catch_up_runs = models.IntegerField(default=3, help_text='Most missed runs to execute when catching up')
+
+    recording_mode = models.CharField(max_length=16, choices=RECORDING_MODES, default='full', help_text='Lightweight mode aggregates successful runs instead of storing each one')
+    success_sample_rate = models.FloatField(default=0.01, help_text='Fraction of successful runs stored in full in lightweight mode')
+    running_since = models.DateTimeField(null=True, blank=True, editable=False, help_text='Start of the current run, if it is not stored as an execution')
+
+    concurrency_group = models.ForeignKey('ConcurrencyGroup', related_name='tasks', null=True, blank=True, on_delete=models.SET_NULL, help_text='Limits how many tasks in this group run at once across all queues')
+
+    rate_limit_runs = models.IntegerField(null=True, blank=True, help_text='Most runs allowed within the rate limit period')
+    rate_limit_period = models.IntegerField(null=True, blank=True, help_text='Rate limit period (seconds)')
+
+    consecutive_failures = models.IntegerField(default=0)
+    circuit_opened = models.DateTimeField(null=True, blank=True, help_text='When the circuit breaker parked this task after repeated failures')
+
+    max_backoff = models.IntegerField(null=True, blank=True, help_text='Maximum delay (seconds) before retrying a failing task (defaults to QUICKSILVER_MAX_BACKOFF_SECONDS)')
+    circuit_breaker_threshold = models.IntegerField(null=True, blank=True, help_text='Consecutive failures before the task is parked (defaults to QUICKSILVER_CIRCUIT_BREAKER_THRESHOLD)')
+
+    def clean(self):
+        try:
+            self.schedule()
+        except ScheduleError as exc:
+            raise ValidationError({'cron_schedule': str(exc)}) # pylint: disable=raise-missing-from
+
+        if self.recording_mode == 'lightweight' and self.is_rate_limited():
+            raise ValidationError({'recording_mode': 'Rate limited tasks count their stored executions and cannot use lightweight recording.'})
+
+    def save(self, *args, **kwargs): # pylint: disable=signature-differs
+        # Parked tasks without probes keep an empty next run until reset.
+
+        if self.next_run is None and self.circuit_opened is None:
+            try:
+                if self.schedule() is not None:
+                    self.next_run = self.next_run_after(clock.now())
+            except ScheduleError:
+                # Schedules are validated by clean() - the scheduler logs and skips tasks saved with an invalid one.
+
+                self.next_run = clock.now()
+
+        super(Task, self).save(*args, **kwargs) # pylint: disable=super-with-arguments
+
     def __str__(self):
         description = '%s[%s]' % (self.command, self.queue)
 
@@ -127,83 +347,300 @@ class Task(models.Model):
 
         return description
 
-    def run(self):
-        execution = Execution.objects.create(task=self, started=timezone.now())
+    def run(self, queue_depth=None, cycle_duration=None):
+        self.start_execution(queue_depth, cycle_duration).run()
 
-        execution.run()
+    def start_execution(self, queue_depth=None, cycle_duration=None):
+        now = clock.now()
 
-    def is_running(self):
-        return self.executions.filter(status='ongoing').count() > 0
+        dispatch_lag = None
 
-    def runtime_outlier_threshold(self, stddevs=2):
-        runtimes = []
+        if self.next_run is not None:
+            dispatch_lag = (now - self.next_run).total_seconds()
 
-        for execution in self.executions.exclude(ended=None):
-            runtimes.append(execution.runtime())
+        execution = Execution(task=self, started=now, scheduled=self.next_run, dispatch_lag=dispatch_lag, queue_depth=queue_depth, cycle_duration=cycle_duration)
 
-        if len(runtimes) > 5:
-            runtime_std = numpy.std(runtimes)
-            runtime_mean = numpy.mean(runtimes)
+        if self.is_lightweight():
+            # No execution row until the run ends - mark the task as running instead.
 
-            return runtime_mean + (stddevs * runtime_std)
+            self.running_since = now
 
-        return None
+            Task.objects.filter(pk=self.pk).update(running_since=now)
+        else:
+            execution.save()
 
-    def should_alert(self): # pylint: disable=too-many-return-statements,too-many-branches
-        now = timezone.now()
+        metrics.observe('quicksilver_dispatch_lag_seconds', dispatch_lag, metrics.LAG_BUCKETS, {'queue': self.queue})
+
+        return execution
+
+    def is_rate_limited(self):
+        return bool(self.rate_limit_runs) and bool(self.rate_limit_period)
+
+    def is_lightweight(self):
+        # Rate limits count stored executions, so rate limited tasks are always recorded in full.
+
+        return self.recording_mode == 'lightweight' and self.is_rate_limited() is False
+
+    def lightweight_execution(self):
+        '''
+        Returns an unsaved ongoing execution standing in for a running
+        lightweight run of the task, or None.
+        '''
+
+        if self.running_since is None:
+            return None
+
+        return Execution(task=self, started=self.running_since, status='ongoing')
+
+    def effective_interval(self):
+        if self.is_adaptive() and self.current_interval is not None:
+            return max(int(round(self.current_interval)), 1)
+
+        if self.repeat_interval < 1:
+            return 5
+
+        return self.repeat_interval
 
-        if self.postpone_alert_until is not None and now < self.postpone_alert_until:
+    def is_adaptive(self):
+        return self.min_interval is not None or self.max_interval is not None
+
+    def adapt_interval(self, work_remaining):
+        '''
+        Shrinks the interval towards min_interval while the command reports
+        remaining work and grows it towards max_interval while it is idle.
+        '''
+
+        if self.is_adaptive() is False or work_remaining is None:
+            return
+
+        factor = max(getattr(settings, 'QUICKSILVER_ADAPTIVE_INTERVAL_FACTOR', 2.0), 1.0)
+
+        interval = self.current_interval
+
+        if interval is None:
+            interval = float(self.repeat_interval if self.repeat_interval > 0 else 5)
+
+        minimum = self.min_interval if self.min_interval is not None else 1
+        maximum = self.max_interval if self.max_interval is not None else max(self.repeat_interval, minimum)
+
+        if work_remaining > 0:
+            interval = interval / factor
+        else:
+            interval = interval * factor
+
+        self.current_interval = min(max(interval, minimum), max(maximum, minimum))
+
+    def schedule(self):
+        if self.cron_schedule is None or self.cron_schedule.strip() == '':
+            return None
+
+        return parse_schedule(self.cron_schedule, self.schedule_timezone)
+
+    def next_run_after(self, finished, generator=None):
+        schedule = self.schedule()
+
+        if schedule is not None:
+            return self.adjust_next_run(schedule.next_after(finished), generator)
+
+        return self.adjust_next_run(finished + datetime.timedelta(seconds=self.effective_interval()), generator)
+
+    def adjust_next_run(self, proposed, generator=None):
+        if proposed is None:
+            return None
+
+        if self.phase is not None and self.schedule() is None:
+            # Align to the first phase slot after the previous interval, so runs keep their cadence.
+
+            interval = self.effective_interval()
+
+            previous = calendar.timegm(proposed.utctimetuple()) + (proposed.microsecond / 1000000.0) - interval
+            slot = ((math.floor((previous - self.phase) / interval) + 1) * interval) + self.phase
+
+            proposed = proposed + datetime.timedelta(seconds=(slot - previous - interval))
+
+        if self.jitter > 0:
+            if generator is None:
+                generator = random
+
+            proposed = proposed + datetime.timedelta(seconds=generator.uniform(0, self.jitter)) # nosec
+
+        return proposed
+
+    def is_misfire(self, scheduled, started):
+        if scheduled is None:
             return False
 
-        open_execution = self.executions.filter(ended=None).order_by('started').first()
-        outlier_threshold = self.runtime_outlier_threshold()
+        grace = self.misfire_grace
 
-        if open_execution is not None:
-            runtime = open_execution.runtime()
+        if grace is None:
+            grace = getattr(settings, 'QUICKSILVER_MISFIRE_GRACE_SECONDS', 60)
 
-            if outlier_threshold is not None:
-                if open_execution.runtime() > outlier_threshold:
-                    return True
+        return (started - scheduled).total_seconds() > grace
 
-                if self.executions.exclude(ended=None).count() < 2:
-                    return True
+    def next_slot_after(self, scheduled, now):
+        '''
+        Returns the first slot of the task's schedule after now, keeping the
+        cadence of the provided (missed) scheduled time.
+        '''
 
-            alert_seconds = 60
+        schedule = self.schedule()
 
-            try:
-                alert_seconds = settings.QUICKSILVER_MIN_TASK_ALERT_RUNTIME_SECONDS
-            except AttributeError:
-                pass
+        if schedule is not None:
+            return self.adjust_next_run(schedule.next_after(now))
 
-            if runtime < alert_seconds:
-                return False
+        interval = self.effective_interval()
 
-            try:
-                if runtime > settings.QUICKSILVER_MAX_TASK_RUNTIME_SECONDS:
-                    return True
-            except AttributeError:
-                pass
-        elif self.next_run is not None:
-            extra_overdue_seconds = 120
+        skipped = math.floor((now - scheduled).total_seconds() / interval) + 1
 
-            try:
-                extra_overdue_seconds = settings.QUICKSILVER_MIN_TASK_ALERT_OVERDUE_SECONDS
-            except AttributeError:
-                pass
+        return scheduled + datetime.timedelta(seconds=(max(skipped, 1) * interval))
 
-            if (self.next_run + datetime.timedelta(seconds=extra_overdue_seconds)) < now:
-                other_tasks = Task.objects.filter(queue=self.queue).exclude(pk=self.pk)
+    def catch_up_slot(self, scheduled, now):
+        '''
+        Returns the earliest of the most recent max_catch_up_runs slots missed
+        between scheduled and now, or None if no slots were missed.
+        '''
 
-                others_running = False
+        limit = max(self.max_catch_up_runs, 1)
 
-                for task in other_tasks:
-                    if task.is_running():
-                        others_running = True
+        schedule = self.schedule()
 
-                if others_running is False:
-                    return True
+        if schedule is None:
+            interval = self.effective_interval()
 
-        return False
+            missed = int(math.floor((now - scheduled).total_seconds() / interval))
+
+            if missed < 1:
+                return None
+
+            return scheduled + datetime.timedelta(seconds=(max(1, missed - limit + 1) * interval))
+
+        recent_slots = collections.deque(maxlen=limit)
+
+        slot = schedule.next_after(scheduled)
+
+        for _ in range(MAX_CATCH_UP_SLOTS):
+            if slot is None or slot > now:
+                break
+
+            recent_slots.append(slot)
+
+            slot = schedule.next_after(slot)
+        else:
+            return None # Too far behind to enumerate - realign instead.
+
+        if recent_slots:
+            return recent_slots[0]
+
+        return None
+
+    def next_run_after_success(self, scheduled, started, ended, trailer=None, generator=None): # pylint: disable=too-many-arguments
+        if self.misfire_policy == 'catch_up' and self.is_misfire(scheduled, started):
+            slot = self.catch_up_slot(scheduled, ended)
+
+            if slot is not None:
+                return slot
+
+        if self.schedule() is not None:
+            # Calendar schedules take precedence over the interval-based trailer.
+
+            return self.next_run_after(ended, generator)
+
+        if trailer is not None and self.is_adaptive() is False:
+            # Times chosen by the command itself are used as provided.
+
+            return trailer
+
+        # Commands that do not print a trailer fall back to the repeat interval.
+
+        return self.next_run_after(ended, generator)
+
+    def record_failure(self, ended):
+        '''
+        Schedules the next run of a failed task, backing off exponentially and
+        parking the task once its circuit breaker threshold is reached (if
+        either is enabled).
+        '''
+
+        self.consecutive_failures += 1
+
+        next_run = self.next_run_after(ended)
+
+        backoff_factor = getattr(settings, 'QUICKSILVER_BACKOFF_FACTOR', 1.0)
+
+        max_backoff = self.max_backoff
+
+        if max_backoff is None:
+            max_backoff = getattr(settings, 'QUICKSILVER_MAX_BACKOFF_SECONDS', 3600)
+
+        if self.consecutive_failures > 1 and backoff_factor > 1:
+            interval = self.effective_interval()
+
+            delay = min(interval * (backoff_factor ** min(self.consecutive_failures - 1, 64)), max(max_backoff, interval))
+
+            backoff_until = ended + datetime.timedelta(seconds=delay)
+
+            if next_run is None or next_run < backoff_until:
+                next_run = backoff_until
+
+        threshold = self.circuit_breaker_threshold
+
+        if threshold is None:
+            threshold = getattr(settings, 'QUICKSILVER_CIRCUIT_BREAKER_THRESHOLD', None)
+
+        if threshold is not None and 0 < threshold <= self.consecutive_failures:
+            if self.circuit_opened is None:
+                self.circuit_opened = ended
+
+                logging.error('Circuit breaker opened for %s after %d consecutive failures.', self, self.consecutive_failures)
+
+                metrics.increment('quicksilver_circuit_breaker_trips_total', {'queue': self.queue})
+
+            # Parked tasks only run again for an occasional probe (if enabled) or when reset.
+
+            probe_seconds = getattr(settings, 'QUICKSILVER_CIRCUIT_BREAKER_PROBE_SECONDS', 3600)
+
+            next_run = None
+
+            if probe_seconds is not None:
+                next_run = ended + datetime.timedelta(seconds=probe_seconds)
+
+        self.next_run = next_run
+
+    def record_success(self):
+        if self.consecutive_failures == 0 and self.circuit_opened is None:
+            return False
+
+        if self.circuit_opened is not None:
+            logging.info('Circuit breaker closed for %s after a successful run.', self)
+
+        self.consecutive_failures = 0
+        self.circuit_opened = None
+
+        return True
+
+    def reset_circuit_breaker(self):
+        self.consecutive_failures = 0
+        self.circuit_opened = None
+
+        if self.next_run is None:
+            self.next_run = clock.now()
+
+        self.save(update_fields=['consecutive_failures', 'circuit_opened', 'next_run'])
+
+    def circuit_breaker_state(self):
+        if self.circuit_opened is not None:
+            return 'open'
+
+        if self.consecutive_failures > 0:
+            return 'backing off'
+
+        return 'closed'
+
+    def is_running(self):
+        return self.running_since is not None or self.executions.filter(status='ongoing').count() > 0
+
+    def runtime_outlier_threshold(self):
+        return cached_runtime_threshold(self.pk)
 
     def alert(self): # pylint: disable=too-many-locals
         now = timezone.now()
@@ -228,6 +665,9 @@ class Task(models.Model):
 
         open_execution = self.executions.filter(ended=None).order_by('started').first()
 
+        if open_execution is None:
+            open_execution = self.lightweight_execution()
+
         if open_execution is not None:
             if open_execution.runtime() > 10:
                 context = {
@@ -247,6 +687,8 @@ class Task(models.Model):
                 email = EmailMessage(subject, message, from_addr, admins, headers={'Reply-To': admins[0]})
                 email.send()
 
+                metrics.increment('quicksilver_alert_emails_total', {'kind': 'runtime'})
+
                 alerted = True
         elif self.next_run is not None and self.next_run < now:
             context = {
@@ -263,6 +705,8 @@ class Task(models.Model):
             email = EmailMessage(subject, message, from_addr, admins, headers={'Reply-To': admins[0]})
             email.send()
 
+            metrics.increment('quicksilver_alert_emails_total', {'kind': 'overdue'})
+
             alerted = True
 
         if alerted:
@@ -288,7 +732,7 @@ class Task(models.Model):
         return max_duration
 
 @python_2_unicode_compatible
-class Execution(models.Model):
+class Execution(models.Model): # pylint: disable=too-many-instance-attributes
     task = models.ForeignKey(Task, related_name='executions', on_delete=models.CASCADE)
 
     started = models.DateTimeField()
@@ -296,75 +740,291 @@ class Execution(models.Model):
     output = models.TextField(max_length=1048576, null=True, blank=True)
     status = models.CharField(max_length=64, choices=RUN_STATUSES, default='pending')
 
+    output_compressed = models.BinaryField(null=True, blank=True, editable=False)
+    output_encoding = models.CharField(max_length=16, null=True, blank=True, editable=False, help_text='Compression of the stored output')
+
+    # Reported through quicksilver.results
+
+    reported_next_run = models.DateTimeField(null=True, blank=True)
+    work_remaining = models.FloatField(null=True, blank=True)
+    items_processed = models.IntegerField(null=True, blank=True)
+    progress = models.FloatField(null=True, blank=True, help_text='Reported progress (percent)')
+    counters = models.TextField(null=True, blank=True, help_text='Counters reported by the command (JSON)')
+
     total_runtime = models.FloatField(null=True, blank=True, verbose_name='runtime')
 
+    scheduled = models.DateTimeField(null=True, blank=True)
+    dispatch_lag = models.FloatField(null=True, blank=True, help_text='Seconds between the scheduled and actual start')
+    queue_depth = models.IntegerField(null=True, blank=True, help_text='Overdue tasks waiting in the queue at dispatch')
+    cycle_duration = models.FloatField(null=True, blank=True, help_text='Duration of the previous scheduler cycle (seconds)')
+
+    rolled_up = models.BooleanField(default=False, db_index=True, help_text='Already counted in the execution rollups')
+
+    class Meta: # pylint: disable=too-few-public-methods, old-style-class, no-init
+        indexes = [
+            models.Index(fields=['task', 'started']),
+            models.Index(fields=['started']),
+            models.Index(fields=['status', 'started']),
+        ]
+
     def __str__(self):
         return str(self.task)
 
     def run(self):
         logging.debug('-' * 72)
 
+        orig_stdout = None
+        qs_out = None
+
+        try:
+            qs_out = self.begin()
+
+            if is_async_command(self.task.command):
+                # Outside of an event loop runner - no streaming, since the
+                # ORM may not be called from the command's event loop.
+
+                qs_out.on_chunk = None
+
+            orig_stdout = workers.redirect_stdout(qs_out)
+
+            qs_out.start_streaming()
+
+            result = results.begin(self.save_progress if self.pk is not None and qs_out.on_chunk is not None else None)
+
+            args, options = self.command_arguments()
+
+            max_duration = self.task.get_max_duration()
+
+            if max_duration is not None:
+                with execution_timeout(max_duration):
+                    run_command(self.task.command, *args, **options)
+            else:
+                run_command(self.task.command, *args, **options)
+
+            workers.restore_stdout(orig_stdout)
+
+            orig_stdout = None
+
+            qs_out.stop_streaming()
+
+            results.end()
+
+            self.finish(qs_out.getvalue().decode('utf-8').strip(), result)
+        except: # pylint: disable=bare-except
+            if orig_stdout is not None:
+                workers.restore_stdout(orig_stdout)
+
+            if qs_out is not None:
+                qs_out.stop_streaming()
+
+            self.fail(traceback.format_exc(), results.end())
+
+    def begin(self):
+        '''
+        Marks the execution as running and returns the QuicksilverIO capturing
+        its output.
+        '''
+
         qs_out = QuicksilverIO()
 
+        self.status = 'ongoing'
+
+        if self.pk is not None:
+            self.save(update_fields=['status'])
+
+            # Stream output while running - see tail_output().
+
+            qs_out.on_chunk = self.write_output_chunk
+
+        return qs_out
+
+    def command_arguments(self):
         args = []
 
         if self.task.arguments is not None and self.task.arguments.strip() != '':
             args = self.task.arguments.split()
 
-        try:
-            self.status = 'ongoing'
-            self.save(update_fields=['status'])
+        return args, {'_qs_context': True, '_qs_next_interval': self.task.effective_interval()}
 
-            orig_stdout = sys.stdout
-            sys.stdout = qs_out
+    def finish(self, output, result):
+        '''
+        Records a successful run with its captured output and reported result,
+        and schedules the task's next run.
+        '''
 
-            interval = self.task.repeat_interval
+        if self.status == 'ongoing':
+            self.status = 'success'
 
-            if interval < 1:
-                interval = 5
+        self.ended = clock.now()
+        self.total_runtime = (self.ended - self.started).total_seconds()
 
-            max_duration = self.task.get_max_duration()
+        self.set_output(output)
+        self.set_result(result)
 
-            if max_duration is not None:
-                with ExecutionTimeout(seconds=max_duration):
-                    call_command(self.task.command, *args, _qs_context=True, _qs_next_interval=interval)
-            else:
-                call_command(self.task.command, *args, _qs_context=True, _qs_next_interval=interval)
+        if self.pk is not None:
+            self.save(update_fields=['status', 'ended', 'total_runtime'] + OUTPUT_FIELDS + RESULT_FIELDS)
 
-            sys.stdout = orig_stdout
+            self.clear_output_chunks()
+        else:
+            # Lightweight mode - aggregate the run, keeping only a sample in full.
 
-            if self.status == 'ongoing':
-                self.status = 'success'
+            record_rollup(self)
 
-            self.ended = timezone.now()
+            self.rolled_up = True
 
-            self.output = qs_out.getvalue().decode('utf-8').strip()
-            self.save(update_fields=['status', 'ended', 'output'])
+            if random.random() < self.task.success_sample_rate: # nosec
+                self.save()
 
-            output_lines = self.output.splitlines()
+        if self.pk is not None:
+            index_output(self)
 
-            if output_lines:
-                last_line = output_lines[-1]
+        self.record_metrics()
 
-                if last_line.startswith('_qs_next_run:'):
-                    self.task.next_run = arrow.get(last_line.replace('_qs_next_run:', '').strip()).datetime
+        self.task.record_success()
 
-                    self.task.save()
-            else:
+        trailer = result.next_run
+        work_remaining = result.work_remaining
+
+        if result.reported() is False:
+            # Commands without @handle_schedule may still print trailers.
+
+            trailer, work_remaining = parse_output_trailer(output)
+
+            if trailer is None and self.task.schedule() is None:
                 logging.error('Task not Quicksilver-enabled: %s', self.task)
 
-        except: # pylint: disable=bare-except
-            self.output = 'Task exception %s:\n\n%s' % (self.task, traceback.format_exc())
+        self.task.adapt_interval(work_remaining)
+
+        self.task.next_run = self.task.next_run_after_success(self.scheduled, self.started, self.ended, trailer)
+
+        self.task.running_since = None
+        self.task.save()
+
+    def fail(self, details, result):
+        '''
+        Records a failed run - details is the formatted exception.
+        '''
+
+        output = 'Task exception %s:\n\n%s' % (self.task, details)
+
+        logging.error(output)
+
+        self.set_output(output)
+        self.set_result(result)
+
+        self.status = 'error'
+        self.ended = clock.now()
+        self.total_runtime = (self.ended - self.started).total_seconds()
+
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=['status', 'ended', 'total_runtime'] + OUTPUT_FIELDS + RESULT_FIELDS)
+
+            self.clear_output_chunks()
+
+        index_output(self)
+
+        self.record_metrics()
+
+        self.task.record_failure(self.ended)
+
+        self.task.running_since = None
+        self.task.save()
+
+    def set_result(self, result):
+        if result is None:
+            return
+
+        self.reported_next_run = result.next_run
+        self.work_remaining = result.work_remaining
+        self.items_processed = result.items_processed
+        self.progress = result.progress
+        self.counters = json.dumps(result.counters, sort_keys=True) if result.counters else None
+
+    def save_progress(self, progress):
+        Execution.objects.filter(pk=self.pk).update(progress=progress)
+
+    def get_counters(self):
+        if self.counters is None:
+            return {}
+
+        return json.loads(self.counters)
+
+    def write_output_chunk(self, offset, content):
+        try:
+            ExecutionOutputChunk.objects.create(execution=self, offset=offset, content=content, written=timezone.now())
+
+            self.chunks_written = True # pylint: disable=attribute-defined-outside-init
+        except DatabaseError:
+            logging.exception('Unable to write output chunk of %s.', self)
+
+    def clear_output_chunks(self):
+        if getattr(self, 'chunks_written', False):
+            self.output_chunks.all().delete()
+
+            self.chunks_written = False # pylint: disable=attribute-defined-outside-init
+
+    def keep_streamed_output(self):
+        # Killed runs never write their captured output - keep what was streamed.
+
+        if self.pk is not None and self.output is None and self.output_compressed is None:
+            chunks = list(self.output_chunks.order_by('offset').values_list('content', flat=True))
+
+            if chunks:
+                self.set_output(''.join(chunks).strip())
+
+                self.chunks_written = True # pylint: disable=attribute-defined-outside-init
+
+    def tail_output(self, offset=0):
+        '''
+        Returns (output, next offset, complete) for output from the offset on:
+        streamed chunks while the execution runs, the stored output once it
+        has ended (complete is then True and the output is whole).
+        '''
+
+        chunks = list(self.output_chunks.filter(offset__gte=self.output_chunks.filter(offset__lte=offset).aggregate(start=models.Max('offset'))['start'] or 0).order_by('offset').values_list('offset', 'content'))
+
+        if self.ended is not None and not chunks:
+            output = self.get_output() or ''
+
+            return output, len(output), True
+
+        content = ''.join(chunk[1] for chunk in chunks)
+
+        if not chunks:
+            return '', offset, False
+
+        start = chunks[0][0]
+
+        return content[max(offset - start, 0):], max(start + len(content), offset), False
+
+    def set_output(self, output):
+        encoding, compressed = outputs.compress(output)
+
+        if compressed is None:
+            self.output = output
+            self.output_compressed = None
+            self.output_encoding = None
+        else:
+            self.output = None
+            self.output_compressed = compressed
+            self.output_encoding = encoding
 
-            logging.error(self.output)
+    def get_output(self):
+        if self.output_compressed is not None:
+            return outputs.decompress(self.output_encoding, self.output_compressed)
 
-            self.status = 'error'
-            self.ended = timezone.now()
-            self.save(update_fields=['status', 'ended', 'output'])
+        return self.output
 
-            self.task.next_run = timezone.now() + datetime.timedelta(seconds=self.task.repeat_interval)
+    def record_metrics(self):
+        metrics.increment('quicksilver_executions_total', {'task': self.task.command, 'task_id': self.task.pk, 'queue': self.task.queue, 'status': self.status})
 
-            self.task.save()
+        if self.items_processed:
+            metrics.increment('quicksilver_items_processed_total', {'task': self.task.command, 'task_id': self.task.pk, 'queue': self.task.queue}, self.items_processed)
+
+        if self.ended is not None:
+            metrics.observe('quicksilver_execution_runtime_seconds', (self.ended - self.started).total_seconds(), metrics.RUNTIME_BUCKETS, {'queue': self.task.queue})
 
     def runtime(self):
         if self.ended is None:
@@ -376,25 +1036,50 @@ class Execution(models.Model):
 
             if self.ended is not None:
                 self.total_runtime = (self.ended - self.started).total_seconds()
-                self.save(update_fields=['total_runtime'])
+
+                if self.pk is not None:
+                    self.save(update_fields=['total_runtime'])
 
                 return (self.ended - self.started).total_seconds()
 
             self.total_runtime = (timezone.now() - self.started).total_seconds()
-            self.save(update_fields=['total_runtime'])
+
+            if self.pk is not None:
+                self.save(update_fields=['total_runtime'])
 
             return (timezone.now() - self.started).total_seconds()
 
         return self.total_runtime
 
+    def save_killed(self):
+        self.status = 'killed'
+        self.ended = timezone.now()
+
+        if self.pk is None:
+            # A lightweight run - killed runs are stored in full.
+
+            self.save()
+
+            Task.objects.filter(pk=self.task.pk, running_since=self.started).update(running_since=None)
+
+            self.task.running_since = None
+
+            return
+
+        self.keep_streamed_output()
+
+        self.save(update_fields=['status', 'ended'] + OUTPUT_FIELDS)
+
+        self.clear_output_chunks()
+
     def kill_if_stuck(self, task_queue_start=None):
         if self.ended is not None:
             return False
 
         if task_queue_start is not None and self.started < task_queue_start:
-            self.status = 'killed'
-            self.ended = timezone.now()
-            self.save(update_fields=['status', 'ended'])
+            self.save_killed()
+
+            index_output(self)
 
             host = settings.ALLOWED_HOSTS[0]
 
@@ -413,6 +1098,10 @@ class Execution(models.Model):
             email = EmailMessage(subject, message, from_addr, admins, headers={'Reply-To': admins[0]})
             email.send()
 
+            metrics.increment('quicksilver_alert_emails_total', {'kind': 'stale'})
+
+            self.record_metrics()
+
             return True
 
         max_duration = self.task.get_max_duration()
@@ -420,9 +1109,9 @@ class Execution(models.Model):
 
         if max_duration is not None and run_duration is not None:
             if run_duration > max_duration:
-                self.status = 'killed'
-                self.ended = timezone.now()
-                self.save(update_fields=['status', 'ended'])
+                self.save_killed()
+
+                index_output(self)
 
                 context = {
                     'execution': self,
@@ -440,6 +1129,191 @@ class Execution(models.Model):
                 email = EmailMessage(subject, message, from_addr, admins, headers={'Reply-To': admins[0]})
                 email.send()
 
+                metrics.increment('quicksilver_alert_emails_total', {'kind': 'killed'})
+
+                self.record_metrics()
+
                 return True
 
         return False
+
+@python_2_unicode_compatible
+class ExecutionOutputChunk(models.Model):
+    class Meta: # pylint: disable=too-few-public-methods, old-style-class, no-init
+        unique_together = (('execution', 'offset',),)
+
+    execution = models.ForeignKey(Execution, related_name='output_chunks', on_delete=models.CASCADE)
+
+    offset = models.IntegerField(help_text='Position of the chunk in the output (characters)')
+    content = models.TextField()
+    written = models.DateTimeField()
+
+    def __str__(self):
+        return '%s @ %s' % (self.execution, self.offset)
+
+@python_2_unicode_compatible
+class AlertState(models.Model):
+    task = models.OneToOneField(Task, related_name='alert_state', on_delete=models.CASCADE)
+
+    evaluated = models.DateTimeField()
+
+    runtime_count = models.IntegerField(default=0)
+    runtime_mean = models.FloatField(null=True, blank=True)
+    runtime_std = models.FloatField(null=True, blank=True)
+    outlier_threshold = models.FloatField(null=True, blank=True)
+
+    open_runtime = models.FloatField(null=True, blank=True)
+    since_last_run = models.FloatField(null=True, blank=True)
+
+    overdue = models.BooleanField(default=False)
+    outlier = models.BooleanField(default=False)
+    max_runtime_exceeded = models.BooleanField(default=False)
+    should_alert = models.BooleanField(default=False)
+
+    issue = models.CharField(max_length=1024, null=True, blank=True)
+    issue_threshold = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.task)
+
+    def status_issue(self):
+        if self.issue is None:
+            return None
+
+        if self.issue_threshold is not None:
+            return {
+                'task': str(self.task),
+                'outlier_threshold': self.issue_threshold,
+                'overdue': self.since_last_run,
+            }
+
+        return {
+            'task': str(self.task),
+            'issue': self.issue,
+        }
+
+@python_2_unicode_compatible
+class QueueState(models.Model):
+    queue = models.CharField(max_length=128, unique=True)
+
+    updated = models.DateTimeField(null=True, blank=True)
+    cycle_duration = models.FloatField(null=True, blank=True)
+    queue_depth = models.IntegerField(null=True, blank=True)
+
+    evaluated = models.DateTimeField(null=True, blank=True)
+    lag_count = models.IntegerField(default=0)
+    lag_p50 = models.FloatField(null=True, blank=True, verbose_name='lag (50th percentile)')
+    lag_p90 = models.FloatField(null=True, blank=True, verbose_name='lag (90th percentile)')
+    lag_p99 = models.FloatField(null=True, blank=True, verbose_name='lag (99th percentile)')
+    lag_max = models.FloatField(null=True, blank=True, verbose_name='lag (maximum)')
+
+    def __str__(self):
+        return str(self.queue)
+
+    def status_summary(self):
+        return {
+            'cycle_duration': self.cycle_duration,
+            'queue_depth': self.queue_depth,
+            'updated': self.updated.isoformat() if self.updated is not None else None,
+            'dispatch_lag': {
+                'count': self.lag_count,
+                'p50': self.lag_p50,
+                'p90': self.lag_p90,
+                'p99': self.lag_p99,
+                'max': self.lag_max,
+            },
+        }
+
+@python_2_unicode_compatible
+class MetricValue(models.Model):
+    name = models.CharField(max_length=256)
+    labels = models.TextField(blank=True, default='')
+
+    # Labels include task commands of any length - rows are unique by hash.
+
+    key = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the name and labels')
+
+    value = models.FloatField(default=0)
+    updated = models.DateTimeField()
+
+    def __str__(self):
+        if self.labels:
+            return '%s{%s}' % (self.name, self.labels)
+
+        return str(self.name)
+
+@python_2_unicode_compatible
+class ConcurrencyGroup(models.Model):
+    name = models.CharField(max_length=128, unique=True)
+    max_concurrent = models.IntegerField(default=1, help_text='Most tasks in this group that may run at once')
+
+    def __str__(self):
+        return str(self.name)
+
+@python_2_unicode_compatible
+class ConcurrencySlot(models.Model):
+    class Meta: # pylint: disable=too-few-public-methods, old-style-class, no-init
+        unique_together = (('group', 'slot',),)
+
+    group = models.ForeignKey(ConcurrencyGroup, related_name='slots', on_delete=models.CASCADE)
+    slot = models.IntegerField()
+
+    holder = models.CharField(max_length=64, null=True, blank=True)
+    task = models.ForeignKey(Task, related_name='concurrency_slots', null=True, blank=True, on_delete=models.SET_NULL)
+    acquired = models.DateTimeField(null=True, blank=True)
+    expires = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s[%s]' % (self.group.name, self.slot)
+
+@python_2_unicode_compatible
+class ExecutionRollup(models.Model):
+    class Meta: # pylint: disable=too-few-public-methods, old-style-class, no-init
+        unique_together = (('task', 'period', 'period_start',),)
+
+    task = models.ForeignKey(Task, related_name='rollups', on_delete=models.CASCADE)
+
+    period = models.IntegerField(help_text='Bucket length (seconds)')
+    period_start = models.DateTimeField()
+
+    count = models.IntegerField(default=0)
+    success_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    killed_count = models.IntegerField(default=0)
+
+    runtime_sum = models.FloatField(default=0, help_text='Total runtime of successful runs (seconds)')
+    runtime_sum_squares = models.FloatField(default=0)
+    runtime_min = models.FloatField(null=True, blank=True)
+    runtime_max = models.FloatField(null=True, blank=True)
+    runtime_histogram = models.TextField(default='{}', help_text='Log-scaled histogram of successful runtimes (JSON)')
+
+    last_ended = models.DateTimeField(null=True, blank=True)
+    last_success = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s @ %s' % (self.task, self.period_start.isoformat())
+
+    def histogram(self):
+        histogram = {}
+
+        for bucket, count in json.loads(self.runtime_histogram or '{}').items():
+            histogram[int(bucket)] = count
+
+        return histogram
+
+    def runtime_mean(self):
+        if self.success_count < 1:
+            return None
+
+        return self.runtime_sum / self.success_count
+
+    def runtime_std(self):
+        if self.success_count < 1:
+            return None
+
+        mean = self.runtime_sum / self.success_count
+
+        return math.sqrt(max((self.runtime_sum_squares / self.success_count) - (mean * mean), 0))
+
+    def runtime_quantile(self, quantile):
+        return histogram_quantile(self.histogram(), quantile, self.runtime_min, self.runtime_max)
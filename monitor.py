@@ -0,0 +1,263 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import logging
+
+import numpy
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import AlertState, Execution, ExecutionRollup, QueueState, Task
+from .outliers import group_bounds, grouped_quantile, runtime_statistics
+from .rollups import rollup_period
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+def to_timestamp(when):
+    if when is None:
+        return numpy.nan
+
+    return calendar.timegm(when.utctimetuple()) + (when.microsecond / 1000000.0)
+
+def task_index(task_ids, execution_task_ids):
+    # task_ids is sorted by primary key, so positions can be looked up in bulk.
+
+    positions = numpy.searchsorted(task_ids, execution_task_ids)
+    positions = numpy.clip(positions, 0, max(len(task_ids) - 1, 0))
+
+    known = task_ids[positions] == execution_task_ids
+
+    return positions[known], known
+
+def backfill_runtimes(batch_size=1000):
+    # Executions recorded before runtimes were stored on completion.
+
+    updated = 0
+
+    for execution in Execution.objects.exclude(ended=None).filter(total_runtime=None).only('pk', 'started', 'ended', 'total_runtime')[:batch_size]:
+        execution.runtime()
+
+        updated += 1
+
+    return updated
+
+def evaluate_alert_states(now=None, send_alerts=True): # pylint: disable=too-many-locals, too-many-statements, too-many-branches
+    '''
+    Evaluates the overdue, outlier and maximum runtime conditions for every
+    task in a single pass and records the results in the AlertState table.
+    '''
+
+    if now is None:
+        now = timezone.now()
+
+    now_ts = to_timestamp(now)
+
+    backfill_runtimes()
+
+    tasks = list(Task.objects.all().order_by('pk').values_list('pk', 'queue', 'next_run', 'repeat_interval', 'postpone_alert_until', 'circuit_opened', 'consecutive_failures'))
+
+    if not tasks:
+        return []
+
+    task_count = len(tasks)
+
+    task_ids = numpy.array([task[0] for task in tasks], dtype=numpy.int64)
+    queue_names, queue_index = numpy.unique([task[1] for task in tasks], return_inverse=True)
+    next_runs = numpy.array([to_timestamp(task[2]) for task in tasks], dtype=numpy.float64)
+    intervals = numpy.array([task[3] for task in tasks], dtype=numpy.float64)
+    postponed_until = numpy.array([to_timestamp(task[4]) for task in tasks], dtype=numpy.float64)
+
+    # Recent runtimes - robust statistics per task.
+
+    runtime_counts = numpy.zeros(task_count, dtype=numpy.int64)
+    runtime_means = numpy.full(task_count, numpy.nan)
+    runtime_stds = numpy.full(task_count, numpy.nan)
+    outlier_thresholds = numpy.full(task_count, numpy.nan)
+
+    statistics = runtime_statistics(now=now)
+
+    positions, known = task_index(task_ids, statistics['task_ids'])
+
+    runtime_counts[positions] = statistics['counts'][known]
+    runtime_means[positions] = statistics['means'][known]
+    runtime_stds[positions] = statistics['stds'][known]
+    outlier_thresholds[positions] = statistics['thresholds'][known]
+
+    # Open executions - oldest start and running state per task.
+
+    open_starts = numpy.full(task_count, numpy.inf)
+    running = numpy.zeros(task_count, dtype=bool)
+
+    open_executions = list(Execution.objects.filter(ended=None).values_list('task_id', 'started', 'status'))
+
+    # Running lightweight tasks have no execution row yet.
+
+    open_executions.extend((task_id, running_since, 'ongoing',) for task_id, running_since in Task.objects.exclude(running_since=None).values_list('pk', 'running_since'))
+
+    if open_executions:
+        positions, known = task_index(task_ids, numpy.array([open_execution[0] for open_execution in open_executions], dtype=numpy.int64))
+        starts = numpy.array([to_timestamp(open_execution[1]) for open_execution in open_executions], dtype=numpy.float64)[known]
+        ongoing = numpy.array([open_execution[2] == 'ongoing' for open_execution in open_executions], dtype=bool)[known]
+
+        numpy.minimum.at(open_starts, positions, starts)
+        running[positions[ongoing]] = True
+
+    has_open = numpy.isfinite(open_starts)
+    open_runtimes = numpy.where(has_open, now_ts - open_starts, numpy.nan)
+
+    queue_running = numpy.bincount(queue_index, weights=running, minlength=len(queue_names))
+    others_running = (queue_running[queue_index] - running) > 0
+
+    # Latest completion and recorded runs per task.
+
+    last_ended = numpy.full(task_count, numpy.nan)
+    execution_counts = numpy.zeros(task_count, dtype=numpy.int64)
+
+    latest = list(Execution.objects.values('task_id').annotate(latest=Max('ended'), total=Count('pk', filter=Q(rolled_up=False))).values_list('task_id', 'latest', 'total'))
+
+    # Runs aggregated by lightweight recording.
+
+    latest.extend(ExecutionRollup.objects.filter(period=rollup_period()).values('task_id').annotate(latest=Max('last_ended'), total=Sum('count')).values_list('task_id', 'latest', 'total'))
+
+    if latest:
+        positions, known = task_index(task_ids, numpy.array([item[0] for item in latest], dtype=numpy.int64))
+        numpy.fmax.at(last_ended, positions, numpy.array([to_timestamp(item[1]) for item in latest], dtype=numpy.float64)[known])
+        numpy.add.at(execution_counts, positions, numpy.array([item[2] for item in latest], dtype=numpy.int64)[known])
+
+    since_last_run = now_ts - last_ended
+
+    # Alert conditions
+
+    min_alert_seconds = getattr(settings, 'QUICKSILVER_MIN_TASK_ALERT_RUNTIME_SECONDS', 60)
+    max_runtime_seconds = getattr(settings, 'QUICKSILVER_MAX_TASK_RUNTIME_SECONDS', None)
+    extra_overdue_seconds = getattr(settings, 'QUICKSILVER_MIN_TASK_ALERT_OVERDUE_SECONDS', 120)
+
+    with numpy.errstate(invalid='ignore'):
+        postponed = postponed_until > now_ts
+
+        outlier = has_open & (open_runtimes > outlier_thresholds)
+
+        if max_runtime_seconds is not None:
+            max_runtime_exceeded = has_open & (open_runtimes >= min_alert_seconds) & (open_runtimes > max_runtime_seconds)
+        else:
+            max_runtime_exceeded = numpy.zeros(task_count, dtype=bool)
+
+        overdue = ~has_open & ((next_runs + extra_overdue_seconds) < now_ts) & ~others_running
+
+        should_alert = ~postponed & (outlier | max_runtime_exceeded | overdue)
+
+        # Conditions reported by the status endpoint.
+
+        past_due = next_runs <= now_ts
+        issue_thresholds = (intervals * 2) + outlier_thresholds
+        late_issue = past_due & ~running & (since_last_run > issue_thresholds) & ~others_running
+        sparse_issue = past_due & running & (execution_counts < 2)
+
+    existing = {}
+
+    for state in AlertState.objects.all():
+        existing[state.task_id] = state
+
+    to_create = []
+    to_update = []
+
+    def as_float(value):
+        if numpy.isnan(value):
+            return None
+
+        return float(value)
+
+    for index in range(task_count):
+        state = existing.get(int(task_ids[index]), None)
+
+        if state is None:
+            state = AlertState(task_id=int(task_ids[index]))
+
+            to_create.append(state)
+        else:
+            to_update.append(state)
+
+        state.evaluated = now
+        state.runtime_count = int(runtime_counts[index])
+        state.runtime_mean = as_float(runtime_means[index])
+        state.runtime_std = as_float(runtime_stds[index])
+        state.outlier_threshold = as_float(outlier_thresholds[index])
+        state.open_runtime = as_float(open_runtimes[index])
+        state.since_last_run = as_float(since_last_run[index])
+        state.overdue = bool(overdue[index])
+        state.outlier = bool(outlier[index])
+        state.max_runtime_exceeded = bool(max_runtime_exceeded[index])
+        state.should_alert = bool(should_alert[index])
+        state.issue = None
+        state.issue_threshold = None
+
+        if tasks[index][5] is not None:
+            state.issue = 'Parked by circuit breaker since %s after %d consecutive failures.' % (tasks[index][5].isoformat(), tasks[index][6])
+        elif late_issue[index]:
+            state.issue = 'Overdue since last run.'
+            state.issue_threshold = float(issue_thresholds[index])
+        elif sparse_issue[index]:
+            state.issue = 'Only %d runs recorded.' % execution_counts[index]
+
+    if to_create:
+        AlertState.objects.bulk_create(to_create)
+
+    if to_update:
+        AlertState.objects.bulk_update(to_update, ['evaluated', 'runtime_count', 'runtime_mean', 'runtime_std', 'outlier_threshold', 'open_runtime', 'since_last_run', 'overdue', 'outlier', 'max_runtime_exceeded', 'should_alert', 'issue', 'issue_threshold'], batch_size=500)
+
+    if send_alerts:
+        for task in Task.objects.filter(pk__in=task_ids[should_alert].tolist()):
+            try:
+                task.alert()
+            except: # pylint: disable=bare-except
+                logger.exception('Unable to send alert for %s.', task)
+
+    return to_create + to_update
+
+def evaluate_queue_states(now=None):
+    '''
+    Computes dispatch lag percentiles per queue over the recent window and
+    records them in the QueueState table.
+    '''
+
+    if now is None:
+        now = timezone.now()
+
+    window_seconds = getattr(settings, 'QUICKSILVER_DISPATCH_LAG_WINDOW_SECONDS', 3600)
+
+    rows = list(Execution.objects.filter(started__gte=(now - datetime.timedelta(seconds=window_seconds))).exclude(dispatch_lag=None).values_list('task__queue', 'dispatch_lag'))
+
+    queue_names, queue_index = numpy.unique([row[0] for row in rows], return_inverse=True)
+    lags = numpy.array([row[1] for row in rows], dtype=numpy.float64)
+
+    order = numpy.lexsort((lags, queue_index))
+
+    starts, counts = group_bounds(queue_index[order])
+    lags = lags[order]
+
+    percentiles = {}
+
+    for quantile in (0.5, 0.9, 0.99, 1.0):
+        percentiles[quantile] = grouped_quantile(lags, starts, counts, quantile)
+
+    evaluated = []
+
+    for index, queue in enumerate(queue_names.tolist()):
+        state = QueueState.objects.update_or_create(queue=queue, defaults={
+            'evaluated': now,
+            'lag_count': int(counts[index]),
+            'lag_p50': float(percentiles[0.5][index]),
+            'lag_p90': float(percentiles[0.9][index]),
+            'lag_p99': float(percentiles[0.99][index]),
+            'lag_max': float(percentiles[1.0][index]),
+        })[0]
+
+        evaluated.append(state)
+
+    QueueState.objects.exclude(queue__in=queue_names.tolist()).update(evaluated=now, lag_count=0, lag_p50=None, lag_p90=None, lag_p99=None, lag_max=None)
+
+    return evaluated
@@ -0,0 +1,280 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+
+import django
+import numpy
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .rollups import rollup_statistics
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Scale factor making the median absolute deviation comparable to a standard
+# deviation for normally-distributed runtimes.
+
+MAD_SCALE = 1.4826
+
+THRESHOLD_CACHE_PREFIX = 'quicksilver_runtime_threshold_'
+
+def outlier_settings():
+    return {
+        'window': getattr(settings, 'QUICKSILVER_OUTLIER_WINDOW', 100),
+        'window_days': getattr(settings, 'QUICKSILVER_OUTLIER_WINDOW_DAYS', 7),
+        'statuses': tuple(getattr(settings, 'QUICKSILVER_OUTLIER_STATUSES', ('success',))),
+        'method': getattr(settings, 'QUICKSILVER_OUTLIER_METHOD', 'mad'),
+        'mad_multiplier': getattr(settings, 'QUICKSILVER_OUTLIER_MAD_MULTIPLIER', 3.0),
+        'quantile': getattr(settings, 'QUICKSILVER_OUTLIER_QUANTILE', 0.99),
+        'min_samples': getattr(settings, 'QUICKSILVER_OUTLIER_MIN_SAMPLES', 6),
+        'min_margin': getattr(settings, 'QUICKSILVER_OUTLIER_MIN_MARGIN_SECONDS', 1.0),
+        'cache_seconds': getattr(settings, 'QUICKSILVER_OUTLIER_CACHE_SECONDS', 300),
+        'use_rollups': getattr(settings, 'QUICKSILVER_OUTLIER_USE_ROLLUPS', True),
+    }
+
+def group_bounds(group_ids):
+    if len(group_ids) == 0: # pylint: disable=len-as-condition
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    starts = numpy.flatnonzero(numpy.r_[True, group_ids[1:] != group_ids[:-1]])
+    counts = numpy.diff(numpy.r_[starts, len(group_ids)])
+
+    return starts, counts
+
+def grouped_median(sorted_values, starts, counts):
+    # Values must be sorted in ascending order within each group.
+
+    return 0.5 * (sorted_values[starts + ((counts - 1) // 2)] + sorted_values[starts + (counts // 2)])
+
+def grouped_quantile(sorted_values, starts, counts, quantile):
+    position = (counts - 1) * quantile
+    lower = numpy.floor(position).astype(numpy.int64)
+    upper = numpy.ceil(position).astype(numpy.int64)
+    fraction = position - lower
+
+    return sorted_values[starts + lower] + ((sorted_values[starts + upper] - sorted_values[starts + lower]) * fraction)
+
+def batched_runtime_statistics(group_ids, runtimes, options=None): # pylint: disable=too-many-locals
+    '''
+    Computes robust runtime statistics for many tasks at once.
+
+    group_ids must be sorted ascending, with the runtimes of each group ordered
+    from most to least recent. Returns parallel arrays keyed by the unique
+    group identifiers.
+    '''
+
+    if options is None:
+        options = outlier_settings()
+
+    group_ids = numpy.asarray(group_ids, dtype=numpy.int64)
+    runtimes = numpy.asarray(runtimes, dtype=numpy.float64)
+
+    # Keep the most recent window of runtimes per task.
+
+    starts, counts = group_bounds(group_ids)
+
+    rank = numpy.arange(len(group_ids)) - numpy.repeat(starts, counts)
+    recent = rank < options['window']
+
+    group_ids = group_ids[recent]
+    runtimes = runtimes[recent]
+
+    order = numpy.lexsort((runtimes, group_ids))
+
+    group_ids = group_ids[order]
+    runtimes = runtimes[order]
+
+    starts, counts = group_bounds(group_ids)
+
+    unique_ids = group_ids[starts]
+
+    sums = numpy.add.reduceat(runtimes, starts) if len(starts) > 0 else numpy.zeros(0) # pylint: disable=len-as-condition
+    squares = numpy.add.reduceat(runtimes * runtimes, starts) if len(starts) > 0 else numpy.zeros(0) # pylint: disable=len-as-condition
+
+    means = sums / counts
+    stds = numpy.sqrt(numpy.maximum((squares / counts) - (means * means), 0))
+
+    medians = grouped_median(runtimes, starts, counts)
+
+    deviations = numpy.abs(runtimes - numpy.repeat(medians, counts))
+    deviations = deviations[numpy.lexsort((deviations, group_ids))]
+
+    mads = grouped_median(deviations, starts, counts) * MAD_SCALE
+
+    if options['method'] == 'quantile':
+        thresholds = grouped_quantile(runtimes, starts, counts, options['quantile'])
+    else:
+        thresholds = medians + (options['mad_multiplier'] * mads)
+
+    # Identical runtimes produce a zero MAD - leave some headroom above the median.
+
+    thresholds = numpy.maximum(thresholds, medians + options['min_margin'])
+    thresholds = numpy.where(counts >= options['min_samples'], thresholds, numpy.nan)
+
+    return {
+        'task_ids': unique_ids,
+        'counts': counts,
+        'means': means,
+        'stds': stds,
+        'medians': medians,
+        'mads': mads,
+        'thresholds': thresholds,
+    }
+
+def merge_rollup_statistics(statistics, task_ids, now, options): # pylint: disable=too-many-locals
+    '''
+    Fills in statistics from the execution rollups for tasks with too few
+    recent executions (e.g. lightweight tasks, or after pruning).
+    '''
+
+    sufficient = set(statistics['task_ids'][statistics['counts'] >= options['min_samples']].tolist())
+
+    candidates = None
+
+    if task_ids is not None:
+        candidates = [task_id for task_id in task_ids if task_id not in sufficient]
+
+        if not candidates:
+            return statistics
+
+    since = now - datetime.timedelta(days=(options['window_days'] if options['window_days'] is not None else 30))
+
+    rolled = rollup_statistics(since, candidates, options['quantile'])
+
+    rolled_ids = sorted([task_id for task_id, values in rolled.items() if task_id not in sufficient and values['count'] >= options['min_samples']])
+
+    if not rolled_ids:
+        return statistics
+
+    def column(name):
+        return numpy.array([rolled[task_id][name] for task_id in rolled_ids], dtype=numpy.float64)
+
+    medians = column('median')
+    spreads = column('spread')
+
+    if options['method'] == 'quantile':
+        thresholds = column('quantile')
+    else:
+        thresholds = medians + (options['mad_multiplier'] * spreads)
+
+    thresholds = numpy.maximum(thresholds, medians + options['min_margin'])
+
+    additions = {
+        'task_ids': numpy.array(rolled_ids, dtype=numpy.int64),
+        'counts': column('count').astype(numpy.int64),
+        'means': column('mean'),
+        'stds': column('std'),
+        'medians': medians,
+        'mads': spreads,
+        'thresholds': thresholds,
+    }
+
+    keep = ~numpy.isin(statistics['task_ids'], additions['task_ids'])
+
+    merged = {}
+
+    for key, values in additions.items():
+        merged[key] = numpy.concatenate([statistics[key][keep], values.astype(statistics[key].dtype)])
+
+    order = numpy.argsort(merged['task_ids'], kind='mergesort')
+
+    for key in merged:
+        merged[key] = merged[key][order]
+
+    return merged
+
+def recent_runtimes(executions, window, task_ids=None):
+    '''
+    Returns (task_id, runtime) rows for the most recent window executions of
+    each task, ordered by task and from most to least recent. The window is
+    applied in the database - with ROW_NUMBER() where Django can filter on it
+    (4.2 and later), otherwise with one sliced query per task on the (task,
+    started) index - so frequent tasks do not load days of executions.
+    '''
+
+    if window is None:
+        return list(executions.order_by('task_id', '-started').values_list('task_id', 'total_runtime'))
+
+    if django.VERSION >= (4, 2) and connection.features.supports_over_clause:
+        ranked = executions.annotate(recent_rank=Window(expression=RowNumber(), partition_by=[F('task_id')], order_by=F('started').desc()))
+
+        return list(ranked.filter(recent_rank__lte=window).order_by('task_id', '-started').values_list('task_id', 'total_runtime'))
+
+    if task_ids is None:
+        Task = apps.get_model('quicksilver', 'Task') # pylint: disable=invalid-name
+
+        task_ids = Task.objects.order_by('pk').values_list('pk', flat=True)
+
+    rows = []
+
+    for task_id in sorted(task_ids):
+        rows.extend(executions.filter(task_id=task_id).order_by('-started').values_list('task_id', 'total_runtime')[:window])
+
+    return rows
+
+def runtime_statistics(task_ids=None, now=None, options=None):
+    '''
+    Loads the recent runtimes of all (or the provided) tasks and returns their
+    batched statistics, caching the resulting thresholds.
+    '''
+
+    Execution = apps.get_model('quicksilver', 'Execution') # pylint: disable=invalid-name
+
+    if options is None:
+        options = outlier_settings()
+
+    if now is None:
+        now = timezone.now()
+
+    executions = Execution.objects.filter(status__in=options['statuses']).exclude(total_runtime=None)
+
+    if options['window_days'] is not None:
+        executions = executions.filter(started__gte=(now - datetime.timedelta(days=options['window_days'])))
+
+    if task_ids is not None:
+        executions = executions.filter(task_id__in=list(task_ids))
+
+    rows = numpy.array(recent_runtimes(executions, options['window'], task_ids), dtype=numpy.float64).reshape(-1, 2)
+
+    statistics = batched_runtime_statistics(rows[:, 0].astype(numpy.int64), rows[:, 1], options)
+
+    if options.get('use_rollups', False):
+        statistics = merge_rollup_statistics(statistics, task_ids, now, options)
+
+    if options['cache_seconds'] > 0:
+        to_cache = {}
+
+        if task_ids is not None:
+            for task_id in task_ids:
+                to_cache[THRESHOLD_CACHE_PREFIX + str(task_id)] = -1.0
+
+        for task_id, threshold in zip(statistics['task_ids'].tolist(), statistics['thresholds'].tolist()):
+            to_cache[THRESHOLD_CACHE_PREFIX + str(task_id)] = -1.0 if numpy.isnan(threshold) else threshold
+
+        cache.set_many(to_cache, options['cache_seconds'])
+
+    return statistics
+
+def cached_runtime_threshold(task_id):
+    threshold = cache.get(THRESHOLD_CACHE_PREFIX + str(task_id))
+
+    if threshold is None:
+        statistics = runtime_statistics(task_ids=[task_id])
+
+        threshold = -1.0
+
+        if len(statistics['thresholds']) > 0 and not numpy.isnan(statistics['thresholds'][0]): # pylint: disable=len-as-condition
+            threshold = float(statistics['thresholds'][0])
+
+    if threshold < 0:
+        return None
+
+    return threshold
@@ -0,0 +1,69 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None # pylint: disable=invalid-name
+
+# When enabled, execution output above a size threshold is stored compressed -
+# with zstd (if the zstandard package is installed) or zlib - and only
+# decompressed when it is displayed. Off by default: substring searches on
+# databases without a search index cannot match compressed output.
+
+ENCODINGS = ('zlib', 'zstd',)
+
+def compression_encoding():
+    return getattr(settings, 'QUICKSILVER_OUTPUT_COMPRESSION', None)
+
+def compression_threshold():
+    return getattr(settings, 'QUICKSILVER_OUTPUT_COMPRESSION_THRESHOLD', 1024)
+
+def compress(output):
+    '''
+    Returns (encoding, compressed bytes) for output worth compressing, or
+    (None, None) if it should be stored as text.
+    '''
+
+    encoding = compression_encoding()
+
+    if output is None or encoding is None:
+        return None, None
+
+    raw = output.encode('utf-8')
+
+    if len(raw) < compression_threshold():
+        return None, None
+
+    level = getattr(settings, 'QUICKSILVER_OUTPUT_COMPRESSION_LEVEL', None)
+
+    if encoding == 'zstd' and zstandard is not None:
+        compressed = zstandard.ZstdCompressor(level=(3 if level is None else level)).compress(raw)
+    else:
+        encoding = 'zlib'
+
+        compressed = zlib.compress(raw, -1 if level is None else level)
+
+    if len(compressed) >= len(raw):
+        return None, None
+
+    return encoding, compressed
+
+def decompress(encoding, compressed):
+    compressed = bytes(compressed) # Memoryview on some databases
+
+    if encoding == 'zstd':
+        if zstandard is None:
+            return '(Output compressed with zstd - install the zstandard package to read it.)'
+
+        raw = zstandard.ZstdDecompressor().decompress(compressed)
+    elif encoding == 'zlib':
+        raw = zlib.decompress(compressed)
+    else:
+        raise ValueError('Unknown output encoding: %s' % encoding)
+
+    return raw.decode('utf-8')
@@ -0,0 +1,127 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import contextvars
+except ImportError: # Python 2
+    contextvars = None # pylint: disable=invalid-name
+
+# Structured results reported by a running command - next run, remaining work,
+# items processed, progress and named counters. Execution.run opens a result
+# for the current thread before calling the command and stores the reported
+# values in typed fields on the execution, instead of parsing trailers from the
+# captured output. Reports made outside a Quicksilver run are ignored. Results
+# belong to the current context, so concurrent asyncio tasks (and threads) each
+# see their own.
+
+if contextvars is not None:
+    CURRENT = contextvars.ContextVar('quicksilver_result', default=None)
+else:
+    CURRENT = threading.local()
+
+class TaskResult(object): # pylint: disable=useless-object-inheritance, too-few-public-methods
+    def __init__(self, on_progress=None):
+        self.next_run = None
+        self.work_remaining = None
+        self.items_processed = None
+        self.progress = None
+        self.counters = {}
+
+        self.on_progress = on_progress
+        self.last_progress = None
+
+    def reported(self):
+        return self.next_run is not None or self.work_remaining is not None or self.items_processed is not None or self.progress is not None or len(self.counters) > 0
+
+def set_current(result):
+    if contextvars is not None:
+        CURRENT.set(result)
+    else:
+        CURRENT.result = result
+
+def begin(on_progress=None):
+    result = TaskResult(on_progress)
+
+    set_current(result)
+
+    return result
+
+def end():
+    result = current()
+
+    set_current(None)
+
+    return result
+
+def current():
+    if contextvars is not None:
+        return CURRENT.get()
+
+    return getattr(CURRENT, 'result', None)
+
+def report_next_run(when):
+    '''
+    Sets when the task should run next, overriding its regular schedule.
+    '''
+
+    result = current()
+
+    if result is not None:
+        result.next_run = when
+
+def report_work_remaining(remaining):
+    '''
+    Reports how many items of work a command left behind (0 when idle), so
+    tasks with adaptive intervals run sooner or later next time.
+    '''
+
+    result = current()
+
+    if result is not None:
+        result.work_remaining = remaining
+
+def report_idle():
+    report_work_remaining(0)
+
+def report_items_processed(count, increment=True):
+    '''
+    Reports items processed by the run - added to the running total unless
+    increment is False.
+    '''
+
+    result = current()
+
+    if result is not None:
+        if increment:
+            result.items_processed = (result.items_processed or 0) + count
+        else:
+            result.items_processed = count
+
+def report_progress(percent):
+    '''
+    Reports progress (0 - 100). Running executions save it at most every
+    QUICKSILVER_PROGRESS_SECONDS seconds.
+    '''
+
+    result = current()
+
+    if result is not None:
+        result.progress = max(0.0, min(float(percent), 100.0))
+
+        now = time.time()
+
+        if result.on_progress is not None and (result.last_progress is None or (now - result.last_progress) >= getattr(settings, 'QUICKSILVER_PROGRESS_SECONDS', 5)):
+            result.last_progress = now
+
+            result.on_progress(result.progress)
+
+def increment_counter(name, value=1):
+    result = current()
+
+    if result is not None:
+        result.counters[name] = result.counters.get(name, 0) + value
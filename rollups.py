@@ -0,0 +1,413 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import json
+import logging
+import math
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Long-term execution history, aggregated per task and hour/day bucket. Finished
+# Execution rows are added incrementally (and flagged as rolled up) before they
+# are pruned, and lightweight tasks add their successful runs directly. Runtime
+# statistics cover successful runs, with a log-scaled histogram for quantiles.
+
+FINISHED_STATUSES = ('success', 'error', 'killed',)
+
+# Histogram bucket i holds runtimes in (BASE * GROWTH^(i - 1), BASE * GROWTH^i]
+# seconds - roughly 20% relative error for quantile estimates, up to ~50 days.
+
+HISTOGRAM_BASE = 0.001
+HISTOGRAM_GROWTH = math.sqrt(2)
+HISTOGRAM_BUCKETS = 64
+
+PENDING_LOCK = threading.Lock()
+
+PENDING_ROLLUPS = {}
+
+def rollup_periods():
+    return tuple(sorted(getattr(settings, 'QUICKSILVER_ROLLUP_PERIODS', (3600, 86400,))))
+
+def rollup_period():
+    return rollup_periods()[0]
+
+def bucket_start(when, period):
+    offset = calendar.timegm(when.utctimetuple()) % period
+
+    return when - datetime.timedelta(seconds=offset, microseconds=when.microsecond)
+
+def histogram_bucket(runtime):
+    if runtime <= HISTOGRAM_BASE:
+        return 0
+
+    return min(int(math.ceil(math.log(runtime / HISTOGRAM_BASE) / math.log(HISTOGRAM_GROWTH))), HISTOGRAM_BUCKETS - 1)
+
+def histogram_quantile(histogram, quantile, minimum=None, maximum=None):
+    '''
+    Estimates a quantile from a histogram ({bucket: count}), using the
+    geometric midpoint of the bucket and clipping to the observed range.
+    '''
+
+    total = sum(histogram.values())
+
+    if total == 0:
+        return None
+
+    target = quantile * total
+    seen = 0
+
+    for index in sorted(histogram.keys()):
+        seen += histogram[index]
+
+        if seen >= target:
+            upper = HISTOGRAM_BASE * (HISTOGRAM_GROWTH ** index)
+            estimate = upper / math.sqrt(HISTOGRAM_GROWTH) if index > 0 else upper
+
+            if minimum is not None:
+                estimate = max(estimate, minimum)
+
+            if maximum is not None:
+                estimate = min(estimate, maximum)
+
+            return estimate
+
+    return maximum
+
+def empty_delta():
+    return {
+        'count': 0,
+        'success_count': 0,
+        'error_count': 0,
+        'killed_count': 0,
+        'runtime_sum': 0.0,
+        'runtime_sum_squares': 0.0,
+        'runtime_min': None,
+        'runtime_max': None,
+        'last_ended': None,
+        'last_success': None,
+        'histogram': {},
+    }
+
+def add_to_deltas(deltas, run):
+    '''
+    Adds a run - (task_id, started, ended, status, runtime) - to the deltas.
+    '''
+
+    task_id, started, ended, status, runtime = run
+
+    for period in rollup_periods():
+        key = (task_id, period, bucket_start(started, period),)
+
+        delta = deltas.get(key, None)
+
+        if delta is None:
+            delta = empty_delta()
+
+            deltas[key] = delta
+
+        delta['count'] += 1
+
+        if status == 'error':
+            delta['error_count'] += 1
+        elif status == 'killed':
+            delta['killed_count'] += 1
+        elif status == 'success':
+            delta['success_count'] += 1
+
+            if runtime is not None:
+                delta['runtime_sum'] += runtime
+                delta['runtime_sum_squares'] += runtime * runtime
+                delta['runtime_min'] = runtime if delta['runtime_min'] is None else min(delta['runtime_min'], runtime)
+                delta['runtime_max'] = runtime if delta['runtime_max'] is None else max(delta['runtime_max'], runtime)
+
+                bucket = histogram_bucket(runtime)
+
+                delta['histogram'][bucket] = delta['histogram'].get(bucket, 0) + 1
+
+        if ended is not None and (delta['last_ended'] is None or ended > delta['last_ended']):
+            delta['last_ended'] = ended
+
+        if status == 'success' and ended is not None and (delta['last_success'] is None or ended > delta['last_success']):
+            delta['last_success'] = ended
+
+def merge_delta(rollup, delta):
+    rollup.count += delta['count']
+    rollup.success_count += delta['success_count']
+    rollup.error_count += delta['error_count']
+    rollup.killed_count += delta['killed_count']
+    rollup.runtime_sum += delta['runtime_sum']
+    rollup.runtime_sum_squares += delta['runtime_sum_squares']
+
+    if delta['runtime_min'] is not None:
+        rollup.runtime_min = delta['runtime_min'] if rollup.runtime_min is None else min(rollup.runtime_min, delta['runtime_min'])
+        rollup.runtime_max = delta['runtime_max'] if rollup.runtime_max is None else max(rollup.runtime_max, delta['runtime_max'])
+
+    if delta['last_ended'] is not None and (rollup.last_ended is None or delta['last_ended'] > rollup.last_ended):
+        rollup.last_ended = delta['last_ended']
+
+    if delta['last_success'] is not None and (rollup.last_success is None or delta['last_success'] > rollup.last_success):
+        rollup.last_success = delta['last_success']
+
+    histogram = rollup.histogram()
+
+    for bucket, count in delta['histogram'].items():
+        histogram[bucket] = histogram.get(bucket, 0) + count
+
+    rollup.runtime_histogram = json.dumps(histogram, sort_keys=True)
+
+def write_rollups(deltas):
+    ExecutionRollup = apps.get_model('quicksilver', 'ExecutionRollup') # pylint: disable=invalid-name
+
+    for key in sorted(deltas.keys()):
+        task_id, period, period_start = key
+
+        try:
+            with transaction.atomic():
+                rollup = ExecutionRollup.objects.select_for_update().filter(task_id=task_id, period=period, period_start=period_start).first()
+
+                if rollup is None:
+                    try:
+                        with transaction.atomic():
+                            rollup = ExecutionRollup.objects.create(task_id=task_id, period=period, period_start=period_start)
+                    except IntegrityError: # Created concurrently by another process.
+                        rollup = ExecutionRollup.objects.select_for_update().get(task_id=task_id, period=period, period_start=period_start)
+
+                merge_delta(rollup, deltas[key])
+
+                rollup.save()
+        except ExecutionRollup.DoesNotExist:
+            logger.warning('Unable to roll up executions of task %s (deleted?).', task_id)
+
+def record_rollup(execution):
+    '''
+    Buffers a finished execution for the rollups. Task runners write the
+    buffer once per scheduling cycle with flush().
+    '''
+
+    with PENDING_LOCK:
+        add_to_deltas(PENDING_ROLLUPS, (execution.task_id, execution.started, execution.ended, execution.status, execution.total_runtime,))
+
+def flush():
+    with PENDING_LOCK:
+        deltas = dict(PENDING_ROLLUPS)
+
+        PENDING_ROLLUPS.clear()
+
+    try:
+        write_rollups(deltas)
+    except: # pylint: disable=bare-except
+        logger.exception('Unable to flush Quicksilver execution rollups.')
+
+def rollup_executions(batch_size=5000):
+    '''
+    Adds finished executions not yet rolled up to the rollups, in batches.
+    Returns the number of executions added. Safe to call from several
+    processes at once - each batch is claimed before it is counted.
+    '''
+
+    Execution = apps.get_model('quicksilver', 'Execution') # pylint: disable=invalid-name
+
+    pending = Execution.objects.filter(rolled_up=False, status__in=FINISHED_STATUSES).exclude(ended=None).order_by('pk')
+
+    if connection.features.has_select_for_update_skip_locked:
+        pending = pending.select_for_update(skip_locked=True)
+
+    total = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(pending.values_list('pk', 'task_id', 'started', 'ended', 'status', 'total_runtime')[:batch_size])
+
+            if not rows:
+                break
+
+            # Rows claimed by another caller since they were read are left to that caller.
+
+            if Execution.objects.filter(pk__in=[row[0] for row in rows], rolled_up=False).update(rolled_up=True) < len(rows):
+                transaction.set_rollback(True)
+
+                continue
+
+            deltas = {}
+
+            for row in rows:
+                runtime = row[5]
+
+                if runtime is None:
+                    runtime = (row[3] - row[2]).total_seconds()
+
+                add_to_deltas(deltas, (row[1], row[2], row[3], row[4], runtime,))
+
+            write_rollups(deltas)
+
+        total += len(rows)
+
+        if len(rows) < batch_size:
+            break
+
+    return total
+
+def prune_rollups(now):
+    ExecutionRollup = apps.get_model('quicksilver', 'ExecutionRollup') # pylint: disable=invalid-name
+
+    retention = getattr(settings, 'QUICKSILVER_ROLLUP_RETENTION_DAYS', {3600: 90, 86400: None})
+
+    deleted = 0
+
+    for period, days in retention.items():
+        if days is not None:
+            deleted += ExecutionRollup.objects.filter(period=period, period_start__lt=(now - datetime.timedelta(days=days))).delete()[0]
+
+    return deleted
+
+def rollup_statistics(since, task_ids=None, quantile=0.99):
+    '''
+    Combines the finest rollups since the provided time into per-task runtime
+    statistics of successful runs: {task_id: {count, mean, std, median,
+    spread, quantile}}, where spread approximates a standard deviation from
+    the interquartile range.
+    '''
+
+    ExecutionRollup = apps.get_model('quicksilver', 'ExecutionRollup') # pylint: disable=invalid-name
+
+    rollups = ExecutionRollup.objects.filter(period=rollup_period(), period_start__gte=bucket_start(since, rollup_period()), success_count__gt=0)
+
+    if task_ids is not None:
+        rollups = rollups.filter(task_id__in=list(task_ids))
+
+    combined = {}
+
+    for rollup in rollups.order_by('task_id').only('task_id', 'success_count', 'runtime_sum', 'runtime_sum_squares', 'runtime_min', 'runtime_max', 'runtime_histogram'):
+        task = combined.get(rollup.task_id, None)
+
+        if task is None:
+            task = empty_delta()
+
+            combined[rollup.task_id] = task
+
+        task['success_count'] += rollup.success_count
+        task['runtime_sum'] += rollup.runtime_sum
+        task['runtime_sum_squares'] += rollup.runtime_sum_squares
+
+        if rollup.runtime_min is not None:
+            task['runtime_min'] = rollup.runtime_min if task['runtime_min'] is None else min(task['runtime_min'], rollup.runtime_min)
+            task['runtime_max'] = rollup.runtime_max if task['runtime_max'] is None else max(task['runtime_max'], rollup.runtime_max)
+
+        for bucket, count in rollup.histogram().items():
+            task['histogram'][bucket] = task['histogram'].get(bucket, 0) + count
+
+    statistics = {}
+
+    for task_id, task in combined.items():
+        count = task['success_count']
+        mean = task['runtime_sum'] / count
+
+        def estimate(value, task=task):
+            return histogram_quantile(task['histogram'], value, task['runtime_min'], task['runtime_max'])
+
+        statistics[task_id] = {
+            'count': count,
+            'mean': mean,
+            'std': math.sqrt(max((task['runtime_sum_squares'] / count) - (mean * mean), 0)),
+            'median': estimate(0.5),
+            'spread': (estimate(0.75) - estimate(0.25)) / 1.349,
+            'quantile': estimate(quantile),
+        }
+
+    return statistics
+
+TASK_SUMMARY_CACHE_KEY = 'quicksilver_task_summaries'
+
+def task_summaries(now=None, use_cache=True):
+    '''
+    Summarizes the recent runs of every task - {task_id: {runs, successes,
+    errors, killed, failure_rate, runtime_mean, runtime_p50, runtime_p95,
+    runtime_max, last_run, last_success}} - from one grouped aggregate over the
+    rollups and one over executions not yet rolled up. Results are cached for
+    QUICKSILVER_TASK_SUMMARY_CACHE_SECONDS.
+    '''
+
+    cache_seconds = getattr(settings, 'QUICKSILVER_TASK_SUMMARY_CACHE_SECONDS', 60)
+
+    if use_cache and cache_seconds:
+        summaries = cache.get(TASK_SUMMARY_CACHE_KEY)
+
+        if summaries is not None:
+            return summaries
+
+    Execution = apps.get_model('quicksilver', 'Execution') # pylint: disable=invalid-name
+    ExecutionRollup = apps.get_model('quicksilver', 'ExecutionRollup') # pylint: disable=invalid-name
+
+    if now is None:
+        now = timezone.now()
+
+    since = bucket_start(now - datetime.timedelta(hours=getattr(settings, 'QUICKSILVER_TASK_SUMMARY_HOURS', 24)), rollup_period())
+
+    rows = list(ExecutionRollup.objects.filter(period=rollup_period(), period_start__gte=since).values('task_id').annotate(runs=Sum('count'), successes=Sum('success_count'), errors=Sum('error_count'), killed=Sum('killed_count'), runtime_sum=Sum('runtime_sum'), runtime_max=Max('runtime_max'), last_run=Max('last_ended'), last_success=Max('last_success')).values_list('task_id', 'runs', 'successes', 'errors', 'killed', 'runtime_sum', 'runtime_max', 'last_run', 'last_success'))
+
+    # Executions the monitor has not rolled up yet - normally only the last few seconds.
+
+    success = Q(status='success')
+
+    rows.extend(Execution.objects.filter(rolled_up=False, status__in=FINISHED_STATUSES, started__gte=since).values('task_id').annotate(runs=Count('pk'), successes=Count('pk', filter=success), errors=Count('pk', filter=Q(status='error')), killed=Count('pk', filter=Q(status='killed')), runtime_sum=Sum('total_runtime', filter=success), runtime_max=Max('total_runtime', filter=success), last_run=Max('ended'), last_success=Max('ended', filter=success)).values_list('task_id', 'runs', 'successes', 'errors', 'killed', 'runtime_sum', 'runtime_max', 'last_run', 'last_success'))
+
+    def latest(first, second):
+        if first is None or (second is not None and second > first):
+            return second
+
+        return first
+
+    summaries = {}
+
+    for row in rows:
+        summary = summaries.get(row[0], None)
+
+        if summary is None:
+            summary = {
+                'runs': 0,
+                'successes': 0,
+                'errors': 0,
+                'killed': 0,
+                'runtime_sum': 0.0,
+                'runtime_max': None,
+                'last_run': None,
+                'last_success': None,
+            }
+
+            summaries[row[0]] = summary
+
+        summary['runs'] += row[1] or 0
+        summary['successes'] += row[2] or 0
+        summary['errors'] += row[3] or 0
+        summary['killed'] += row[4] or 0
+        summary['runtime_sum'] += row[5] or 0.0
+        summary['runtime_max'] = latest(summary['runtime_max'], row[6])
+        summary['last_run'] = latest(summary['last_run'], row[7])
+        summary['last_success'] = latest(summary['last_success'], row[8])
+
+    # Quantiles come from the rollup histograms.
+
+    statistics = rollup_statistics(since, quantile=0.95)
+
+    for task_id, summary in summaries.items():
+        runtime_sum = summary.pop('runtime_sum')
+
+        summary['failure_rate'] = (summary['errors'] + summary['killed']) / float(summary['runs']) if summary['runs'] else None
+        summary['runtime_mean'] = runtime_sum / summary['successes'] if summary['successes'] else None
+        summary['runtime_p50'] = statistics[task_id]['median'] if task_id in statistics else None
+        summary['runtime_p95'] = statistics[task_id]['quantile'] if task_id in statistics else None
+
+    if cache_seconds:
+        cache.set(TASK_SUMMARY_CACHE_KEY, summaries, cache_seconds)
+
+    return summaries
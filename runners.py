@@ -0,0 +1,241 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import importlib
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from . import clock, metrics, rollups, scheduler, workers
+from .decorators import acquire_lock
+from .models import QueueState, Task, is_async_command
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# The dispatch loop of run_task_queue. A QueueRunner serves one queue - in the
+# command's own thread, or as one of the per-queue worker threads of a
+# Supervisor serving several queues from a single process. Each queue worker
+# holds the same file lock as a single-queue run_task_queue process, so both
+# may be used side by side without running a queue twice.
+
+class QueueRunner(object): # pylint: disable=useless-object-inheritance, too-many-instance-attributes
+    def __init__(self, queue, sleep_duration=5, threads=0, async_tasks=0, stop_event=None):
+        self.queue = queue
+        self.sleep_duration = sleep_duration
+        self.threads = threads
+        self.async_tasks = async_tasks
+
+        # Set by a supervisor to stop the runner. Supervised runners leave
+        # writing metrics and rollups to the supervisor.
+
+        self.stop_event = stop_event
+
+        self.pool = None
+        self.async_runner = None
+
+        self.last_cycle_duration = None
+        self.waiting_groups = set()
+
+    def start(self):
+        queue_started = clock.now()
+
+        for task in Task.objects.filter(queue=self.queue):
+            for execution in task.executions.filter(status='ongoing'):
+                execution.kill_if_stuck(queue_started)
+
+            if task.running_since is not None:
+                task.lightweight_execution().kill_if_stuck(queue_started)
+
+        if self.threads > 0 or self.async_tasks > 0:
+            workers.install_stdout_router()
+
+        if self.threads > 0:
+            self.pool = workers.TaskThreadPool(self.threads, scheduler.dispatch, name='quicksilver-%s' % self.queue)
+
+        if self.async_tasks > 0:
+            aio = importlib.import_module('.aio', package=__package__)
+
+            self.async_runner = aio.AsyncTaskRunner(self.async_tasks, name='quicksilver-%s-async' % self.queue)
+
+    def runners(self):
+        return [runner for runner in (self.pool, self.async_runner,) if runner is not None]
+
+    def cycle(self):
+        '''
+        Dispatches the queue's overdue tasks once. Returns the cycle's duration.
+        '''
+
+        loop_start = clock.now()
+
+        overdue_tasks = scheduler.overdue_tasks(self.queue)
+
+        queue_depth = len(overdue_tasks)
+
+        waiting = dict((group, 0) for group in self.waiting_groups)
+
+        # Outcomes of tasks that finished on worker threads or the event loop since the last cycle.
+
+        for runner in self.runners():
+            for task, outcome in runner.take_outcomes():
+                if outcome == 'waiting':
+                    waiting[task.concurrency_group.name] = waiting.get(task.concurrency_group.name, 0) + 1
+
+        for task in overdue_tasks:
+            runner = self.pool
+
+            if self.async_runner is not None and is_async_command(task.command):
+                runner = self.async_runner
+
+            if runner is not None:
+                if runner.available() > 0 and runner.submit(task, queue_depth=queue_depth, cycle_duration=self.last_cycle_duration):
+                    queue_depth -= 1
+            else:
+                if scheduler.dispatch(task, queue_depth=queue_depth, cycle_duration=self.last_cycle_duration) == 'waiting':
+                    waiting[task.concurrency_group.name] = waiting.get(task.concurrency_group.name, 0) + 1
+
+                queue_depth -= 1
+
+        for group, count in waiting.items():
+            metrics.set_gauge('quicksilver_concurrency_waiting_tasks', count, {'group': group, 'queue': self.queue})
+
+        # Groups reset to zero above are dropped until tasks wait on them again.
+
+        self.waiting_groups = set(group for group, count in waiting.items() if count > 0)
+
+        elapsed = (clock.now() - loop_start).total_seconds()
+
+        self.last_cycle_duration = elapsed
+
+        QueueState.objects.update_or_create(queue=self.queue, defaults={
+            'updated': clock.now(),
+            'cycle_duration': elapsed,
+            'queue_depth': len(overdue_tasks),
+        })
+
+        metrics.observe('quicksilver_scheduler_cycle_seconds', elapsed, metrics.CYCLE_BUCKETS, {'queue': self.queue})
+
+        if self.stop_event is None:
+            metrics.flush()
+            rollups.flush()
+
+        return elapsed
+
+    def stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def run(self, when_stop):
+        cycle_sleep = getattr(settings, 'QUICKSILVER_MIN_CYCLE_SLEEP_SECONDS', 5)
+
+        while clock.now() < when_stop and self.stopped() is False:
+            elapsed = self.cycle()
+
+            wake_next = max(self.sleep_duration - elapsed, cycle_sleep)
+
+            if self.stop_event is not None:
+                self.stop_event.wait(wake_next)
+            else:
+                clock.sleep(wake_next)
+
+    def shutdown(self):
+        '''
+        Waits for tasks running on worker threads or the event loop to finish.
+        '''
+
+        runners = self.runners()
+
+        if runners:
+            logger.info('Waiting for running tasks in queue "%s" to finish...', self.queue)
+
+            for runner in runners:
+                runner.shutdown()
+
+        if self.stop_event is None:
+            workers.uninstall_stdout_router()
+
+class Supervisor(object): # pylint: disable=useless-object-inheritance, too-many-instance-attributes
+    '''
+    Serves several queues (or "all" of them) from one process, each on its
+    own worker thread holding that queue's lock. Queues locked by other
+    processes are skipped, and taken over once their locks are released.
+    '''
+
+    def __init__(self, queues, lock_name, sleep_duration=5, threads=0, async_tasks=0):
+        self.queues = queues
+        self.lock_name = lock_name
+        self.sleep_duration = sleep_duration
+        self.threads = threads
+        self.async_tasks = async_tasks
+
+        self.stop_event = threading.Event()
+
+        self.workers = {}
+        self.locks = {}
+
+    def queue_names(self):
+        if 'all' in self.queues:
+            return sorted(set(Task.objects.order_by().values_list('queue', flat=True)))
+
+        return self.queues
+
+    def start_worker(self, queue, when_stop):
+        lock = acquire_lock(self.lock_name, '_' + queue, [queue])
+
+        if lock is None:
+            logger.debug('Queue "%s" is locked by another runner, skipping...', queue)
+
+            return
+
+        runner = QueueRunner(queue, sleep_duration=self.sleep_duration, threads=self.threads, async_tasks=self.async_tasks, stop_event=self.stop_event)
+
+        thread = threading.Thread(target=self.run_worker, args=(runner, when_stop,), name='quicksilver-queue-%s' % queue)
+        thread.daemon = True
+        thread.start()
+
+        self.locks[queue] = lock
+        self.workers[queue] = thread
+
+    def run_worker(self, runner, when_stop): # pylint: disable=no-self-use
+        try:
+            runner.start()
+            runner.run(when_stop)
+        except: # pylint: disable=bare-except
+            logger.exception('Runner for queue "%s" failed.', runner.queue)
+        finally:
+            runner.shutdown()
+
+            connection.close()
+
+    def release_worker(self, queue):
+        self.workers.pop(queue).join()
+
+        self.locks.pop(queue).release()
+
+    def run(self, when_stop):
+        workers.install_stdout_router()
+
+        try:
+            while clock.now() < when_stop:
+                for queue in list(self.workers.keys()):
+                    if self.workers[queue].is_alive() is False:
+                        self.release_worker(queue)
+
+                for queue in self.queue_names():
+                    if queue not in self.workers:
+                        self.start_worker(queue, when_stop)
+
+                metrics.flush()
+                rollups.flush()
+
+                clock.sleep(self.sleep_duration)
+        finally:
+            self.stop_event.set()
+
+            for queue in list(self.workers.keys()):
+                self.release_worker(queue)
+
+            metrics.flush()
+            rollups.flush()
+
+            workers.uninstall_stdout_router()
@@ -0,0 +1,205 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.conf import settings
+
+from . import clock, concurrency, metrics
+from .models import Execution, Task
+from .schedules import ScheduleError
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+def dispatch_score(task, now):
+    '''
+    Returns the dispatch score of a ready task - its priority plus one level
+    for every QUICKSILVER_PRIORITY_AGING_SECONDS it has been waiting.
+    '''
+
+    aging_seconds = getattr(settings, 'QUICKSILVER_PRIORITY_AGING_SECONDS', 60)
+
+    waiting = 0.0
+
+    if task.next_run is not None:
+        waiting = max((now - task.next_run).total_seconds(), 0.0)
+
+    if aging_seconds is None or aging_seconds <= 0:
+        return float(task.priority)
+
+    return task.priority + (waiting / aging_seconds)
+
+def order_for_dispatch(tasks, now):
+    '''
+    Orders ready tasks for dispatch. Shared by the task runners and the
+    scheduling simulator.
+    '''
+
+    if getattr(settings, 'QUICKSILVER_DISPATCH_ORDER', 'priority') == 'next_run':
+        return sorted(tasks, key=lambda task: task.next_run)
+
+    # With equal priorities, aging preserves next_run order.
+
+    return sorted(tasks, key=lambda task: (-dispatch_score(task, now), task.next_run, task.pk))
+
+def shed_overload(tasks, now, save=True):
+    '''
+    When more tasks are ready than QUICKSILVER_SHED_QUEUE_DEPTH, moves those
+    with priorities below QUICKSILVER_SHED_PRIORITY_BELOW to their next slot
+    instead of running them. Returns the (ordered) tasks to run and those shed.
+    '''
+
+    shed_depth = getattr(settings, 'QUICKSILVER_SHED_QUEUE_DEPTH', None)
+    shed_below = getattr(settings, 'QUICKSILVER_SHED_PRIORITY_BELOW', None)
+
+    if shed_depth is None or shed_below is None or len(tasks) <= shed_depth:
+        return tasks, []
+
+    kept = []
+    shed = []
+
+    for task in tasks:
+        if task.priority < shed_below:
+            missed = task.next_run
+
+            task.next_run = task.next_slot_after(missed, now)
+
+            logger.info('Shedding run of %s (scheduled for %s) under overload, next run at %s.', task, missed.isoformat(), task.next_run.isoformat())
+
+            if save:
+                task.save(update_fields=['next_run'])
+
+                metrics.increment('quicksilver_shed_runs_total', {'queue': task.queue})
+
+            shed.append(task)
+        else:
+            kept.append(task)
+
+    return kept, shed
+
+def overdue_tasks(queue, now=None):
+    '''
+    Returns the tasks in the queue that are due to run and not already
+    running, in the order they should be dispatched.
+    '''
+
+    if now is None:
+        now = clock.now()
+
+    return shed_overload(order_for_dispatch(ready_tasks(queue, now), now), now)[0]
+
+def ready_tasks(queue, now):
+    running = set(Execution.objects.filter(task__queue=queue, status='ongoing').values_list('task_id', flat=True))
+
+    ready = []
+
+    for task in Task.objects.exclude(next_run=None).filter(next_run__lte=now, queue=queue).order_by('next_run'):
+        if task.pk in running or task.running_since is not None:
+            continue
+
+        try:
+            task.schedule()
+        except ScheduleError:
+            # Saved without validation (e.g. outside the admin) - leave the task until its schedule is fixed.
+
+            logger.exception('Skipping %s with an invalid schedule.', task)
+
+            continue
+
+        ready.append(task)
+
+    return ready
+
+def skip_misfire(task, now, save=True):
+    '''
+    Moves a misfired task using the "skip" policy to its next slot instead of
+    running it late. Returns True if the run was skipped.
+    '''
+
+    if task.misfire_policy != 'skip' or task.is_misfire(task.next_run, now) is False:
+        return False
+
+    missed = task.next_run
+
+    task.next_run = task.next_slot_after(missed, now)
+
+    logger.info('Skipping misfired run of %s (scheduled for %s), next run at %s.', task, missed.isoformat(), task.next_run.isoformat())
+
+    if save:
+        task.save(update_fields=['next_run'])
+
+        metrics.increment('quicksilver_skipped_runs_total', {'queue': task.queue})
+
+    return True
+
+def still_due(task, now):
+    '''
+    Re-reads the schedule of a task loaded earlier in the cycle. Returns False
+    if it has started or been rescheduled since - for instance, when a worker
+    thread finished running it after it was loaded.
+    '''
+
+    seen = task.next_run
+
+    task.refresh_from_db(fields=['next_run', 'running_since'])
+
+    if task.next_run is None or task.next_run != seen or task.running_since is not None:
+        return False
+
+    return task.next_run <= now
+
+def claim(task, now=None):
+    '''
+    Checks whether a ready task may run now under its misfire policy, rate
+    limit and concurrency group. Returns (None, concurrency token) if it may -
+    release the token once it has run - or ("stale", "skipped",
+    "rate_limited" or "waiting", None) if not.
+    '''
+
+    if now is None:
+        now = clock.now()
+
+    if still_due(task, now) is False:
+        logger.debug('%s is no longer due, skipping...', task)
+
+        return 'stale', None
+
+    if skip_misfire(task, now):
+        return 'skipped', None
+
+    available = concurrency.rate_limit_available(task, now)
+
+    if available is not None:
+        logger.info('Rate limit reached for %s, next run at %s.', task, available.isoformat())
+
+        task.next_run = available
+        task.save(update_fields=['next_run'])
+
+        return 'rate_limited', None
+
+    token = concurrency.acquire(task, now)
+
+    if token is None:
+        logger.info('Concurrency group %s is at capacity, %s is waiting.', task.concurrency_group, task)
+
+        return 'waiting', None
+
+    return None, token
+
+def dispatch(task, queue_depth=None, cycle_duration=None):
+    '''
+    Runs a ready task if its misfire policy, rate limit and concurrency group
+    permit. Returns "ran", "stale", "skipped", "rate_limited" or "waiting".
+    '''
+
+    outcome, token = claim(task)
+
+    if outcome is not None:
+        return outcome
+
+    try:
+        task.run(queue_depth=queue_depth, cycle_duration=cycle_duration)
+    finally:
+        concurrency.release(token)
+
+    return 'ran'
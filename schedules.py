@@ -0,0 +1,286 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import bisect
+import datetime
+import threading
+
+from dateutil import tz
+
+from django.conf import settings
+from django.utils import timezone
+
+# Cron-style calendar schedules. Expressions have six fields (second, minute,
+# hour, day of month, month, day of week) - standard five-field expressions run
+# on second zero. Next fire times are found by skipping whole months, days,
+# hours and minutes that cannot match instead of testing every second.
+
+MACROS = {
+    '@yearly': '0 0 0 1 1 *',
+    '@annually': '0 0 0 1 1 *',
+    '@monthly': '0 0 0 1 * *',
+    '@weekly': '0 0 0 * * 0',
+    '@daily': '0 0 0 * * *',
+    '@midnight': '0 0 0 * * *',
+    '@hourly': '0 0 * * * *',
+}
+
+MONTH_NAMES = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',)
+DAY_NAMES = ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat',)
+
+# (name, minimum, maximum, names)
+
+FIELDS = (
+    ('second', 0, 59, None,),
+    ('minute', 0, 59, None,),
+    ('hour', 0, 23, None,),
+    ('day of month', 1, 31, None,),
+    ('month', 1, 12, MONTH_NAMES,),
+    ('day of week', 0, 7, DAY_NAMES,),
+)
+
+# Give up on expressions that never match (e.g. "0 0 0 30 2 *").
+
+MAX_SEARCH_YEARS = 8
+
+SCHEDULE_CACHE_SIZE = 1024
+
+SCHEDULE_CACHE = {}
+SCHEDULE_CACHE_LOCK = threading.Lock()
+
+class ScheduleError(ValueError):
+    pass
+
+def parse_value(value, field):
+    name, minimum, maximum, names = field
+
+    if names is not None and value.lower()[:3] in names:
+        return names.index(value.lower()[:3]) + minimum
+
+    try:
+        parsed = int(value)
+    except ValueError:
+        raise ScheduleError('Invalid %s value: "%s"' % (name, value)) # pylint: disable=raise-missing-from
+
+    if parsed < minimum or parsed > maximum:
+        raise ScheduleError('%s value out of range (%d-%d): "%s"' % (name.capitalize(), minimum, maximum, value))
+
+    return parsed
+
+def parse_field(expression, field):
+    name, minimum, maximum = field[0], field[1], field[2]
+
+    values = set()
+
+    for part in expression.split(','):
+        step = 1
+
+        if '/' in part:
+            part, step_value = part.split('/', 1)
+
+            try:
+                step = int(step_value)
+            except ValueError:
+                raise ScheduleError('Invalid %s step: "%s"' % (name, step_value)) # pylint: disable=raise-missing-from
+
+            if step < 1:
+                raise ScheduleError('Invalid %s step: "%s"' % (name, step_value))
+
+        if part in ('*', '?',):
+            start, end = minimum, maximum
+        elif '-' in part:
+            start, end = [parse_value(value, field) for value in part.split('-', 1)]
+        else:
+            start = parse_value(part, field)
+            end = maximum if step > 1 else start
+
+        if end < start:
+            raise ScheduleError('Invalid %s range: "%s"' % (name, part))
+
+        values.update(range(start, end + 1, step))
+
+    return sorted(values)
+
+class CronSchedule(object): # pylint: disable=useless-object-inheritance, too-many-instance-attributes
+    def __init__(self, expression, timezone_name=None):
+        self.expression = expression.strip()
+
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+
+        if len(fields) == 5:
+            fields = ['0'] + fields
+
+        if len(fields) != 6:
+            raise ScheduleError('Expected 5 or 6 fields in schedule "%s".' % expression)
+
+        parsed = [parse_field(value, FIELDS[index]) for index, value in enumerate(fields)]
+
+        self.seconds, self.minutes, self.hours, self.days, self.months = parsed[:5]
+
+        # Sunday may be written as 0 or 7.
+
+        self.weekdays = set(day % 7 for day in parsed[5])
+
+        # As in cron, a restricted day of month and day of week match either.
+
+        self.any_day = fields[3] in ('*', '?',)
+        self.any_weekday = fields[5] in ('*', '?',)
+
+        if timezone_name is None or timezone_name.strip() == '':
+            timezone_name = getattr(settings, 'TIME_ZONE', None) or 'UTC'
+
+        self.timezone_name = timezone_name
+        self.timezone = tz.gettz(timezone_name)
+
+        if self.timezone is None:
+            raise ScheduleError('Unknown time zone: "%s"' % timezone_name)
+
+    def __str__(self):
+        return '%s (%s)' % (self.expression, self.timezone_name)
+
+    def day_matches(self, when):
+        day_match = when.day in self.days
+        weekday_match = ((when.weekday() + 1) % 7) in self.weekdays
+
+        if self.any_day:
+            return weekday_match
+
+        if self.any_weekday:
+            return day_match
+
+        return day_match or weekday_match
+
+    def next_local(self, local): # pylint: disable=too-many-branches
+        '''
+        Returns the first matching naive local time after the provided naive
+        local time, or None if the schedule never fires.
+        '''
+
+        candidate = local.replace(microsecond=0) + datetime.timedelta(seconds=1)
+
+        give_up = candidate.year + MAX_SEARCH_YEARS
+
+        while candidate.year <= give_up:
+            if candidate.month not in self.months:
+                index = bisect.bisect_right(self.months, candidate.month)
+
+                if index < len(self.months):
+                    candidate = datetime.datetime(candidate.year, self.months[index], 1)
+                else:
+                    candidate = datetime.datetime(candidate.year + 1, self.months[0], 1)
+
+                continue
+
+            if self.day_matches(candidate) is False:
+                candidate = datetime.datetime(candidate.year, candidate.month, candidate.day) + datetime.timedelta(days=1)
+
+                continue
+
+            if candidate.hour not in self.hours:
+                index = bisect.bisect_right(self.hours, candidate.hour)
+
+                if index < len(self.hours):
+                    candidate = candidate.replace(hour=self.hours[index], minute=0, second=0)
+                else:
+                    candidate = datetime.datetime(candidate.year, candidate.month, candidate.day) + datetime.timedelta(days=1)
+
+                continue
+
+            if candidate.minute not in self.minutes:
+                index = bisect.bisect_right(self.minutes, candidate.minute)
+
+                if index < len(self.minutes):
+                    candidate = candidate.replace(minute=self.minutes[index], second=0)
+                else:
+                    candidate = candidate.replace(minute=0, second=0) + datetime.timedelta(hours=1)
+
+                continue
+
+            if candidate.second not in self.seconds:
+                index = bisect.bisect_right(self.seconds, candidate.second)
+
+                if index < len(self.seconds):
+                    candidate = candidate.replace(second=self.seconds[index])
+                else:
+                    candidate = candidate.replace(second=0) + datetime.timedelta(minutes=1)
+
+                continue
+
+            return candidate
+
+        return None
+
+    def next_after(self, when):
+        '''
+        Returns the first fire time strictly after the provided time, or None
+        if the schedule never fires. Aware times are returned in UTC.
+        '''
+
+        naive = timezone.is_naive(when)
+
+        if naive:
+            when = timezone.make_aware(when)
+
+        local = when.astimezone(self.timezone).replace(tzinfo=None)
+
+        while True:
+            local = self.next_local(local)
+
+            if local is None:
+                return None
+
+            fires = local.replace(tzinfo=self.timezone)
+
+            if tz.datetime_exists(fires) is False:
+                # Skipped by a daylight saving transition - fire when the clocks resume.
+
+                fires = tz.resolve_imaginary(fires)
+            elif fires.astimezone(tz.tzutc()) <= when:
+                # Repeated by a daylight saving transition - the second pass may still be ahead.
+
+                fires = tz.enfold(fires, fold=1)
+
+            fires = fires.astimezone(tz.tzutc())
+
+            if fires > when:
+                break
+
+        if naive:
+            return timezone.make_naive(fires)
+
+        return fires
+
+    def upcoming(self, when, count=5):
+        fire_times = []
+
+        while len(fire_times) < count:
+            when = self.next_after(when)
+
+            if when is None:
+                break
+
+            fire_times.append(when)
+
+        return fire_times
+
+def parse_schedule(expression, timezone_name=None):
+    '''
+    Returns a (cached) CronSchedule for the expression and time zone. Raises
+    ScheduleError for invalid expressions.
+    '''
+
+    key = (expression, timezone_name,)
+
+    with SCHEDULE_CACHE_LOCK:
+        schedule = SCHEDULE_CACHE.get(key, None)
+
+    if schedule is None:
+        schedule = CronSchedule(expression, timezone_name)
+
+        with SCHEDULE_CACHE_LOCK:
+            if len(SCHEDULE_CACHE) >= SCHEDULE_CACHE_SIZE:
+                SCHEDULE_CACHE.clear()
+
+            SCHEDULE_CACHE[key] = schedule
+
+    return schedule
@@ -0,0 +1,127 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Indexed search over execution output. PostgreSQL keeps a tsvector per
+# execution in a side table with a GIN index (removed with the execution by a
+# cascading foreign key), SQLite an FTS5 table keyed by the execution's rowid
+# (removed by a delete trigger). Output is indexed as it is written, so the
+# index also covers output stored in other forms. Other databases - or SQLite
+# builds without FTS5 - fall back to substring matching.
+
+SEARCH_TABLE = 'quicksilver_execution_search'
+
+SEARCH_BACKENDS = {}
+
+def search_config():
+    return getattr(settings, 'QUICKSILVER_SEARCH_CONFIG', 'simple')
+
+def max_characters():
+    return getattr(settings, 'QUICKSILVER_SEARCH_MAX_CHARACTERS', 65536)
+
+def create_index(schema_editor):
+    '''
+    Creates the search table for the current database. Called from migrations.
+    '''
+
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE TABLE %s (execution_id bigint PRIMARY KEY REFERENCES quicksilver_execution (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)' % SEARCH_TABLE)
+        schema_editor.execute('CREATE INDEX %s_document ON %s USING GIN (document)' % (SEARCH_TABLE, SEARCH_TABLE))
+    elif vendor == 'sqlite':
+        try:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute('CREATE VIRTUAL TABLE %s USING fts5(output, detail=column)' % SEARCH_TABLE)
+        except DatabaseError:
+            logger.warning('SQLite FTS5 is not available - execution output searches will not be indexed.')
+
+            return
+
+        schema_editor.execute('CREATE TRIGGER %s_delete AFTER DELETE ON quicksilver_execution BEGIN DELETE FROM %s WHERE rowid = old.id; END' % (SEARCH_TABLE, SEARCH_TABLE))
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s_delete' % SEARCH_TABLE)
+
+    if vendor in ('postgresql', 'sqlite',):
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % SEARCH_TABLE)
+
+def backend():
+    '''
+    Returns the search backend ('postgresql' or 'sqlite') available for the
+    default database, or None.
+    '''
+
+    if connection.alias not in SEARCH_BACKENDS:
+        available = None
+
+        if connection.vendor in ('postgresql', 'sqlite',):
+            with connection.cursor() as cursor:
+                if SEARCH_TABLE in connection.introspection.table_names(cursor):
+                    available = connection.vendor
+
+        SEARCH_BACKENDS[connection.alias] = available
+
+    return SEARCH_BACKENDS[connection.alias]
+
+def index_outputs(outputs):
+    '''
+    Adds or replaces the indexed output of executions - [(pk, output)].
+    '''
+
+    available = backend()
+
+    if available is None:
+        return 0
+
+    rows = [(pk, output[:max_characters()],) for pk, output in outputs if pk is not None and output]
+
+    if not rows:
+        return 0
+
+    with connection.cursor() as cursor:
+        if available == 'postgresql':
+            cursor.executemany('INSERT INTO %s (execution_id, document) VALUES (%%s, to_tsvector(%%s::regconfig, %%s)) ON CONFLICT (execution_id) DO UPDATE SET document = EXCLUDED.document' % SEARCH_TABLE, [(pk, search_config(), output,) for pk, output in rows])
+        else:
+            cursor.executemany('INSERT OR REPLACE INTO %s (rowid, output) VALUES (%%s, %%s)' % SEARCH_TABLE, rows)
+
+    return len(rows)
+
+def index_output(execution):
+    try:
+        index_outputs([(execution.pk, execution.get_output(),)])
+    except DatabaseError:
+        logger.exception('Unable to index the output of %s.', execution)
+
+def matching_executions(search_term):
+    '''
+    Returns an expression selecting the primary keys of executions whose
+    output contains every word of the search term, or None if no search
+    backend is available.
+    '''
+
+    available = backend()
+
+    words = search_term.split()
+
+    if available is None or not words:
+        return None
+
+    if available == 'postgresql':
+        return RawSQL('SELECT execution_id FROM %s WHERE document @@ plainto_tsquery(%%s::regconfig, %%s)' % SEARCH_TABLE, (search_config(), ' '.join(words),))
+
+    # Quote each word so that FTS5 query syntax in the term is matched literally.
+
+    query = ' '.join(['"%s"' % word.replace('"', '""') for word in words])
+
+    return RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (SEARCH_TABLE, SEARCH_TABLE), (query,))
@@ -0,0 +1,223 @@
+# pylint: disable=no-member, line-too-long
+# -*- coding: utf-8 -*-
+
+import copy
+import datetime
+import math
+
+import numpy
+
+from . import scheduler
+from .clock import VirtualClock
+from .outliers import runtime_statistics
+
+# Offline replay of the task runner loop against in-memory (unsaved) copies of
+# tasks. Runs are not executed - their durations are drawn from distributions -
+# and time advances on a VirtualClock, so days of scheduling take seconds.
+# Every run succeeds and reports no remaining work, so circuit breakers and
+# adaptive intervals never change a task's schedule. Concurrency groups and
+# rate limits are not applied.
+
+DISTRIBUTIONS = ('history', 'lognormal', 'exponential', 'constant',)
+
+class DurationSampler(object): # pylint: disable=useless-object-inheritance, too-few-public-methods
+    def __init__(self, kind, generator, median=1.0, sigma=0.5):
+        self.kind = kind
+        self.generator = generator
+        self.median = max(median, 0.0)
+        self.sigma = sigma
+
+    def sample(self):
+        if self.kind == 'constant' or self.median <= 0:
+            return self.median
+
+        if self.kind == 'exponential':
+            return float(self.generator.exponential(self.median / math.log(2)))
+
+        return float(self.generator.lognormal(math.log(self.median), self.sigma))
+
+def duration_samplers(tasks, kind, generator, median=1.0, sigma=0.5):
+    samplers = {}
+
+    if kind != 'history':
+        for task in tasks:
+            samplers[task.pk] = DurationSampler(kind, generator, median, sigma)
+
+        return samplers
+
+    # Fit a log-normal distribution to each task's recent runtimes.
+
+    statistics = runtime_statistics(task_ids=[task.pk for task in tasks])
+
+    fitted = {}
+
+    for task_id, task_median, task_mad in zip(statistics['task_ids'].tolist(), statistics['medians'].tolist(), statistics['mads'].tolist()):
+        task_sigma = sigma
+
+        if task_median > 0:
+            task_sigma = min(math.log1p(task_mad / task_median), 2.0)
+
+        fitted[task_id] = (task_median, task_sigma)
+
+    for task in tasks:
+        task_median, task_sigma = fitted.get(task.pk, (median, sigma))
+
+        samplers[task.pk] = DurationSampler('lognormal', generator, task_median, task_sigma)
+
+    return samplers
+
+class QueueSimulation(object): # pylint: disable=useless-object-inheritance, too-many-instance-attributes
+    def __init__(self, queue, tasks, samplers, start, options=None):
+        if options is None:
+            options = {}
+
+        self.queue = queue
+        self.tasks = [copy.copy(task) for task in tasks]
+        self.samplers = samplers
+        self.clock = VirtualClock(start)
+        self.start = start
+        self.workers = max(options.get('workers', 1), 1)
+        self.sleep_duration = options.get('sleep_duration', 5)
+        self.cycle_sleep = options.get('cycle_sleep', 5)
+        self.generator = options.get('generator', None)
+
+        self.cycles = 0
+        self.runs = 0
+        self.busy_seconds = 0.0
+        self.missed_runs = 0
+        self.skipped_runs = 0
+        self.shed_runs = 0
+        self.max_queue_depth = 0
+        self.lags = []
+
+    def run_cycle(self):
+        loop_start = self.clock.now()
+
+        ready = [task for task in self.tasks if task.next_run is not None and task.next_run <= loop_start]
+        self.max_queue_depth = max(self.max_queue_depth, len(ready))
+
+        ready, shed = scheduler.shed_overload(scheduler.order_for_dispatch(ready, loop_start), loop_start, save=False)
+
+        self.shed_runs += len(shed)
+
+        worker_offsets = [0.0] * self.workers
+
+        for task in ready:
+            worker = worker_offsets.index(min(worker_offsets))
+
+            started = loop_start + datetime.timedelta(seconds=worker_offsets[worker])
+
+            if scheduler.skip_misfire(task, started, save=False):
+                self.skipped_runs += 1
+
+                continue
+
+            lag = (started - task.next_run).total_seconds()
+            duration = self.samplers[task.pk].sample()
+
+            self.lags.append(lag)
+            self.runs += 1
+            self.busy_seconds += duration
+
+            if lag > 0:
+                self.missed_runs += int(lag // task.effective_interval())
+
+            finished = started + datetime.timedelta(seconds=duration)
+
+            if task.misfire_policy == 'catch_up':
+                task.next_run = task.next_run_after_success(task.next_run, started, finished, generator=self.generator)
+            else:
+                task.next_run = task.next_run_after(finished, self.generator)
+
+            worker_offsets[worker] += duration
+
+        elapsed = max(worker_offsets)
+
+        self.clock.advance(elapsed)
+
+        wake_next = self.sleep_duration - elapsed
+
+        if wake_next > self.cycle_sleep:
+            self.clock.sleep(wake_next)
+        else:
+            self.clock.sleep(self.cycle_sleep)
+
+        self.cycles += 1
+
+    def run(self, until):
+        while self.clock.now() < until:
+            self.run_cycle()
+
+    def report(self):
+        simulated = max((self.clock.now() - self.start).total_seconds(), 0.000001)
+
+        lags = numpy.array(self.lags, dtype=numpy.float64)
+
+        report = {
+            'tasks': len(self.tasks),
+            'workers': self.workers,
+            'simulated_seconds': simulated,
+            'cycles': self.cycles,
+            'runs': self.runs,
+            'utilisation': self.busy_seconds / (simulated * self.workers),
+            'missed_runs': self.missed_runs,
+            'skipped_runs': self.skipped_runs,
+            'shed_runs': self.shed_runs,
+            'max_queue_depth': self.max_queue_depth,
+            'dispatch_lag': None,
+        }
+
+        if len(lags) > 0: # pylint: disable=len-as-condition
+            report['dispatch_lag'] = {
+                'p50': float(numpy.percentile(lags, 50)),
+                'p90': float(numpy.percentile(lags, 90)),
+                'p99': float(numpy.percentile(lags, 99)),
+                'max': float(numpy.max(lags)),
+            }
+
+        return report
+
+SIMULATION_DEFAULTS = {
+    'distribution': 'history',
+    'seed': 1234,
+    'workers': 1,
+    'sleep_duration': 5,
+    'cycle_sleep': 5,
+    'median': 1.0,
+    'sigma': 0.5,
+}
+
+def simulate(tasks, start, until, options=None):
+    '''
+    Simulates each queue of the provided tasks from start until the provided
+    time and returns a report for each queue.
+    '''
+
+    simulation_options = dict(SIMULATION_DEFAULTS)
+
+    if options is not None:
+        simulation_options.update(options)
+
+    generator = numpy.random.RandomState(simulation_options['seed']) # pylint: disable=no-member
+
+    simulation_options['generator'] = generator
+
+    samplers = duration_samplers(tasks, simulation_options['distribution'], generator, simulation_options['median'], simulation_options['sigma'])
+
+    queues = {}
+
+    for task in tasks:
+        if task.queue not in queues:
+            queues[task.queue] = []
+
+        queues[task.queue].append(task)
+
+    reports = {}
+
+    for queue in sorted(queues.keys()):
+        simulation = QueueSimulation(queue, queues[queue], samplers, start, simulation_options)
+        simulation.run(until)
+
+        reports[queue] = simulation.report()
+
+    return reports
@@ -1,6 +1,1174 @@
+# pylint: disable=no-member, line-too-long, too-many-lines
 # -*- coding: utf-8 -*-
 
+import datetime
+import json
+import threading
+import time
 
-# from django.test import TestCase
+import six
 
-# Create your tests here.
+try:
+    from unittest import mock
+except ImportError: # Python 2
+    import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from . import clock, concurrency, metrics, results, rollups, runners, scheduler, search, views, workers
+from .admin import TaskFilter
+from .decorators import acquire_lock
+from .models import AlertState, ConcurrencyGroup, Execution, ExecutionOutputChunk, ExecutionRollup, ExecutionTimeoutError, MetricValue, QueueState, QuicksilverIO, Task, parse_output_trailer
+from .monitor import evaluate_alert_states, evaluate_queue_states
+from .results import TaskResult
+from .schedules import parse_schedule
+from .simulation import simulate
+from .outliers import outlier_settings, recent_runtimes, runtime_statistics
+
+if six.PY3:
+    # Async command support is Python 3 only.
+
+    from .aio_tests import AsyncCommandTests, AsyncTaskRunnerTests # pylint: disable=unused-import
+
+def create_task(**kwargs):
+    values = {
+        'command': 'run_test_task',
+        'arguments': '',
+        'repeat_interval': 60,
+        'next_run': timezone.now(),
+    }
+
+    values.update(kwargs)
+
+    return Task.objects.create(**values)
+
+def create_executions(task, runtimes, status='success', now=None):
+    if now is None:
+        now = timezone.now()
+
+    executions = []
+
+    for index, runtime in enumerate(runtimes):
+        started = now - datetime.timedelta(minutes=(len(runtimes) - index))
+
+        executions.append(Execution(task=task, started=started, ended=started + datetime.timedelta(seconds=runtime), total_runtime=runtime, status=status))
+
+    return Execution.objects.bulk_create(executions)
+
+class RuntimeStatisticsTests(TestCase):
+    def setUp(self):
+        self.busy = create_task()
+        self.quiet = create_task()
+
+        # Most recent runtimes last.
+
+        create_executions(self.busy, [100.0] * 20 + [1.0, 2.0, 3.0])
+        create_executions(self.quiet, [5.0, 6.0])
+
+    def test_window_in_database(self):
+        rows = recent_runtimes(Execution.objects.all(), 3)
+
+        self.assertEqual([(self.busy.pk, 3.0), (self.busy.pk, 2.0), (self.busy.pk, 1.0), (self.quiet.pk, 6.0), (self.quiet.pk, 5.0)], rows)
+
+    def test_window_sliced_per_task(self):
+        with mock.patch('django.VERSION', (4, 1, 0, 'final', 0)):
+            rows = recent_runtimes(Execution.objects.all(), 3)
+
+        self.assertEqual([(self.busy.pk, 3.0), (self.busy.pk, 2.0), (self.busy.pk, 1.0), (self.quiet.pk, 6.0), (self.quiet.pk, 5.0)], rows)
+
+    def test_statistics_use_window(self):
+        options = dict(outlier_settings(), window=3, min_samples=1, cache_seconds=0, use_rollups=False)
+
+        statistics = runtime_statistics(options=options)
+
+        self.assertEqual([self.busy.pk, self.quiet.pk], statistics['task_ids'].tolist())
+        self.assertEqual([3, 2], statistics['counts'].tolist())
+        self.assertEqual(2.0, statistics['medians'][0])
+
+    @override_settings(QUICKSILVER_OUTLIER_WINDOW=5)
+    def test_window_setting(self):
+        statistics = runtime_statistics(options=dict(outlier_settings(), cache_seconds=0, use_rollups=False))
+
+        self.assertEqual(5, statistics['counts'][0])
+
+class MetricsFlushTests(TestCase):
+    def setUp(self):
+        metrics.PENDING_INCREMENTS.clear()
+        metrics.PENDING_GAUGES.clear()
+
+    def test_long_labels(self):
+        command = 'x' * 4096
+
+        metrics.increment('quicksilver_task_runs_total', {'task': command})
+        metrics.increment('quicksilver_task_runs_total', {'task': command})
+
+        self.assertEqual(0, metrics.flush())
+
+        metrics.increment('quicksilver_task_runs_total', {'task': command})
+        metrics.flush()
+
+        metric = MetricValue.objects.get(name='quicksilver_task_runs_total')
+
+        self.assertEqual(3, metric.value)
+        self.assertIn(command, metric.labels)
+
+    def test_failed_metric_kept(self):
+        flush_increment = metrics.flush_increment
+
+        def failing_increment(name, labels, value, now):
+            if name == 'failing_total':
+                raise DatabaseError('Unable to write')
+
+            flush_increment(name, labels, value, now)
+
+        metrics.increment('failing_total')
+        metrics.increment('working_total')
+
+        with mock.patch.object(metrics, 'flush_increment', failing_increment):
+            self.assertEqual(1, metrics.flush())
+
+        self.assertEqual(1, MetricValue.objects.get(name='working_total').value)
+        self.assertFalse(MetricValue.objects.filter(name='failing_total').exists())
+
+        metrics.flush()
+
+        self.assertEqual(1, MetricValue.objects.get(name='failing_total').value)
+
+class PhaseTests(TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2026, 10, 19, 12, 0, 30, tzinfo=datetime.timezone.utc)
+
+        self.previous_clock = clock.set_clock(clock.VirtualClock(self.now))
+
+    def tearDown(self):
+        clock.set_clock(self.previous_clock)
+
+    def test_rephase_jitter_once(self):
+        task = create_task(next_run=None, jitter=90)
+
+        with mock.patch('random.uniform', return_value=90):
+            call_command('rephase_quicksilver_tasks')
+
+        task.refresh_from_db()
+
+        self.assertEqual(0, task.phase)
+        self.assertEqual(datetime.datetime(2026, 10, 19, 12, 2, 30, tzinfo=datetime.timezone.utc), task.next_run)
+
+    def test_trailer_not_aligned(self):
+        task = create_task(phase=15, jitter=30)
+
+        trailer = self.now + datetime.timedelta(seconds=100)
+
+        self.assertEqual(trailer, task.next_run_after_success(self.now, self.now, self.now, trailer))
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+class CronScheduleTests(TestCase):
+    def test_fall_back(self):
+        schedule = parse_schedule('* * * * *', 'America/New_York')
+
+        # 01:10:05 EST, during the repeated hour.
+
+        self.assertEqual(utc(2026, 11, 1, 6, 11), schedule.next_after(utc(2026, 11, 1, 6, 10, 5)))
+
+        # 01:10:05 EDT - runs once per local time, so the repeated hour is not run again.
+
+        self.assertEqual(utc(2026, 11, 1, 5, 11), schedule.next_after(utc(2026, 11, 1, 5, 10, 5)))
+        self.assertEqual(utc(2026, 11, 1, 7, 0), schedule.next_after(utc(2026, 11, 1, 5, 59, 30)))
+
+    def test_fall_back_daily(self):
+        schedule = parse_schedule('30 1 * * *', 'America/New_York')
+
+        self.assertEqual([utc(2026, 11, 1, 5, 30), utc(2026, 11, 2, 6, 30)], schedule.upcoming(utc(2026, 11, 1, 4, 0), count=2))
+
+        # 01:00 EST, during the repeated hour - never earlier than the time provided.
+
+        self.assertEqual(utc(2026, 11, 1, 6, 30), schedule.next_after(utc(2026, 11, 1, 6, 0)))
+
+    def test_spring_forward(self):
+        schedule = parse_schedule('30 2 * * *', 'America/New_York')
+
+        # 02:30 does not exist on March 8 - the run is moved forward by the skipped hour, to 03:30 EDT.
+
+        self.assertEqual(utc(2026, 3, 8, 7, 30), schedule.next_after(utc(2026, 3, 8, 6, 0)))
+        self.assertEqual(utc(2026, 3, 9, 6, 30), schedule.next_after(utc(2026, 3, 8, 7, 30)))
+
+class InvalidScheduleTests(TestCase):
+    def test_saved_without_validation(self):
+        task = create_task(next_run=None, cron_schedule='61 * * * *')
+
+        self.assertIsNotNone(task.next_run)
+
+        with self.assertRaises(ValidationError):
+            task.full_clean()
+
+        with mock.patch.object(scheduler.logger, 'exception') as log_exception:
+            self.assertEqual([], scheduler.ready_tasks(task.queue, task.next_run))
+
+        self.assertEqual(1, log_exception.call_count)
+
+class CircuitBreakerTests(TestCase):
+    @override_settings(QUICKSILVER_CIRCUIT_BREAKER_THRESHOLD=3, QUICKSILVER_CIRCUIT_BREAKER_PROBE_SECONDS=None)
+    def test_parked_cron_task(self):
+        task = create_task(cron_schedule='*/5 * * * *')
+
+        ended = timezone.now()
+
+        for _ in range(3):
+            task.record_failure(ended)
+            task.save()
+
+        task.refresh_from_db()
+
+        self.assertEqual('open', task.circuit_breaker_state())
+        self.assertIsNone(task.next_run)
+
+        task.reset_circuit_breaker()
+        task.refresh_from_db()
+
+        self.assertEqual('closed', task.circuit_breaker_state())
+        self.assertIsNotNone(task.next_run)
+
+    @override_settings(QUICKSILVER_CIRCUIT_BREAKER_THRESHOLD=3, QUICKSILVER_CIRCUIT_BREAKER_PROBE_SECONDS=600)
+    def test_probe(self):
+        task = create_task()
+
+        ended = timezone.now()
+
+        for failures in range(1, 4):
+            task.record_failure(ended)
+
+            self.assertEqual(failures, task.consecutive_failures)
+
+        self.assertEqual(ended, task.circuit_opened)
+        self.assertEqual(ended + datetime.timedelta(seconds=600), task.next_run)
+
+        self.assertTrue(task.record_success())
+        self.assertEqual('closed', task.circuit_breaker_state())
+
+    def test_off_by_default(self):
+        task = create_task()
+
+        ended = timezone.now()
+
+        for _ in range(20):
+            task.record_failure(ended)
+
+        self.assertEqual('backing off', task.circuit_breaker_state())
+        self.assertEqual(ended + datetime.timedelta(seconds=60), task.next_run)
+
+    @override_settings(QUICKSILVER_BACKOFF_FACTOR=2.0, QUICKSILVER_MAX_BACKOFF_SECONDS=300)
+    def test_backoff(self):
+        task = create_task()
+
+        ended = timezone.now()
+
+        delays = []
+
+        for _ in range(4):
+            task.record_failure(ended)
+
+            delays.append((task.next_run - ended).total_seconds())
+
+        self.assertEqual([60.0, 120.0, 240.0, 300.0], delays)
+
+class MisfireTests(TestCase):
+    def setUp(self):
+        self.now = utc(2026, 10, 19, 12, 0)
+
+    def test_catch_up_runs(self):
+        task = create_task(misfire_policy='catch_up', misfire_grace=30, max_catch_up_runs=3, next_run=self.now - datetime.timedelta(seconds=600))
+
+        # Ten slots were missed - runs (taking no time) replay the three most recent, then resume.
+
+        next_runs = []
+
+        while task.next_run <= self.now:
+            task.next_run = task.next_run_after_success(task.next_run, self.now, self.now)
+
+            next_runs.append(task.next_run)
+
+        self.assertEqual([self.now - datetime.timedelta(seconds=120), self.now - datetime.timedelta(seconds=60), self.now, self.now + datetime.timedelta(seconds=60)], next_runs)
+
+    def test_run_once(self):
+        task = create_task(misfire_grace=30, next_run=self.now - datetime.timedelta(seconds=600))
+
+        self.assertEqual(self.now + datetime.timedelta(seconds=60), task.next_run_after_success(task.next_run, self.now, self.now))
+
+    def test_skip(self):
+        task = create_task(misfire_policy='skip', misfire_grace=30, next_run=self.now - datetime.timedelta(seconds=590))
+
+        self.assertTrue(scheduler.skip_misfire(task, self.now))
+
+        task.refresh_from_db()
+
+        # Keeps the cadence of the missed slot.
+
+        self.assertEqual(self.now + datetime.timedelta(seconds=10), task.next_run)
+
+        self.assertFalse(scheduler.skip_misfire(task, task.next_run))
+
+    def test_catch_up_generator(self):
+        task = create_task(misfire_policy='catch_up', jitter=30)
+
+        generator = mock.Mock()
+        generator.uniform.return_value = 7
+
+        now = timezone.now()
+
+        self.assertEqual(now + datetime.timedelta(seconds=67), task.next_run_after_success(now, now, now, generator=generator))
+
+        generator.uniform.assert_called_once_with(0, 30)
+
+class LightweightRecordingTests(TestCase):
+    def setUp(self):
+        self.task = create_task(recording_mode='lightweight', success_sample_rate=0.0, next_run=timezone.now() - datetime.timedelta(seconds=5))
+
+    def test_running_marker(self):
+        execution = self.task.start_execution()
+
+        self.assertIsNone(execution.pk)
+        self.assertTrue(Task.objects.get(pk=self.task.pk).is_running())
+        self.assertEqual([], scheduler.ready_tasks(self.task.queue, timezone.now()))
+
+        execution.begin()
+        execution.finish('', TaskResult())
+
+        self.assertIsNone(Task.objects.get(pk=self.task.pk).running_since)
+        self.assertEqual(0, Execution.objects.count())
+
+    @override_settings(ALLOWED_HOSTS=['example.com'], ADMINS=[('Admin', 'admin@example.com')])
+    def test_stale_run_killed(self):
+        self.task.start_execution()
+
+        task = Task.objects.get(pk=self.task.pk)
+
+        self.assertTrue(task.lightweight_execution().kill_if_stuck(timezone.now() + datetime.timedelta(seconds=1)))
+
+        self.assertEqual(['killed'], list(task.executions.values_list('status', flat=True)))
+        self.assertIsNone(Task.objects.get(pk=self.task.pk).running_since)
+
+    def test_rate_limited_full(self):
+        self.task.rate_limit_runs = 1
+        self.task.rate_limit_period = 60
+
+        self.assertIsNotNone(self.task.start_execution().pk)
+        self.assertIsNone(self.task.running_since)
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.task = create_task()
+
+        create_executions(self.task, [1.0, 2.0, 3.0])
+
+    def test_rollup_idempotent(self):
+        self.assertEqual(3, rollups.rollup_executions(batch_size=2))
+        self.assertEqual(0, rollups.rollup_executions())
+
+        hourly = ExecutionRollup.objects.filter(task=self.task, period=3600)
+
+        self.assertEqual(3, sum(hourly.values_list('count', flat=True)))
+        self.assertEqual(6.0, sum(hourly.values_list('runtime_sum', flat=True)))
+
+    def test_claimed_rows_skipped(self):
+        Execution.objects.filter(total_runtime=1.0).update(rolled_up=True)
+
+        self.assertEqual(2, rollups.rollup_executions())
+        self.assertEqual(2, sum(ExecutionRollup.objects.filter(task=self.task, period=3600).values_list('count', flat=True)))
+
+class OutputIndexTests(TestCase):
+    def test_uncompressed_by_default(self):
+        execution = Execution(task=create_task(), started=timezone.now(), status='success')
+        execution.set_output('needle ' + ('haystack ' * 1000))
+        execution.save()
+
+        self.assertIsNone(execution.output_compressed)
+        self.assertEqual([execution.pk], list(Execution.objects.filter(output__contains='needle').values_list('pk', flat=True)))
+
+    @override_settings(QUICKSILVER_OUTPUT_COMPRESSION='zlib')
+    def test_backfill_compressed(self):
+        if search.backend() is None:
+            self.skipTest('No search index available.')
+
+        task = create_task()
+
+        execution = Execution(task=task, started=timezone.now(), status='success')
+        execution.set_output('needle ' + ('haystack ' * 1000))
+        execution.save()
+
+        self.assertIsNone(execution.output)
+
+        call_command('index_execution_output')
+
+        self.assertEqual([execution.pk], list(Execution.objects.filter(pk__in=search.matching_executions('needle')).values_list('pk', flat=True)))
+
+class OutputStreamingTests(TestCase):
+    @override_settings(QUICKSILVER_OUTPUT_CHUNK_SECONDS=0.01)
+    def test_quiet_output_streamed(self):
+        chunks = []
+        streamed = threading.Event()
+
+        def on_chunk(offset, content):
+            chunks.append((offset, content,))
+
+            streamed.set()
+
+        qs_out = QuicksilverIO(on_chunk)
+        qs_out.start_streaming()
+
+        try:
+            qs_out.write('Started\n')
+
+            # Printed once, then quiet - streamed by the timer.
+
+            self.assertTrue(streamed.wait(5))
+        finally:
+            qs_out.stop_streaming()
+
+        self.assertEqual([(0, 'Started\n',)], chunks)
+
+    @override_settings(QUICKSILVER_OUTPUT_CHUNK_SIZE=4, QUICKSILVER_OUTPUT_CHUNK_SECONDS=60)
+    def test_chunk_offsets(self):
+        chunks = []
+        streamed = threading.Event()
+
+        def on_chunk(offset, content):
+            chunks.append((offset, content,))
+
+            if len(chunks) == 3:
+                streamed.set()
+
+        qs_out = QuicksilverIO(on_chunk)
+        qs_out.start_streaming()
+
+        try:
+            qs_out.write('abcdefghij')
+
+            self.assertTrue(streamed.wait(5))
+        finally:
+            qs_out.stop_streaming()
+
+        self.assertEqual([(0, 'abcd',), (4, 'efgh',), (8, 'ij',)], chunks)
+
+class DispatchTests(TestCase):
+    def test_stale_task_not_run(self):
+        task = create_task(next_run=timezone.now() - datetime.timedelta(seconds=5))
+
+        stale = Task.objects.get(pk=task.pk)
+
+        # Run by a worker thread after the cycle loaded it.
+
+        Task.objects.filter(pk=task.pk).update(next_run=timezone.now() + datetime.timedelta(seconds=60))
+
+        self.assertEqual('stale', scheduler.dispatch(stale))
+        self.assertEqual(0, Execution.objects.count())
+
+    def test_due_task_claimed(self):
+        task = create_task(next_run=timezone.now() - datetime.timedelta(seconds=5))
+
+        self.assertEqual((None, '',), scheduler.claim(task))
+
+class ThreadTimeoutTests(TestCase):
+    def run_in_thread(self, target):
+        outcome = {}
+
+        def run():
+            try:
+                with workers.ThreadTimeout(0.1, ExecutionTimeoutError):
+                    target()
+
+                outcome['result'] = 'finished'
+            except ExecutionTimeoutError:
+                outcome['result'] = 'interrupted'
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(10)
+
+        return outcome.get('result', None)
+
+    def test_loop_interrupted(self):
+        def spin():
+            end = time.time() + 5
+
+            while time.time() < end:
+                pass
+
+        self.assertEqual('interrupted', self.run_in_thread(spin))
+
+    @override_settings(QUICKSILVER_THREAD_TIMEOUT_GRACE_SECONDS=0.1)
+    def test_blocking_call_reported(self):
+        with mock.patch.object(workers.metrics, 'increment') as increment:
+            # A single blocking call - the exception is raised once it returns.
+
+            self.assertEqual('interrupted', self.run_in_thread(lambda: time.sleep(0.5)))
+
+        increment.assert_called_once_with('quicksilver_uninterrupted_timeouts_total')
+
+class ConcurrencyTests(TestCase):
+    def setUp(self):
+        self.group = ConcurrencyGroup.objects.create(name='db-heavy', max_concurrent=1)
+
+        self.first = create_task(concurrency_group=self.group, max_duration=60)
+        self.second = create_task(concurrency_group=self.group, max_duration=60)
+
+        self.now = timezone.now()
+
+    def test_acquire_release(self):
+        token = concurrency.acquire(self.first, self.now)
+
+        self.assertTrue(token)
+        self.assertIsNone(concurrency.acquire(self.second, self.now))
+
+        concurrency.release(token)
+
+        self.assertTrue(concurrency.acquire(self.second, self.now))
+
+    def test_lease_expiry(self):
+        self.assertTrue(concurrency.acquire(self.first, self.now))
+
+        # Leases last the task's maximum duration plus a minute.
+
+        self.assertIsNone(concurrency.acquire(self.second, self.now + datetime.timedelta(seconds=119)))
+
+        token = concurrency.acquire(self.second, self.now + datetime.timedelta(seconds=121))
+
+        self.assertTrue(token)
+        self.assertEqual(self.second, self.group.slots.get(holder=token).task)
+
+    def test_ungrouped(self):
+        self.assertEqual('', concurrency.acquire(create_task(), self.now))
+
+class TailOutputTests(TestCase):
+    def setUp(self):
+        self.execution = Execution.objects.create(task=create_task(), started=timezone.now(), status='ongoing')
+
+        ExecutionOutputChunk.objects.create(execution=self.execution, offset=0, content='abcd', written=timezone.now())
+        ExecutionOutputChunk.objects.create(execution=self.execution, offset=4, content='efgh', written=timezone.now())
+
+    def test_offsets(self):
+        self.assertEqual(('abcdefgh', 8, False,), self.execution.tail_output(0))
+        self.assertEqual(('cdefgh', 8, False,), self.execution.tail_output(2))
+        self.assertEqual(('gh', 8, False,), self.execution.tail_output(6))
+        self.assertEqual(('', 8, False,), self.execution.tail_output(8))
+
+    def test_ended(self):
+        self.execution.output_chunks.all().delete()
+
+        self.execution.ended = timezone.now()
+        self.execution.set_output('abcdefghij')
+        self.execution.save()
+
+        self.assertEqual(('abcdefghij', 10, True,), self.execution.tail_output(8))
+
+class TaskThreadPoolTests(TestCase):
+    def test_timeout(self):
+        def dispatch(task, queue_depth=None, cycle_duration=None): # pylint: disable=unused-argument
+            try:
+                with workers.ThreadTimeout(0.1, ExecutionTimeoutError):
+                    while True:
+                        pass
+            except ExecutionTimeoutError:
+                return 'timed out'
+
+        pool = workers.TaskThreadPool(2, dispatch, name='quicksilver-test')
+
+        task = mock.Mock(pk=1)
+
+        self.assertTrue(pool.submit(task))
+        self.assertFalse(pool.submit(task))
+
+        pool.shutdown()
+
+        self.assertEqual([(task, 'timed out',)], pool.take_outcomes())
+        self.assertEqual(2, pool.available())
+
+class AlertStateTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def evaluate(self, task):
+        evaluate_alert_states(now=self.now, send_alerts=False)
+
+        return AlertState.objects.get(task=task)
+
+    def test_overdue(self):
+        task = create_task(next_run=self.now - datetime.timedelta(hours=1))
+
+        state = self.evaluate(task)
+
+        self.assertTrue(state.overdue)
+        self.assertTrue(state.should_alert)
+
+    def test_other_task_running(self):
+        task = create_task(next_run=self.now - datetime.timedelta(hours=1))
+        other = create_task(next_run=self.now + datetime.timedelta(hours=1))
+
+        Execution.objects.create(task=other, started=self.now - datetime.timedelta(minutes=5), status='ongoing')
+
+        self.assertFalse(self.evaluate(task).overdue)
+
+    def test_postponed(self):
+        task = create_task(next_run=self.now - datetime.timedelta(hours=1), postpone_alert_until=self.now + datetime.timedelta(hours=1))
+
+        state = self.evaluate(task)
+
+        self.assertTrue(state.overdue)
+        self.assertFalse(state.should_alert)
+
+    @override_settings(QUICKSILVER_MAX_TASK_RUNTIME_SECONDS=300)
+    def test_max_runtime(self):
+        task = create_task(next_run=self.now + datetime.timedelta(minutes=1))
+
+        Execution.objects.create(task=task, started=self.now - datetime.timedelta(minutes=10), status='ongoing')
+
+        state = self.evaluate(task)
+
+        self.assertTrue(state.max_runtime_exceeded)
+        self.assertTrue(state.should_alert)
+        self.assertAlmostEqual(600.0, state.open_runtime, places=3)
+
+    def test_parked_issue(self):
+        task = create_task(next_run=None, circuit_opened=self.now, consecutive_failures=10)
+
+        state = self.evaluate(task)
+
+        self.assertFalse(state.should_alert)
+        self.assertTrue(state.issue.startswith('Parked by circuit breaker'))
+
+    def test_monitor_command(self):
+        task = create_task(next_run=self.now + datetime.timedelta(hours=1))
+
+        Execution.objects.create(task=task, started=self.now - datetime.timedelta(minutes=2), ended=self.now - datetime.timedelta(minutes=1), status='success', dispatch_lag=2.5)
+
+        call_command('quicksilver_monitor', '--once')
+
+        self.assertFalse(AlertState.objects.get(task=task).should_alert)
+        self.assertEqual(2.5, QueueState.objects.get(queue=task.queue).lag_max)
+
+class StatusViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.task = create_task(next_run=timezone.now() + datetime.timedelta(hours=1))
+
+    def get_status(self, data=None, **headers):
+        return views.quicksilver_status(RequestFactory().get('/status', data, **headers))
+
+    def test_monitor_not_running(self):
+        payload = json.loads(self.get_status().content)
+
+        self.assertEqual('error', payload['status'])
+        self.assertEqual('quicksilver_monitor', payload['issues'][0]['task'])
+
+    def test_reads_alert_state(self):
+        evaluate_alert_states(send_alerts=False)
+
+        self.assertEqual('ok', json.loads(self.get_status().content)['status'])
+
+        cache.clear()
+
+        AlertState.objects.filter(task=self.task).update(issue='Only 0 runs recorded.')
+
+        payload = json.loads(self.get_status().content)
+
+        self.assertEqual('error', payload['status'])
+        self.assertEqual([{'task': str(self.task), 'issue': 'Only 0 runs recorded.'}], payload['issues'])
+
+    def test_cached(self):
+        evaluate_alert_states(send_alerts=False)
+
+        content = self.get_status().content
+
+        AlertState.objects.filter(task=self.task).update(issue='Only 0 runs recorded.')
+
+        self.assertEqual(content, self.get_status().content)
+
+        with override_settings(QUICKSILVER_STATUS_CACHE_SECONDS=0):
+            self.assertEqual('error', json.loads(self.get_status().content)['status'])
+
+    def test_etag_ignores_queue_figures(self):
+        evaluate_alert_states(send_alerts=False)
+
+        QueueState.objects.create(queue=self.task.queue, cycle_duration=0.5)
+
+        with override_settings(QUICKSILVER_STATUS_CACHE_SECONDS=0):
+            etag = self.get_status()['ETag']
+
+            QueueState.objects.update(cycle_duration=0.75, updated=timezone.now())
+
+            self.assertEqual(304, self.get_status(HTTP_IF_NONE_MATCH=etag).status_code)
+
+            AlertState.objects.filter(task=self.task).update(issue='Only 0 runs recorded.')
+
+            self.assertEqual(200, self.get_status(HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_queue_filter(self):
+        other = create_task(queue='other', next_run=timezone.now() + datetime.timedelta(hours=1))
+
+        evaluate_alert_states(send_alerts=False)
+
+        AlertState.objects.filter(task=other).update(issue='Only 0 runs recorded.')
+
+        QueueState.objects.create(queue=self.task.queue)
+        QueueState.objects.create(queue='other')
+
+        payload = json.loads(self.get_status(data={'queue': self.task.queue}).content)
+
+        self.assertEqual('ok', payload['status'])
+        self.assertEqual([self.task.queue], list(payload['queues']))
+
+        self.assertEqual('error', json.loads(self.get_status(data={'queue': 'other'}).content)['status'])
+
+class DispatchLagTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_lag_recorded(self):
+        previous_clock = clock.set_clock(clock.VirtualClock(self.now))
+
+        try:
+            task = create_task(next_run=self.now - datetime.timedelta(seconds=30))
+
+            execution = task.start_execution(queue_depth=3, cycle_duration=0.25)
+        finally:
+            clock.set_clock(previous_clock)
+
+        execution = Execution.objects.get(pk=execution.pk)
+
+        self.assertEqual(30.0, execution.dispatch_lag)
+        self.assertEqual(task.next_run, execution.scheduled)
+        self.assertEqual(3, execution.queue_depth)
+
+    def test_queue_percentiles(self):
+        task = create_task()
+        other = create_task(queue='other')
+
+        for index, lag in enumerate([5.0, 1.0, 4.0, 2.0, 3.0]):
+            Execution.objects.create(task=task, started=self.now - datetime.timedelta(minutes=index), dispatch_lag=lag)
+
+        Execution.objects.create(task=task, started=self.now - datetime.timedelta(hours=2), dispatch_lag=100.0)
+        Execution.objects.create(task=other, started=self.now - datetime.timedelta(hours=2), dispatch_lag=100.0)
+
+        QueueState.objects.create(queue='other', lag_count=1, lag_max=100.0)
+
+        evaluate_queue_states(now=self.now)
+
+        state = QueueState.objects.get(queue=task.queue)
+
+        self.assertEqual(5, state.lag_count)
+        self.assertEqual(3.0, state.lag_p50)
+        self.assertEqual(5.0, state.lag_max)
+
+        state = QueueState.objects.get(queue='other')
+
+        self.assertEqual(0, state.lag_count)
+        self.assertIsNone(state.lag_max)
+
+class WaitingGaugeTests(TestCase):
+    def test_idle_group_dropped(self):
+        group = ConcurrencyGroup.objects.create(name='exports', max_concurrent=1)
+        task = create_task(concurrency_group=group)
+
+        runner = runners.QueueRunner(task.queue)
+
+        gauges = []
+
+        def set_gauge(name, value, labels=None):
+            if name == 'quicksilver_concurrency_waiting_tasks':
+                gauges.append((labels['group'], value,))
+
+        with mock.patch.object(metrics, 'set_gauge', set_gauge), mock.patch.object(scheduler, 'dispatch', return_value='waiting'):
+            with mock.patch.object(scheduler, 'overdue_tasks', return_value=[task]):
+                runner.cycle()
+
+            with mock.patch.object(scheduler, 'overdue_tasks', return_value=[]):
+                runner.cycle()
+                runner.cycle()
+
+        self.assertEqual([('exports', 1,), ('exports', 0,)], gauges)
+        self.assertEqual(set(), runner.waiting_groups)
+
+class SimulationTests(TestCase):
+    def setUp(self):
+        self.start = utc(2026, 10, 19, 12, 0)
+
+    def test_idle_queue(self):
+        task = create_task(repeat_interval=60, next_run=self.start)
+
+        report = simulate([task], self.start, self.start + datetime.timedelta(hours=1), {'distribution': 'constant', 'median': 1.0})[task.queue]
+
+        self.assertEqual(60, report['runs'])
+        self.assertEqual(0, report['missed_runs'])
+        self.assertAlmostEqual(1.0 / 60, report['utilisation'], places=2)
+        self.assertLess(report['dispatch_lag']['max'], 6.0)
+
+        self.assertEqual(self.start, Task.objects.get(pk=task.pk).next_run)
+
+    def test_overloaded_queue(self):
+        tasks = [create_task(repeat_interval=60, next_run=self.start) for _ in range(3)]
+
+        options = {'distribution': 'constant', 'median': 50.0}
+
+        report = simulate(tasks, self.start, self.start + datetime.timedelta(hours=1), options)[tasks[0].queue]
+
+        self.assertGreater(report['missed_runs'], 0)
+        self.assertGreater(report['utilisation'], 0.9)
+
+        options['workers'] = 3
+
+        report = simulate(tasks, self.start, self.start + datetime.timedelta(hours=1), options)[tasks[0].queue]
+
+        self.assertEqual(0, report['missed_runs'])
+        self.assertEqual(3, report['workers'])
+
+class DispatchOrderTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_aging(self):
+        urgent = create_task(priority=2, next_run=self.now - datetime.timedelta(seconds=30))
+        starved = create_task(priority=0, next_run=self.now - datetime.timedelta(seconds=300))
+        waiting = create_task(priority=0, next_run=self.now - datetime.timedelta(seconds=60))
+
+        self.assertEqual(2.5, scheduler.dispatch_score(urgent, self.now))
+        self.assertEqual(5.0, scheduler.dispatch_score(starved, self.now))
+
+        self.assertEqual([starved, urgent, waiting], scheduler.order_for_dispatch([waiting, urgent, starved], self.now))
+
+        with override_settings(QUICKSILVER_PRIORITY_AGING_SECONDS=None):
+            self.assertEqual([urgent, starved, waiting], scheduler.order_for_dispatch([waiting, urgent, starved], self.now))
+
+        with override_settings(QUICKSILVER_DISPATCH_ORDER='next_run'):
+            self.assertEqual([starved, waiting, urgent], scheduler.order_for_dispatch([waiting, urgent, starved], self.now))
+
+    @override_settings(QUICKSILVER_SHED_QUEUE_DEPTH=2, QUICKSILVER_SHED_PRIORITY_BELOW=1)
+    def test_shed_overload(self):
+        due = self.now - datetime.timedelta(seconds=5)
+
+        important = create_task(priority=1, next_run=due)
+        optional = create_task(priority=0, next_run=due)
+
+        self.assertEqual(([important, optional], []), scheduler.shed_overload([important, optional], self.now))
+
+        extra = create_task(priority=5, next_run=due)
+
+        kept, shed = scheduler.shed_overload([extra, important, optional], self.now)
+
+        self.assertEqual([extra, important], kept)
+        self.assertEqual([optional], shed)
+
+        self.assertGreater(Task.objects.get(pk=optional.pk).next_run, self.now)
+        self.assertEqual(due, Task.objects.get(pk=important.pk).next_run)
+
+class AdaptiveIntervalTests(TestCase):
+    def test_adapt_interval(self):
+        task = create_task(repeat_interval=60, min_interval=10, max_interval=240)
+
+        intervals = []
+
+        for work_remaining in (5, 5, 5, None, 0, 0, 0, 0, 0):
+            task.adapt_interval(work_remaining)
+
+            intervals.append(task.current_interval)
+
+        self.assertEqual([30.0, 15.0, 10.0, 10.0, 20.0, 40.0, 80.0, 160.0, 240.0], intervals)
+        self.assertEqual(240, task.effective_interval())
+
+        fixed = create_task(repeat_interval=60)
+        fixed.adapt_interval(5)
+
+        self.assertIsNone(fixed.current_interval)
+
+    def test_trailer(self):
+        task = create_task(repeat_interval=60, min_interval=10)
+
+        execution = task.start_execution()
+        execution.finish('Items left.\n_qs_work_remaining: 3\n', TaskResult())
+
+        task.refresh_from_db()
+
+        self.assertEqual(30.0, task.current_interval)
+        self.assertEqual(execution.ended + datetime.timedelta(seconds=30), task.next_run)
+
+    def test_result_over_trailer(self):
+        task = create_task(repeat_interval=60, min_interval=10, max_interval=600)
+
+        result = TaskResult()
+        result.work_remaining = 0
+
+        task.start_execution().finish('_qs_work_remaining: 3', result)
+
+        self.assertEqual(120.0, Task.objects.get(pk=task.pk).current_interval)
+
+class TaskStatisticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.slow = create_task(command='slow_task')
+        self.flaky = create_task(command='flaky_task')
+        self.idle = create_task(command='idle_task')
+
+        create_executions(self.slow, [10.0, 20.0, 30.0])
+        create_executions(self.flaky, [1.0])
+
+        rollups.rollup_executions()
+
+        # Not rolled up yet.
+
+        create_executions(self.slow, [40.0])
+        create_executions(self.flaky, [2.0], status='error')
+
+    def test_summaries(self):
+        summaries = rollups.task_summaries(use_cache=False)
+
+        self.assertEqual(4, summaries[self.slow.pk]['runs'])
+        self.assertEqual(25.0, summaries[self.slow.pk]['runtime_mean'])
+        self.assertEqual(40.0, summaries[self.slow.pk]['runtime_max'])
+        self.assertEqual(0.0, summaries[self.slow.pk]['failure_rate'])
+
+        self.assertEqual(0.5, summaries[self.flaky.pk]['failure_rate'])
+        self.assertEqual(1.0, summaries[self.flaky.pk]['runtime_mean'])
+
+        self.assertNotIn(self.idle.pk, summaries)
+
+    def test_view_sorted(self):
+        request = RequestFactory().get('/admin/quicksilver/task/statistics/', {'o': '-runtime_max'})
+        request.user = get_user_model()(username='admin', is_active=True, is_staff=True, is_superuser=True)
+
+        response = admin.site._registry[Task].statistics_view(request) # pylint: disable=protected-access
+
+        self.assertEqual(200, response.status_code)
+
+        content = response.content.decode('utf-8')
+
+        self.assertLess(content.index('slow_task'), content.index('flaky_task'))
+        self.assertLess(content.index('flaky_task'), content.index('idle_task'))
+
+class ExecutionFilterTests(TestCase):
+    def setUp(self):
+        self.tasks = [create_task(command='task_%d' % index, queue='busy') for index in range(3)]
+        self.other = create_task(command='other_task', queue='quiet')
+
+        for task in self.tasks + [self.other]:
+            create_executions(task, [1.0])
+
+    def changelist(self, params):
+        request = RequestFactory().get('/admin/quicksilver/execution/', params)
+        request.user = get_user_model()(username='admin', is_active=True, is_staff=True, is_superuser=True)
+
+        response = admin.site._registry[Execution].changelist_view(request) # pylint: disable=protected-access
+        response.render()
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'task_queue=busy')
+
+        changelist = response.context_data['cl']
+
+        task_filter = [spec for spec in changelist.filter_specs if isinstance(spec, TaskFilter)][0]
+
+        return changelist, [choice[0] for choice in task_filter.lookup_choices]
+
+    @override_settings(QUICKSILVER_ADMIN_TASK_FILTER_LIMIT=2)
+    def test_task_choices_limited(self):
+        changelist, choices = self.changelist({})
+
+        self.assertEqual([self.other.pk, self.tasks[0].pk], choices)
+        self.assertEqual(4, changelist.result_count)
+
+        changelist, choices = self.changelist({'task_queue': 'busy'})
+
+        self.assertEqual([self.tasks[0].pk, self.tasks[1].pk], choices)
+        self.assertEqual(3, changelist.result_count)
+
+        changelist, choices = self.changelist({'task__id__exact': self.tasks[2].pk})
+
+        self.assertEqual([self.other.pk, self.tasks[0].pk, self.tasks[2].pk], choices)
+        self.assertEqual(1, changelist.result_count)
+
+class TaskResultTests(TestCase):
+    def tearDown(self):
+        results.end()
+
+    def test_trailer_last_lines(self):
+        trailer, work_remaining = parse_output_trailer('Done.\n_qs_next_run: 2026-10-19T12:00:00+00:00\n_qs_work_remaining: 3\n')
+
+        self.assertEqual(utc(2026, 10, 19, 12, 0), trailer)
+        self.assertEqual(3.0, work_remaining)
+
+        # Only the last two lines are read.
+
+        self.assertEqual((None, None,), parse_output_trailer('_qs_next_run: 2026-10-19T12:00:00+00:00\nOne.\nTwo.'))
+
+        self.assertEqual((None, None,), parse_output_trailer('_qs_work_remaining: many'))
+
+    def test_reports_outside_run(self):
+        self.assertIsNone(results.current())
+
+        results.report_next_run(timezone.now())
+        results.report_idle()
+        results.increment_counter('rows')
+
+        self.assertIsNone(results.current())
+
+    @override_settings(QUICKSILVER_PROGRESS_SECONDS=3600)
+    def test_reports(self):
+        saved = []
+
+        result = results.begin(on_progress=saved.append)
+
+        when = timezone.now()
+
+        results.report_next_run(when)
+        results.report_work_remaining(12)
+        results.report_items_processed(5)
+        results.report_items_processed(7)
+        results.report_progress(150)
+        results.report_progress(50)
+        results.increment_counter('rows')
+        results.increment_counter('rows', 2)
+
+        self.assertIs(result, results.end())
+        self.assertIsNone(results.current())
+
+        self.assertEqual(when, result.next_run)
+        self.assertEqual(12, result.work_remaining)
+        self.assertEqual(12, result.items_processed)
+        self.assertEqual(50.0, result.progress)
+        self.assertEqual({'rows': 3}, result.counters)
+
+        # Progress is saved at most every QUICKSILVER_PROGRESS_SECONDS.
+
+        self.assertEqual([100.0], saved)
+
+        results.begin()
+        results.report_items_processed(5)
+        results.report_items_processed(7, increment=False)
+        results.report_idle()
+
+        result = results.end()
+
+        self.assertEqual(7, result.items_processed)
+        self.assertEqual(0, result.work_remaining)
+        self.assertTrue(result.reported())
+
+def lock_in_thread(queue):
+    # Locks are re-entrant within a thread - acquire as another runner would.
+
+    locks = []
+
+    thread = threading.Thread(target=lambda: locks.append(acquire_lock('run_task_queue', '_' + queue, [queue])))
+    thread.start()
+    thread.join()
+
+    return locks[0]
+
+class SupervisorTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+        self.previous_clock = clock.set_clock(clock.VirtualClock(self.now))
+
+        self.started = []
+
+        def run(runner, when_stop): # pylint: disable=unused-argument
+            self.started.append(runner.queue)
+
+            # The free queue's runner exits right away, the other runs until stopped.
+
+            if runner.queue != 'supervisor-test-free':
+                runner.stop_event.wait(5)
+
+        for name, replacement in (('start', lambda runner: None), ('run', run), ('shutdown', lambda runner: None),):
+            patcher = mock.patch.object(runners.QueueRunner, name, replacement)
+            patcher.start()
+
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clock.set_clock(self.previous_clock)
+
+    def test_locked_queue_skipped(self):
+        held = lock_in_thread('supervisor-test-locked')
+
+        self.assertIsNotNone(held)
+
+        supervisor = runners.Supervisor(['supervisor-test-locked'], 'run_task_queue')
+
+        try:
+            supervisor.start_worker('supervisor-test-locked', self.now)
+
+            self.assertEqual({}, supervisor.workers)
+
+            held.release()
+
+            supervisor.start_worker('supervisor-test-locked', self.now)
+
+            self.assertEqual(['supervisor-test-locked'], list(supervisor.workers))
+
+            # The supervisor holds the lock now.
+
+            self.assertIsNone(lock_in_thread('supervisor-test-locked'))
+        finally:
+            supervisor.stop_event.set()
+
+            for queue in list(supervisor.workers):
+                supervisor.release_worker(queue)
+
+            if held.is_locked():
+                held.release()
+
+        lock = lock_in_thread('supervisor-test-locked')
+
+        self.assertIsNotNone(lock)
+
+        lock.release()
+
+    def test_takeover(self):
+        held = lock_in_thread('supervisor-test-locked')
+
+        cycles = []
+
+        def flush():
+            # The other runner exits after the first cycle.
+
+            if not cycles and held.is_locked():
+                held.release()
+
+            cycles.append(clock.now())
+
+            # Let the free queue's runner exit before the next cycle.
+
+            worker = supervisor.workers.get('supervisor-test-free', None)
+
+            if worker is not None:
+                worker.join()
+
+        supervisor = runners.Supervisor(['supervisor-test-free', 'supervisor-test-locked'], 'run_task_queue', sleep_duration=5)
+
+        with mock.patch.object(runners.metrics, 'flush', flush), mock.patch.object(runners.rollups, 'flush'):
+            supervisor.run(self.now + datetime.timedelta(seconds=15))
+
+        # Exited runners are restarted on the next cycle, locked queues once their lock is free.
+
+        self.assertEqual(4, len(cycles))
+        self.assertEqual(3, self.started.count('supervisor-test-free'))
+        self.assertEqual(1, self.started.count('supervisor-test-locked'))
+
+        self.assertEqual({}, supervisor.workers)
+        self.assertEqual({}, supervisor.locks)
+
+        for queue in ('supervisor-test-free', 'supervisor-test-locked',):
+            lock = lock_in_thread(queue)
+
+            self.assertIsNotNone(lock)
+
+            lock.release()
@@ -7,8 +7,10 @@ if sys.version_info[0] > 2:
 else:
     from django.conf.urls import url
 
-from .views import quicksilver_status
+from .views import quicksilver_status, quicksilver_metrics, quicksilver_execution_output
 
 urlpatterns = [
     url(r'^status$', quicksilver_status, name='quicksilver_status'),
+    url(r'^metrics$', quicksilver_metrics, name='quicksilver_metrics'),
+    url(r'^execution/(?P<execution_id>\d+)/output$', quicksilver_execution_output, name='quicksilver_execution_output'),
 ]
@@ -1,60 +1,139 @@
 # pylint: disable=no-member, line-too-long
 # -*- coding: utf-8 -*-
 
+import datetime
+import hashlib
 import json
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db.models import Min
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 
-from .models import Task
+from .metrics import render_metrics
+from .models import AlertState, Execution, QueueState, Task
 
-def quicksilver_status(request): # pylint: disable=unused-argument
+def build_status_payload(queues=None):
     issues = []
 
-    now = timezone.now()
+    # Alert conditions are evaluated by the quicksilver_monitor command - only read the results here.
 
-    for overdue in Task.objects.exclude(next_run=None, repeat_interval__lte=0).filter(next_run__lte=now).order_by('next_run'): # pylint: disable=too-many-nested-blocks
-        if overdue.is_running() is False:
-            latest_execution = overdue.executions.exclude(ended=None).order_by('-ended').first()
+    states = AlertState.objects.all()
+    tasks = Task.objects.all()
 
-            if latest_execution is not None:
-                delta_seconds = (now - latest_execution.ended).total_seconds()
+    if queues:
+        states = states.filter(task__queue__in=queues)
+        tasks = tasks.filter(queue__in=queues)
 
-                runtime_outlier_threshold = overdue.runtime_outlier_threshold()
+    for state in states.exclude(issue=None).select_related('task').order_by('task__next_run'):
+        issues.append(state.status_issue())
 
-                if runtime_outlier_threshold is not None:
-                    outlier_threshold = (overdue.repeat_interval * 2) + overdue.runtime_outlier_threshold()
+    stale_seconds = getattr(settings, 'QUICKSILVER_MONITOR_STALE_SECONDS', 300)
 
-                    if delta_seconds > outlier_threshold:
-                        other_tasks = Task.objects.filter(queue=overdue.queue).exclude(pk=overdue.pk)
+    oldest_evaluation = states.aggregate(oldest=Min('evaluated'))['oldest']
 
-                        others_running = False
-
-                        for task in other_tasks:
-                            if task.is_running():
-                                others_running = True
-
-                        if others_running is False:
-                            issues.append({
-                                'task': str(overdue),
-                                'outlier_threshold': outlier_threshold,
-                                'overdue': delta_seconds
-                            })
-        elif overdue.executions.all().count() < 2:
+    if oldest_evaluation is None:
+        if tasks.count() > 0:
             issues.append({
-                'task': str(overdue),
-                'issue': 'Only %d runs recorded.' % overdue.executions.all().count()
+                'task': 'quicksilver_monitor',
+                'issue': 'No alert states recorded. Is quicksilver_monitor running?',
             })
-
-        if overdue.should_alert():
-            overdue.alert()
+    elif oldest_evaluation < timezone.now() - datetime.timedelta(seconds=stale_seconds):
+        issues.append({
+            'task': 'quicksilver_monitor',
+            'issue': 'Alert states not evaluated since %s. Is quicksilver_monitor running?' % oldest_evaluation.isoformat(),
+        })
 
     payload = {
         'issues': issues,
         'status': 'ok',
     }
 
+    payload['queues'] = {}
+
+    queue_states = QueueState.objects.all().order_by('queue')
+
+    if queues:
+        queue_states = queue_states.filter(queue__in=queues)
+
+    for queue_state in queue_states:
+        payload['queues'][queue_state.queue] = queue_state.status_summary()
+
     if len(issues) > 0: # pylint: disable=len-as-condition
         payload['status'] = 'error'
 
-    return HttpResponse(json.dumps(payload, indent=2), content_type='application/json', status=200)
+    return payload
+
+def quicksilver_status(request):
+    queues = sorted(set(request.GET.getlist('queue')))
+
+    cache_seconds = getattr(settings, 'QUICKSILVER_STATUS_CACHE_SECONDS', 15)
+
+    cache_key = 'quicksilver_status_%s' % hashlib.sha256('\n'.join(queues).encode('utf-8')).hexdigest()
+
+    cached = None
+
+    if cache_seconds > 0:
+        cached = cache.get(cache_key)
+
+    if cached is None:
+        payload = build_status_payload(queues)
+
+        # Queue figures and issue durations change on every cycle - the weak
+        # ETag only covers the status, the issues raised and the queues listed.
+
+        validator = json.dumps([payload['status'], [[issue.get('task'), issue.get('issue')] for issue in payload['issues']], sorted(payload['queues'])])
+
+        cached = (json.dumps(payload, indent=2), 'W/"%s"' % hashlib.sha256(validator.encode('utf-8')).hexdigest(),)
+
+        if cache_seconds > 0:
+            cache.set(cache_key, cached, cache_seconds)
+
+    content, etag = cached
+
+    response = HttpResponse(content, content_type='application/json', status=200)
+    response['ETag'] = etag
+
+    patch_cache_control(response, max_age=max(cache_seconds, 0))
+
+    return get_conditional_response(request, etag=etag, response=response)
+
+def quicksilver_metrics(request): # pylint: disable=unused-argument
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8', status=200)
+
+def build_output_tail(execution, offset):
+    output, next_offset, complete = execution.tail_output(offset)
+
+    return {
+        'execution': execution.pk,
+        'status': execution.status,
+        'offset': offset,
+        'next_offset': next_offset,
+        'complete': complete,
+        'output': output,
+    }
+
+@staff_member_required
+def quicksilver_execution_output(request, execution_id):
+    '''
+    Returns an execution's output from the "offset" parameter on. Poll with the
+    returned next_offset while the execution runs - once "complete" is true,
+    the response holds the whole stored output.
+    '''
+
+    execution = get_object_or_404(Execution.objects.defer('output', 'output_compressed'), pk=execution_id)
+
+    try:
+        offset = max(int(request.GET.get('offset', '0')), 0)
+    except ValueError:
+        offset = 0
+
+    response = JsonResponse(build_output_tail(execution, offset))
+
+    patch_cache_control(response, no_cache=True, no_store=True)
+
+    return response
@@ -0,0 +1,294 @@
+# pylint: disable=line-too-long
+# -*- coding: utf-8 -*-
+
+import ctypes
+import logging
+import sys
+import threading
+import time
+
+from six.moves import queue as six_queue
+
+try:
+    import contextvars
+except ImportError: # Python 2
+    contextvars = None # pylint: disable=invalid-name
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Support for running tasks on worker threads (run_task_queue --threads). Output
+# is captured per thread (and per asyncio task - see aio.py) by routing
+# sys.stdout through StdoutRouter, timeouts
+# come from a watchdog thread (signal.alarm only works in the main thread), and
+# each worker uses - and closes - its own database connection. The watchdog
+# can only interrupt Python code: a thread blocked in a call (a socket read,
+# a long database query) runs on, and is reported once it overruns its limit
+# by QUICKSILVER_THREAD_TIMEOUT_GRACE_SECONDS.
+
+class StdoutRouter(object): # pylint: disable=useless-object-inheritance
+    '''
+    Stands in for sys.stdout, sending writes to the current context's (or on
+    Python 2, thread's) capture target or to the original stream.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+        if contextvars is not None:
+            self.targets = contextvars.ContextVar('quicksilver_stdout', default=None)
+        else:
+            self.targets = threading.local()
+
+    def route(self, target):
+        if contextvars is not None:
+            self.targets.set(target)
+        else:
+            self.targets.target = target
+
+    def target(self):
+        if contextvars is not None:
+            return self.targets.get() or self.stream
+
+        return getattr(self.targets, 'target', None) or self.stream
+
+    def write(self, value):
+        return self.target().write(value)
+
+    def flush(self):
+        return self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+def install_stdout_router():
+    if isinstance(sys.stdout, StdoutRouter) is False:
+        sys.stdout = StdoutRouter(sys.stdout)
+
+def uninstall_stdout_router():
+    if isinstance(sys.stdout, StdoutRouter):
+        sys.stdout = sys.stdout.stream
+
+def redirect_stdout(target):
+    '''
+    Captures this thread's standard output in target. Returns the value to
+    pass to restore_stdout().
+    '''
+
+    if isinstance(sys.stdout, StdoutRouter):
+        previous = sys.stdout.target()
+
+        sys.stdout.route(target)
+
+        return previous
+
+    previous = sys.stdout
+
+    sys.stdout = target
+
+    return previous
+
+def restore_stdout(previous):
+    if isinstance(sys.stdout, StdoutRouter):
+        sys.stdout.route(previous)
+    else:
+        sys.stdout = previous
+
+def in_main_thread():
+    main_thread = getattr(threading, 'main_thread', None)
+
+    if main_thread is None: # Python 2
+        return isinstance(threading.current_thread(), threading._MainThread) # pylint: disable=protected-access, no-member, deprecated-method
+
+    return threading.current_thread() is main_thread() # pylint: disable=deprecated-method
+
+def raise_in_thread(thread_id, exception_class):
+    '''
+    Raises exception_class in another thread the next time it runs Python
+    code (it cannot interrupt a blocking call). Passing None cancels a pending
+    exception.
+    '''
+
+    exception = None
+
+    if exception_class is not None:
+        exception = ctypes.py_object(exception_class)
+
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), exception)
+
+class Watchdog(object): # pylint: disable=useless-object-inheritance
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadlines = {}
+        self.thread = None
+
+    def watch(self, timeout):
+        with self.condition:
+            self.deadlines[id(timeout)] = timeout
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='quicksilver-watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+
+            self.condition.notify()
+
+    def unwatch(self, timeout):
+        with self.condition:
+            self.deadlines.pop(id(timeout), None)
+
+            if timeout.fired:
+                # Expired while finishing - cancel the exception if not yet raised.
+
+                raise_in_thread(timeout.thread_id, None)
+
+    def run(self):
+        while True:
+            with self.condition:
+                now = time.time()
+
+                for key, timeout in list(self.deadlines.items()):
+                    if timeout.deadline > now:
+                        continue
+
+                    if timeout.fired is False:
+                        logger.warning('Task thread %s exceeded its %s second limit, interrupting...', timeout.thread_name, timeout.seconds)
+
+                        timeout.fired = True
+
+                        raise_in_thread(timeout.thread_id, timeout.exception_class)
+
+                        # Check back later - the exception cannot interrupt a blocking call.
+
+                        timeout.deadline = now + getattr(settings, 'QUICKSILVER_THREAD_TIMEOUT_GRACE_SECONDS', 30)
+                    else:
+                        logger.error('Task thread %s is still running %s seconds after its %s second limit and could not be interrupted (blocked in a call?).', timeout.thread_name, int(now - timeout.started - timeout.seconds), timeout.seconds)
+
+                        metrics.increment('quicksilver_uninterrupted_timeouts_total')
+
+                        del self.deadlines[key]
+
+                if self.deadlines:
+                    wait = max(min(timeout.deadline for timeout in self.deadlines.values()) - now, 0.01)
+                else:
+                    wait = None
+
+                self.condition.wait(wait)
+
+WATCHDOG = Watchdog()
+
+class ThreadTimeout(object): # pylint: disable=useless-object-inheritance
+    '''
+    Context manager raising exception_class in the current thread after the
+    provided number of seconds, for use outside of the main thread.
+    '''
+
+    def __init__(self, seconds, exception_class):
+        self.seconds = seconds
+        self.exception_class = exception_class
+        self.thread_id = None
+        self.thread_name = None
+        self.started = None
+        self.deadline = None
+        self.fired = False
+
+    def __enter__(self):
+        self.thread_id = threading.current_thread().ident # pylint: disable=deprecated-method
+        self.thread_name = threading.current_thread().name # pylint: disable=deprecated-method
+        self.started = time.time()
+        self.deadline = self.started + self.seconds
+
+        WATCHDOG.watch(self)
+
+    def __exit__(self, type, value, traceback): # pylint: disable=redefined-builtin
+        WATCHDOG.unwatch(self)
+
+class TaskThreadPool(object): # pylint: disable=useless-object-inheritance
+    '''
+    Runs tasks on a fixed number of worker threads with dispatch(task,
+    queue_depth, cycle_duration), never running the same task twice at once.
+    '''
+
+    def __init__(self, threads, dispatch, name='quicksilver'):
+        self.dispatch = dispatch
+        self.pending = six_queue.Queue()
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.outcomes = []
+
+        self.threads = []
+
+        for index in range(max(threads, 1)):
+            thread = threading.Thread(target=self.work, name='%s-%d' % (name, index))
+            thread.daemon = True
+            thread.start()
+
+            self.threads.append(thread)
+
+    def available(self):
+        with self.lock:
+            return len(self.threads) - len(self.in_flight)
+
+    def submit(self, task, queue_depth=None, cycle_duration=None):
+        with self.lock:
+            if task.pk in self.in_flight:
+                return False
+
+            self.in_flight.add(task.pk)
+
+        self.pending.put((task, queue_depth, cycle_duration,))
+
+        return True
+
+    def take_outcomes(self):
+        '''
+        Returns (task, outcome) for the tasks dispatched since the last call.
+        '''
+
+        with self.lock:
+            outcomes = self.outcomes
+
+            self.outcomes = []
+
+        return outcomes
+
+    def work(self):
+        while True:
+            item = self.pending.get()
+
+            if item is None:
+                break
+
+            task, queue_depth, cycle_duration = item
+
+            close_old_connections()
+
+            outcome = None
+
+            try:
+                outcome = self.dispatch(task, queue_depth=queue_depth, cycle_duration=cycle_duration)
+            except: # pylint: disable=bare-except
+                logger.exception('Unable to dispatch %s.', task)
+            finally:
+                close_old_connections()
+
+                with self.lock:
+                    self.in_flight.discard(task.pk)
+                    self.outcomes.append((task, outcome,))
+
+        connection.close()
+
+    def shutdown(self):
+        '''
+        Waits for running tasks to finish and stops the worker threads.
+        '''
+
+        for _ in self.threads:
+            self.pending.put(None)
+
+        for thread in self.threads:
+            thread.join()